@@ -1,5 +1,24 @@
-"""Firesquare API."""
+"""Firesquare API.
 
-from .app import app
+The app instance is built lazily on first access to `app.app`, so importing
+the package (or any of its modules) doesn't read settings or open connections.
+Use `app.main.create_app` to build an app with custom settings.
+"""
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from fastapi import FastAPI
 
 __all__ = ["app"]
+
+
+def __getattr__(name: str) -> "FastAPI":
+    """Create default app instance on first access."""
+    if name == "app":
+        from .main import create_app
+
+        instance = create_app()
+        globals()["app"] = instance
+        return instance
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,5 @@
+"""Entry point for `python -m app`."""
+
+from .cli import main
+
+main()
@@ -0,0 +1,295 @@
+"""Batched audit log of authentication events.
+
+Routers record events with `audit_log.record`, which only appends to an
+in-memory buffer, so logins and refreshes don't wait for the database. A
+writer task flushes the buffer every `flush_interval` seconds, or as soon
+as `batch_size` events are buffered, with multi-row `INSERT`s.
+
+When the buffer is full (the database is slow or down), events are spilled
+to `audit.<pid>.jsonl` in the spool directory, or dropped if there is no
+spool. Spilled events, including ones left by dead processes, are written
+as soon as a flush succeeds again. Events older than `retention` days are
+deleted day by day, see `prune`.
+"""
+
+import asyncio
+import json
+import os
+from pathlib import Path
+from threading import Lock
+from time import monotonic
+from uuid import UUID, uuid4
+
+from loguru import logger
+from sqlalchemy import func, insert, select
+from sqlalchemy.engine import Engine
+
+from .models.audit import AuditEvent, AuditKind, int_day
+from .utils import int_time
+
+PRUNE_INTERVAL = 60 * 60
+
+Row = dict[str, object]
+
+
+def prune(engine: Engine, retention: int) -> int:
+    """Delete events older than `retention` days, one day per statement.
+
+    Returns:
+        int: Number of deleted events.
+    """
+    table = AuditEvent.__table__  # type: ignore[attr-defined]
+    cutoff = int_day() - retention
+    with engine.connect() as connection:
+        oldest: int | None = connection.execute(select(func.min(table.c.day))).scalar()
+    deleted = 0
+    for day in range(oldest if oldest is not None else cutoff, cutoff):
+        with engine.begin() as connection:
+            deleted += connection.execute(table.delete().where(table.c.day == day)).rowcount
+    if deleted:
+        logger.info(f"Deleted {deleted} audit events older than {retention} days")
+    return deleted
+
+
+class AuditLog:
+    """Buffer of audit events with a background writer."""
+
+    def __init__(
+        self,
+        max_size: int = 10_000,
+        batch_size: int = 500,
+        flush_interval: float = 0.5,
+    ) -> None:
+        """Buffer of audit events with a background writer.
+
+        Examples:
+            >>> audit_log.start(get_engine(), "audit-spool", retention=90)
+            >>> audit_log.record(AuditKind.login, user=uuid, ip="127.0.0.1")
+            >>> await audit_log.stop()
+
+        Args:
+            max_size: Maximum number of buffered events, the rest is spilled.
+            batch_size: Maximum number of events per `INSERT`.
+            flush_interval: Seconds between flushes.
+        """
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.buffer: list[Row] = []
+        self.lock = Lock()
+        self.engine: Engine | None = None
+        self.spool: Path | None = None
+        self.retention = 0
+        self.dropped = 0
+        self.wakeup: asyncio.Event | None = None
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.task: asyncio.Task[None] | None = None
+
+    def record(
+        self,
+        kind: AuditKind,
+        user: UUID | None = None,
+        nickname: str | None = None,
+        ip: str | None = None,
+        detail: str | None = None,
+    ) -> None:
+        """Record event, never blocks on database, safe to call from any thread."""
+        row: Row = {
+            "day": int_day(),
+            "id": uuid4(),
+            "created_at": int_time(),
+            "kind": kind.value,
+            "user": user,
+            "nickname": nickname,
+            "ip": ip,
+            "detail": detail,
+        }
+        with self.lock:
+            if len(self.buffer) < self.max_size:
+                self.buffer.append(row)
+                size = len(self.buffer)
+            else:
+                size = 0
+        if size == 0:
+            self._spill([row])
+        elif size >= self.batch_size:
+            self._wake()
+
+    def _wake(self) -> None:
+        if self.loop is None or self.wakeup is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            self.wakeup.set()
+        else:
+            self.loop.call_soon_threadsafe(self.wakeup.set)
+
+    def _spill_path(self) -> Path | None:
+        return None if self.spool is None else self.spool / f"audit.{os.getpid()}.jsonl"
+
+    def _spill(self, rows: list[Row]) -> None:
+        path = self._spill_path()
+        if path is None:
+            self.dropped += len(rows)
+            return
+        lines = "".join(json.dumps(row, default=str) + "\n" for row in rows)
+        with self.lock, path.open("a") as file:
+            file.write(lines)
+
+    def _insert(self, rows: list[Row]) -> None:
+        assert self.engine is not None
+        table = AuditEvent.__table__  # type: ignore[attr-defined]
+        with self.engine.begin() as connection:
+            for start in range(0, len(rows), self.batch_size):
+                end = start + self.batch_size
+                connection.execute(insert(table).values(rows[start:end]))
+
+    def _replay(self, path: Path) -> int:
+        """Insert spilled events from file and remove it, the file is kept on database errors.
+
+        Lines which can't be parsed (e.g. torn by a crash while spilling) are
+        moved to `corrupt.*.jsonl` in the spool directory.
+        """
+        assert self.spool is not None
+        rows: list[Row] = []
+        corrupt: list[str] = []
+        for line in path.read_text().splitlines():
+            try:
+                row = json.loads(line)
+                row["id"] = UUID(row["id"])
+                row["user"] = None if row["user"] is None else UUID(row["user"])
+            except (ValueError, KeyError, TypeError):
+                corrupt.append(line + "\n")
+                continue
+            rows.append(row)
+        if rows:
+            self._insert(rows)
+        if corrupt:
+            logger.warning(f"Skipped {len(corrupt)} corrupt spilled audit events in {path.name}")
+            (self.spool / f"corrupt.{os.getpid()}.{uuid4().hex}.jsonl").write_text("".join(corrupt))
+        path.unlink()
+        return len(rows)
+
+    def _claim_spool(self) -> list[Path]:
+        """Take over spilled events of this and dead processes."""
+        assert self.spool is not None
+        claimed = []
+        for path in self.spool.glob("audit.*"):
+            try:
+                pid = int(path.name.split(".")[1])
+            except (IndexError, ValueError):
+                continue
+            if pid != os.getpid():
+                try:
+                    os.kill(pid, 0)
+                    continue
+                except ProcessLookupError:
+                    pass
+                except PermissionError:
+                    continue
+            target = self.spool / f"audit.{os.getpid()}.{uuid4().hex}.replay"
+            try:
+                # Under lock, so no event is appended to the file being moved
+                with self.lock:
+                    os.replace(path, target)
+            except FileNotFoundError:
+                # Claimed by another worker
+                continue
+            claimed.append(target)
+        return claimed
+
+    def replay_spool(self) -> int:
+        """Write spilled events.
+
+        Returns:
+            int: Number of written events.
+        """
+        if self.spool is None:
+            return 0
+        replayed = 0
+        # One failing file doesn't block the others, it is retried on the next replay
+        for path in self._claim_spool():
+            try:
+                replayed += self._replay(path)
+            except Exception:
+                logger.exception(f"Cannot write spilled audit events from {path.name}")
+        if replayed:
+            logger.info(f"Wrote {replayed} spilled audit events")
+        return replayed
+
+    def flush(self) -> int:
+        """Write buffered events, they are spilled if the database fails.
+
+        Returns:
+            int: Number of written events.
+        """
+        with self.lock:
+            rows, self.buffer = self.buffer, []
+        if not rows:
+            return 0
+        try:
+            self._insert(rows)
+        except Exception:
+            self._spill(rows)
+            raise
+        return len(rows)
+
+    def start(self, engine: Engine, spool_dir: str | None = None, retention: int = 0) -> None:
+        """Start writer task.
+
+        Args:
+            engine: Database engine.
+            spool_dir: Directory for spilled events, they are dropped if `None`.
+            retention: Days to keep events, `0` to keep forever.
+        """
+        self.engine = engine
+        self.spool = None if spool_dir is None else Path(spool_dir)
+        if self.spool is not None:
+            self.spool.mkdir(parents=True, exist_ok=True)
+        self.retention = retention
+        self.loop = asyncio.get_running_loop()
+        self.wakeup = asyncio.Event()
+        self.task = asyncio.create_task(self._writer())
+
+    async def stop(self) -> None:
+        """Stop writer task and flush buffered events."""
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        if self.engine is not None:
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception:
+                logger.exception("Cannot write audit events")
+        self.loop = self.wakeup = None
+
+    async def _writer(self) -> None:
+        assert self.wakeup is not None and self.engine is not None
+        pruned_at: float | None = None
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            if self.dropped:
+                logger.warning(f"Dropped {self.dropped} audit events, buffer is full")
+                self.dropped = 0
+            try:
+                await asyncio.to_thread(self.flush)
+                # Database is fine, catch up on spilled events
+                await asyncio.to_thread(self.replay_spool)
+                if self.retention and (
+                    pruned_at is None or monotonic() - pruned_at > PRUNE_INTERVAL
+                ):
+                    pruned_at = monotonic()
+                    await asyncio.to_thread(prune, self.engine, self.retention)
+            except Exception:
+                logger.exception("Audit writer failed")
+
+
+audit_log = AuditLog()
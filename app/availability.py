@@ -0,0 +1,206 @@
+"""Per-worker index of taken nicknames and emails.
+
+A Bloom filter of all nicknames and emails answers "is it taken?" without
+database: if the filter doesn't contain a name, the name is definitely
+free, otherwise (taken or a false positive) it is looked up by index.
+
+The filter is built in background on startup by streaming the `user` table,
+until then every check falls through to database. Names of
+users created by this worker are added at once, names of users created by
+other workers come from the change feed (see `app.changefeed`). A miss is
+only definite while the change feed runs since before the filter was built,
+otherwise a name taken through another worker may be missing, so misses fall
+through to database too. Bloom filters can't remove items, so the filter is
+rebuilt every `NAME_INDEX_REFRESH` seconds, which also drops users deleted by
+cleanup, and at once when the change feed (re)connects.
+"""
+
+import asyncio
+import math
+from hashlib import blake2b
+from threading import Lock
+from time import monotonic
+
+from loguru import logger
+from sqlalchemy import func, select
+from sqlalchemy.engine import Engine
+
+from .models.user import User
+
+STREAM_BATCH = 10_000
+MIN_CAPACITY = 1024
+
+
+class BloomFilter:
+    """Bloom filter of strings."""
+
+    def __init__(self, capacity: int, error_rate: float = 0.01) -> None:
+        """Bloom filter of strings.
+
+        Args:
+            capacity: Expected number of items, more items increase error rate.
+            error_rate: False positive probability at `capacity` items.
+        """
+        self.size = max(64, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / max(capacity, 1) * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str) -> list[int]:
+        # Double hashing, positions are h1 + i * h2
+        digest = blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item: str) -> None:
+        """Add item."""
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        """Check item, `True` may be a false positive."""
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item)
+        )
+
+
+def nickname_key(nickname: str) -> str:
+    return f"n:{nickname}"
+
+
+def email_key(email: str) -> str:
+    return f"e:{email}"
+
+
+class NameIndex:
+    """Bloom filter of taken nicknames and emails, rebuilt periodically."""
+
+    def __init__(self, error_rate: float = 0.01) -> None:
+        """Bloom filter of taken nicknames and emails, rebuilt periodically.
+
+        Args:
+            error_rate: False positive probability, holds until the number of
+                users doubles since the last build.
+        """
+        self.error_rate = error_rate
+        self.filter: BloomFilter | None = None
+        self.lock = Lock()
+        # Names added during build, applied to the new filter
+        self.pending: list[tuple[str, str]] | None = None
+        self.built_at: float | None = None
+        # When the current filter's snapshot of `user` table was taken
+        self.snapshot_at: float | None = None
+        # Since when change feed delivers every new name, `None` if it doesn't run
+        self.feed_since: float | None = None
+
+    @property
+    def ready(self) -> bool:
+        """Whether the filter was built."""
+        return self.filter is not None
+
+    @property
+    def complete(self) -> bool:
+        """Whether the filter has every taken name, so its misses are definite."""
+        feed_since, snapshot_at = self.feed_since, self.snapshot_at
+        return feed_since is not None and snapshot_at is not None and feed_since <= snapshot_at
+
+    @property
+    def needs_rebuild(self) -> bool:
+        """Whether change feed runs, but the filter was built before it started."""
+        return self.ready and self.feed_since is not None and not self.complete
+
+    def feed_started(self) -> None:
+        """Mark that change feed delivers every name from now on."""
+        if self.feed_since is None:
+            self.feed_since = monotonic()
+
+    def feed_stopped(self) -> None:
+        """Mark that change feed stopped, names may be missed until it restarts."""
+        self.feed_since = None
+
+    def reset(self) -> None:
+        """Drop filter, every check falls through to database until the next build."""
+        with self.lock:
+            self.filter = None
+            self.built_at = None
+            self.snapshot_at = None
+
+    def add(self, nickname: str, email: str) -> None:
+        """Add names of a new or changed user."""
+        with self.lock:
+            if self.filter is not None:
+                self.filter.add(nickname_key(nickname))
+                self.filter.add(email_key(email))
+            if self.pending is not None:
+                self.pending.append((nickname, email))
+
+    def build(self, engine: Engine) -> int:
+        """Build filter from `user` table, replaces the current one when done.
+
+        Returns:
+            int: Number of users.
+        """
+        table = User.__table__  # type: ignore[attr-defined]
+        with self.lock:
+            self.pending = []
+        snapshot_at = monotonic()
+        users = 0
+        try:
+            with engine.connect() as connection:
+                count = connection.execute(select(func.count()).select_from(table)).scalar_one()
+                # Two keys per user, room for twice as many users before rebuild
+                new = BloomFilter(max(4 * count, MIN_CAPACITY), self.error_rate)
+                result = connection.execution_options(stream_results=True).execute(
+                    select(table.c.nickname, table.c.email)
+                )
+                for partition in result.partitions(STREAM_BATCH):
+                    for nickname, email in partition:
+                        new.add(nickname_key(nickname))
+                        new.add(email_key(email))
+                    users += len(partition)
+        except BaseException:
+            with self.lock:
+                self.pending = None
+            raise
+        with self.lock:
+            for nickname, email in self.pending or []:
+                new.add(nickname_key(nickname))
+                new.add(email_key(email))
+            self.filter, self.pending = new, None
+            self.built_at = monotonic()
+            self.snapshot_at = snapshot_at
+        logger.info(f"Name index built, {users} users, {len(new.bits)} bytes")
+        return users
+
+    def may_contain_nickname(self, nickname: str) -> bool:
+        """Check nickname, `True` if the filter is not built yet or not complete."""
+        return self._check(nickname_key(nickname))
+
+    def may_contain_email(self, email: str) -> bool:
+        """Check email, `True` if the filter is not built yet or not complete."""
+        return self._check(email_key(email))
+
+    def _check(self, key: str) -> bool:
+        current = self.filter
+        return current is None or not self.complete or key in current
+
+
+async def refresh_loop(
+    index: NameIndex, engine: Engine, interval: float, poll_interval: float = 1
+) -> None:
+    """Build index, then rebuild it every `interval` seconds or once change feed starts."""
+    while True:
+        try:
+            await asyncio.to_thread(index.build, engine)
+        except Exception:
+            logger.exception("Name index build failed")
+            await asyncio.sleep(interval)
+            continue
+        deadline = monotonic() + interval
+        while monotonic() < deadline and not index.needs_rebuild:
+            await asyncio.sleep(poll_interval)
+
+
+name_index = NameIndex()
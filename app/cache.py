@@ -0,0 +1,130 @@
+"""Per-worker cache of frequently read user columns.
+
+The cache is only trusted while a change feed (see `app.changefeed`) keeps it
+fresh: the feed applies every change of the `user` table and marks the cache
+as fresh each time the database reports that all changes up to now were sent.
+If the feed lags or disconnects, lookups go straight to the database.
+"""
+
+import asyncio
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from uuid import UUID
+
+from sqlmodel import Session
+
+from . import queries
+from .database import get_engine_session
+from .models.user import UserProjection
+from .utils import SingleFlight
+
+PROJECTION_FIELDS = list(UserProjection._fields)
+
+
+class UserCache:
+    """LRU cache of `UserProjection` by user uuid."""
+
+    def __init__(self, max_size: int = 100_000, max_lag: float = 2.0) -> None:
+        """LRU cache of `UserProjection` by user uuid.
+
+        Args:
+            max_size: Maximum number of cached users.
+            max_lag: Cache is bypassed if the change feed didn't confirm
+                freshness for this many seconds.
+        """
+        self.max_size = max_size
+        self.max_lag = max_lag
+        self.users: OrderedDict[UUID, UserProjection] = OrderedDict()
+        self.lock = Lock()
+        # Incremented on every change, so a row loaded before a change is not stored
+        self.version = 0
+        self.resolved_at: float | None = None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def fresh(self) -> bool:
+        """Whether the change feed confirmed freshness recently."""
+        return self.resolved_at is not None and monotonic() - self.resolved_at <= self.max_lag
+
+    @staticmethod
+    def load(db: Session, uuid: UUID) -> UserProjection | None:
+        """Read user projection from database."""
+        return queries.load_user(db.connection(), uuid)
+
+    def get(self, db: Session, uuid: UUID) -> UserProjection | None:
+        """Get user projection, from cache if it is fresh.
+
+        Examples:
+            >>> user_cache.get(db, UUID("5f0c6c3e-0d3e-4bd1-8f5e-1c0b8a6f3b1a"))
+            UserProjection(uuid=UUID(...), nickname="cofob", ...)
+
+        Args:
+            db: Database session used on cache miss.
+            uuid: User uuid.
+
+        Returns:
+            UserProjection: If user exists, else `None`.
+        """
+        if not self.fresh:
+            return self.load(db, uuid)
+        with self.lock:
+            user = self.users.get(uuid)
+            if user is not None:
+                self.users.move_to_end(uuid)
+                self.hits += 1
+                return user
+            self.misses += 1
+            version = self.version
+        user = self.load(db, uuid)
+        if user is not None:
+            with self.lock:
+                if version == self.version:
+                    self.users[uuid] = user
+                    if len(self.users) > self.max_size:
+                        self.users.popitem(last=False)
+        return user
+
+    def apply_change(self, uuid: UUID, user: UserProjection | None) -> None:
+        """Apply change from feed.
+
+        Args:
+            uuid: Changed user uuid.
+            user: New user columns, `None` if user was deleted.
+        """
+        with self.lock:
+            self.version += 1
+            if user is None:
+                self.users.pop(uuid, None)
+            elif uuid in self.users:
+                self.users[uuid] = user
+
+    def mark_resolved(self) -> None:
+        """Mark that all changes up to now were applied."""
+        self.resolved_at = monotonic()
+
+    def reset(self) -> None:
+        """Drop all cached users and stop trusting cache until next `mark_resolved`."""
+        with self.lock:
+            self.version += 1
+            self.resolved_at = None
+            self.users.clear()
+
+
+user_cache = UserCache()
+user_lookups: SingleFlight[UUID, UserProjection | None] = SingleFlight()
+
+
+async def get_user(uuid: UUID) -> UserProjection | None:
+    """Get user projection in a thread, concurrent lookups of the same user share one query.
+
+    Returns:
+        UserProjection: If user exists, else `None`.
+    """
+
+    def load() -> UserProjection | None:
+        with get_engine_session() as db:
+            return user_cache.get(db, uuid)
+
+    return await user_lookups.do(uuid, lambda: asyncio.to_thread(load))
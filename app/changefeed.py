@@ -0,0 +1,164 @@
+"""CockroachDB changefeed keeping `UserCache` fresh.
+
+A core (sinkless) changefeed on the `user` table is streamed over a dedicated
+connection with `COPY (EXPERIMENTAL CHANGEFEED FOR ...) TO STDOUT`. Every changed
+row is applied to the cache, and every `resolved` message (sent each second)
+marks the cache as fresh. Requires `kv.rangefeed.enabled` cluster setting.
+"""
+
+import json
+from threading import Event, Thread
+from typing import TYPE_CHECKING
+from uuid import UUID
+
+from loguru import logger
+from sqlalchemy.engine import Engine
+
+from .availability import NameIndex
+from .cache import PROJECTION_FIELDS, UserCache
+from .models.user import UserProjection
+
+if TYPE_CHECKING:
+    from psycopg2.extensions import connection as PGConnection
+
+CHANGEFEED_QUERY = (
+    "COPY (EXPERIMENTAL CHANGEFEED FOR TABLE \"user\" WITH resolved = '{interval}s', "
+    "no_initial_scan) TO STDOUT"
+)
+
+COPY_ESCAPES = {"\\": "\\", "t": "\t", "n": "\n", "r": "\r", "b": "\b", "f": "\f", "v": "\v"}
+
+
+def unescape_copy_field(field: str) -> str | None:
+    """Decode field of `COPY` text format.
+
+    Returns:
+        str: Field value, `None` for SQL NULL.
+    """
+    if field == "\\N":
+        return None
+    if "\\" not in field:
+        return field
+    result = []
+    chars = iter(field)
+    for char in chars:
+        if char == "\\":
+            escaped = next(chars, "")
+            result.append(COPY_ESCAPES.get(escaped, escaped))
+        else:
+            result.append(char)
+    return "".join(result)
+
+
+class ChangefeedSink:
+    """File-like object receiving `COPY` output and applying it to cache."""
+
+    def __init__(self, cache: UserCache, names: NameIndex | None = None) -> None:
+        """File-like object receiving `COPY` output and applying it to cache.
+
+        Args:
+            cache: Cache to update.
+            names: Index of taken names to add new names to.
+        """
+        self.cache = cache
+        self.names = names
+        self.buffer = ""
+
+    def write(self, data: str | bytes) -> None:
+        """Receive chunk of `COPY` output, chunks are not aligned to lines."""
+        if isinstance(data, bytes):
+            data = data.decode()
+        *lines, self.buffer = (self.buffer + data).split("\n")
+        for line in lines:
+            self.apply_line(line)
+
+    def apply_line(self, line: str) -> None:
+        """Apply one changefeed row: `table`, `key` and `value` separated by tabs."""
+        table, key, value = (unescape_copy_field(field) for field in line.split("\t"))
+        if value is None:
+            return
+        message = json.loads(value)
+        if table is None:
+            if "resolved" in message:
+                self.cache.mark_resolved()
+                if self.names is not None:
+                    self.names.feed_started()
+            return
+        assert key is not None
+        uuid = UUID(json.loads(key)[0])
+        row = message.get("after")
+        user = None
+        if row is not None:
+            user = UserProjection(**{name: row[name] for name in PROJECTION_FIELDS})
+            user = user._replace(uuid=uuid)
+            if self.names is not None:
+                self.names.add(user.nickname, user.email)
+        self.cache.apply_change(uuid, user)
+
+
+class UserChangefeed(Thread):
+    """Background thread streaming `user` table changes to cache."""
+
+    def __init__(
+        self,
+        engine: Engine,
+        cache: UserCache,
+        resolved_interval: float = 1,
+        names: NameIndex | None = None,
+    ) -> None:
+        """Background thread streaming `user` table changes to cache.
+
+        Examples:
+            >>> feed = UserChangefeed(get_engine(), user_cache)
+            >>> feed.start()
+            >>> feed.stop()
+
+        Args:
+            engine: CockroachDB engine.
+            cache: Cache to update.
+            resolved_interval: How often the database confirms that all changes were sent.
+            names: Index of taken names to add new names to.
+        """
+        super().__init__(name="user-changefeed", daemon=True)
+        self.engine = engine
+        self.cache = cache
+        self.resolved_interval = resolved_interval
+        self.names = names
+        self.stopped = Event()
+        self.connection: "PGConnection | None" = None
+
+    def run(self) -> None:
+        """Stream changes, reconnecting with backoff on errors."""
+        backoff = 1.0
+        query = CHANGEFEED_QUERY.format(interval=self.resolved_interval)
+        while not self.stopped.is_set():
+            self.cache.reset()
+            was_fresh = False
+            try:
+                # Feed holds the connection forever, so it is opened outside of the pool
+                cargs, cparams = self.engine.dialect.create_connect_args(self.engine.url)
+                connection: "PGConnection" = self.engine.dialect.connect(*cargs, **cparams)
+                self.connection = connection
+                with connection.cursor() as cursor:
+                    cursor.copy_expert(query, ChangefeedSink(self.cache, self.names))
+            except Exception:
+                if not self.stopped.is_set():
+                    logger.exception("User changefeed failed, cache disabled")
+            finally:
+                was_fresh = self.cache.resolved_at is not None
+                self.cache.reset()
+                if self.names is not None:
+                    self.names.feed_stopped()
+                if self.connection is not None:
+                    self.connection.close()
+                    self.connection = None
+            backoff = 1.0 if was_fresh else min(backoff * 2, 30)
+            self.stopped.wait(backoff)
+
+    def stop(self) -> None:
+        """Cancel the feed query and wait for the thread to finish."""
+        self.stopped.set()
+        connection = self.connection
+        if connection is not None:
+            connection.cancel()
+        self.join(timeout=5)
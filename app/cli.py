@@ -0,0 +1,161 @@
+"""Command line interface, available as `python -m app`."""
+
+from argparse import ArgumentParser, Namespace
+
+
+def parse_bool(value: str) -> bool:
+    """Parse boolean command line argument."""
+    return value.lower() in ("1", "true", "yes")
+
+
+def serve(args: Namespace) -> None:
+    """Run production server."""
+    from .server import Supervisor, preload
+
+    Supervisor(
+        preload(),
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        reuse_port=args.reuse_port,
+        max_requests=args.max_requests,
+        max_requests_jitter=args.max_requests_jitter,
+        graceful_timeout=args.graceful_timeout,
+    ).run()
+
+
+def import_users(args: Namespace) -> None:
+    """Import users from CSV or JSONL file."""
+    from .importer import import_users
+
+    stats = import_users(
+        args.file, batch_size=args.batch_size, workers=args.workers, checkpoint=args.checkpoint
+    )
+    print(
+        f"Inserted {stats.inserted}, skipped {stats.skipped} existing, "
+        f"{stats.invalid} invalid records."
+    )
+
+
+def export_users(args: Namespace) -> None:
+    """Export users to CSV or NDJSON file."""
+    import sys
+
+    from .database import get_engine
+    from .exporter import iter_csv, iter_ndjson, iter_users, parse_cursor
+
+    users = iter_users(
+        get_engine(),
+        verifed=args.verifed,
+        disabled=args.disabled,
+        after=parse_cursor(args.after) if args.after else None,
+    )
+    lines = iter_csv(users) if args.format == "csv" else iter_ndjson(users)
+    output = open(args.output, "w", newline="") if args.output else sys.stdout
+    with output:
+        output.writelines(lines)
+
+
+def reconcile_pins(args: Namespace) -> None:
+    """Reconcile pin table with IPFS cluster."""
+    import asyncio
+
+    from .database import get_engine
+    from .ipfs import IPFSClient
+    from .pins import reconcile
+    from .settings import get_settings
+
+    async def run() -> None:
+        settings = get_settings()
+        async with IPFSClient(
+            settings.ipfs_url, settings.ipfs_auth, hedge_percentile=settings.ipfs_hedge_percentile
+        ) as ipfs:
+            while True:
+                await reconcile(ipfs, get_engine(), batch_size=args.batch_size, grace=args.grace)
+                if not args.interval:
+                    return
+                await asyncio.sleep(args.interval)
+
+    asyncio.run(run())
+
+
+def get_parser() -> ArgumentParser:
+    """Build argument parser with all commands.
+
+    Returns:
+        ArgumentParser: Parser, parsed namespace has `func` to call.
+    """
+    from .server import default_workers
+
+    parser = ArgumentParser(prog="python -m app", description="Firesquare API management.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    parser_serve = commands.add_parser("serve", help="run production server")
+    parser_serve.add_argument("--host", default="127.0.0.1", help="host to listen")
+    parser_serve.add_argument("--port", type=int, default=8000, help="port to listen")
+    parser_serve.add_argument(
+        "--workers", type=int, default=default_workers(), help="number of worker processes"
+    )
+    parser_serve.add_argument(
+        "--reuse-port", action="store_true", help="bind a SO_REUSEPORT socket in every worker"
+    )
+    parser_serve.add_argument(
+        "--max-requests", type=int, default=None, help="restart worker after this many requests"
+    )
+    parser_serve.add_argument(
+        "--max-requests-jitter", type=int, default=0, help="random addition to --max-requests"
+    )
+    parser_serve.add_argument(
+        "--graceful-timeout", type=float, default=30, help="seconds to wait for stopping worker"
+    )
+    parser_serve.set_defaults(func=serve)
+
+    parser_import = commands.add_parser("import-users", help="import users from CSV or JSONL")
+    parser_import.add_argument("file", help="path to .csv or .jsonl file")
+    parser_import.add_argument(
+        "--batch-size",
+        type=int,
+        default=1000,
+        help="rows per INSERT, capped by the database bind parameter limit",
+    )
+    parser_import.add_argument(
+        "--workers", type=int, default=None, help="processes for validation and hashing"
+    )
+    parser_import.add_argument(
+        "--checkpoint", default=None, help="checkpoint file to resume interrupted import"
+    )
+    parser_import.set_defaults(func=import_users)
+
+    parser_export = commands.add_parser("export-users", help="export users to CSV or NDJSON")
+    parser_export.add_argument("--format", choices=["ndjson", "csv"], default="ndjson")
+    parser_export.add_argument("--output", default=None, help="output file, stdout by default")
+    parser_export.add_argument("--verifed", type=parse_bool, default=None, help="true or false")
+    parser_export.add_argument("--disabled", type=parse_bool, default=None, help="true or false")
+    parser_export.add_argument("--after", default=None, help="continue after created_at:uuid")
+    parser_export.set_defaults(func=export_users)
+
+    parser_reconcile = commands.add_parser(
+        "reconcile-pins", help="sync pin table with IPFS cluster"
+    )
+    parser_reconcile.add_argument(
+        "--batch-size", type=int, default=1000, help="CIDs compared with table at once"
+    )
+    parser_reconcile.add_argument(
+        "--grace", type=int, default=3600, help="ignore pins younger than this many seconds"
+    )
+    parser_reconcile.add_argument(
+        "--interval", type=float, default=0, help="repeat every N seconds, run once if 0"
+    )
+    parser_reconcile.set_defaults(func=reconcile_pins)
+
+    return parser
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Parse arguments and run command.
+
+    Args:
+        argv: Command line arguments, `sys.argv` by default.
+    """
+    args = get_parser().parse_args(argv)
+    args.func(args)
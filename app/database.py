@@ -1,14 +1,38 @@
 """Module containing database setup."""
 
-from os import environ
-
 from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
 from sqlmodel import Session
 
-# cockroachdb://root@localhost:26257/defaultdb?sslmode=disable
-engine = create_engine(environ["DB_URL"])
+from .settings import get_settings
+
+_engine: Engine | None = None
+
+
+def get_engine() -> Engine:
+    """Get database engine, creating it on the first call.
+
+    The engine is created lazily so importing the app never opens a
+    connection pool, and every worker process gets its own pool.
+
+    Returns:
+        Engine: SQLAlchemy engine.
+    """
+    global _engine
+    if _engine is None:
+        # cockroachdb://root@localhost:26257/defaultdb?sslmode=disable
+        _engine = create_engine(get_settings().db_url)
+    return _engine
+
+
+def dispose_engine() -> None:
+    """Close all pooled connections and forget the engine."""
+    global _engine
+    if _engine is not None:
+        _engine.dispose()
+        _engine = None
 
 
 def get_engine_session() -> Session:
     """Get `sqlmodel.Session` instance with current engine."""
-    return Session(engine)
+    return Session(get_engine())
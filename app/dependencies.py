@@ -1,16 +1,26 @@
 """Here are the dependencies that are called via FastAPI Depend."""
 
-from os import environ
-from typing import AsyncGenerator, Generator
+import hmac
+from typing import Callable, Coroutine, Generator
+from uuid import UUID
 
-from fastapi import Depends
+from fastapi import Depends, Header, Request, status
 from sqlmodel import Session
 
+from app.exceptions import AccessDeniedException, JWTValidationError
 from app.models import User, UserToken
+from app.models.token import ParsedJWTType, TokenTypes
+from app.models.user import UserProjection
 
+from .cache import user_cache
 from .database import get_engine_session
 from .ipfs import IPFSClient
+from .mail import MailQueue
+from .revocations import RevocationFeed
+from .scopes import Scope, ScopeMask
 from .security import oauth2_scheme
+from .settings import get_settings
+from .uploads import UploadQueue
 
 
 def get_session() -> Generator[Session, None, None]:
@@ -23,19 +33,42 @@ def get_session() -> Generator[Session, None, None]:
         yield session
 
 
-IPFS_AUTH = None
-if environ.get("IPFS_USERNAME") is not None:
-    IPFS_AUTH = (environ["IPFS_USERNAME"], environ["IPFS_PASSWORD"])
+async def get_ipfs(request: Request) -> IPFSClient:
+    """Get IPFS session shared by all requests of this worker.
 
-
-async def get_ipfs() -> AsyncGenerator[IPFSClient, None]:
-    """A generator that returns IPFS session.
+    The session is opened in the app startup hook.
 
     Returns:
         IPFSClient: Prepared IPFS session.
     """
-    async with IPFSClient(environ["IPFS_URL"], IPFS_AUTH) as client:
-        yield client
+    client: IPFSClient = request.app.state.ipfs
+    return client
+
+
+async def get_revocations(request: Request) -> RevocationFeed:
+    """Get revocation feed of this worker."""
+    feed: RevocationFeed = request.app.state.revocations
+    return feed
+
+
+async def get_mail(request: Request) -> MailQueue | None:
+    """Get outbound mail queue of this worker.
+
+    Returns:
+        MailQueue: Mail queue, `None` if SMTP is not configured.
+    """
+    queue: MailQueue | None = request.app.state.mail
+    return queue
+
+
+async def get_uploads(request: Request) -> UploadQueue | None:
+    """Get background upload queue of this worker.
+
+    Returns:
+        UploadQueue: Upload queue, `None` if `UPLOAD_SPOOL` is not configured.
+    """
+    queue: UploadQueue | None = request.app.state.uploads
+    return queue
 
 
 async def get_current_user(
@@ -50,6 +83,79 @@ async def get_current_user(
     return db.query(User).filter(User.uuid == usertoken.user).first()  # type: ignore
 
 
-async def authorized_only(token: str = Depends(oauth2_scheme)) -> None:
+async def get_current_user_row(
+    db: Session = Depends(get_session), token: str = Depends(oauth2_scheme)
+) -> UserProjection | None:
+    """Get hot columns of current user without loading the model, see `app.queries`.
+
+    Returns:
+        UserProjection: Current user columns, `None` if user is deleted.
+    """
+    usertoken = UserToken.from_str_access_token(token)
+    return user_cache.get(db, usertoken.user)
+
+
+async def get_access_claims(token: str = Depends(oauth2_scheme)) -> ParsedJWTType:
+    """Decode and verify access token.
+
+    FastAPI caches dependencies within a request, so the token is decoded once
+    however many dependencies need it.
+
+    Returns:
+        dict: Access token claims.
+    """
+    parsed = UserToken.parse(token)
+    UserToken.verify(parsed, TokenTypes.AccessToken, Session())
+    return parsed
+
+
+async def get_current_user_uuid(claims: ParsedJWTType = Depends(get_access_claims)) -> UUID:
+    """Get current user uuid without loading user from database.
+
+    Returns:
+        UUID: Current user uuid.
+    """
+    try:
+        return UUID(str(claims["sub"]))
+    except ValueError:
+        raise JWTValidationError("sub field is invalid")
+
+
+async def authorized_only(claims: ParsedJWTType = Depends(get_access_claims)) -> None:
     """Make endpoint viewable only for authorized users."""
-    UserToken.from_str_access_token(token)
+
+
+def require_scopes(
+    *scopes: Scope,
+) -> Callable[[ParsedJWTType], Coroutine[object, object, None]]:
+    """Make dependency checking that access token has all scopes.
+
+    The check uses only token claims, see `app.scopes`.
+
+    Examples:
+        >>> @router.post("/upload", dependencies=[Depends(require_scopes(Scope.files_write))])
+
+    Returns:
+        Dependency raising `AccessDeniedException` if some scope is missing.
+    """
+    mask = ScopeMask(scopes)
+
+    async def check_scopes(claims: ParsedJWTType = Depends(get_access_claims)) -> None:
+        if not mask.check(claims):
+            raise AccessDeniedException(status_code=status.HTTP_403_FORBIDDEN)
+
+    return check_scopes
+
+
+async def service_only(authorization: str = Header("")) -> None:
+    """Make endpoint viewable only for services with a key from `INTROSPECTION_KEYS`."""
+    key = authorization[7:].encode() if authorization.lower().startswith("bearer ") else b""
+    if not any(hmac.compare_digest(key, k.encode()) for k in get_settings().introspection_keys):
+        raise AccessDeniedException(status_code=status.HTTP_401_UNAUTHORIZED)
+
+
+async def admin_only(token: str = Depends(oauth2_scheme)) -> None:
+    """Make endpoint viewable only for users listed in `ADMINS`."""
+    usertoken = UserToken.from_str_access_token(token)
+    if usertoken.user not in get_settings().admins:
+        raise AccessDeniedException(status_code=status.HTTP_403_FORBIDDEN)
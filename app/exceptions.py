@@ -2,15 +2,13 @@
 
 from abc import ABCMeta
 
-from fastapi import Request, status
+from fastapi import FastAPI, Request, status
 from fastapi.responses import JSONResponse
 from loguru import logger
 from pydantic import BaseModel
 from slowapi.errors import RateLimitExceeded
 from starlette.exceptions import HTTPException as StarletteHTTPException
 
-from .app import app
-
 
 class ErrorModel(BaseModel):
     """Error response for AbstractException."""
@@ -58,6 +56,22 @@ class InvalidCIDException(IPFSException):
     """Invalid CID."""
 
 
+class FileTooLargeException(IPFSException):
+    """File size limit exceeded."""
+
+
+class PinNotFoundException(IPFSException):
+    """File is not pinned by this user."""
+
+
+class UploadQueueDisabledException(IPFSException):
+    """Background uploads are not configured."""
+
+
+class UploadJobNotFoundException(IPFSException):
+    """Upload job doesn't exist, belongs to other user or was removed after retention."""
+
+
 class JWTException(AbstractException):
     """Exception related to JWT."""
 
@@ -87,6 +101,14 @@ class JWTRevokedException(JWTValidationError):
     """
 
 
+class MailException(AbstractException):
+    """Exception related to mail."""
+
+
+class MailQueueFullException(MailException):
+    """Too many outgoing mails, try again later."""
+
+
 class AuthenticationException(AbstractException):
     """Exception related to authentication process."""
 
@@ -99,7 +121,26 @@ class InvalidPasswordException(AuthenticationException):
     """Invalid password."""
 
 
-@app.exception_handler(AbstractException)
+class AccessDeniedException(AuthenticationException):
+    """Access denied."""
+
+
+class InvalidOTPException(AuthenticationException):
+    """Invalid or expired verification code."""
+
+
+class InvalidCursorException(AbstractException):
+    """Invalid export cursor."""
+
+
+class ProfileNotFoundException(AbstractException):
+    """Profile not found, it may be stored by another server."""
+
+
+class NotReadyException(AbstractException):
+    """Worker is warming up or draining."""
+
+
 async def abstract_exception_handler(request: Request, exc: AbstractException) -> JSONResponse:
     """Exception handler for AbstractException.
 
@@ -118,7 +159,6 @@ async def abstract_exception_handler(request: Request, exc: AbstractException) -
     )
 
 
-@app.exception_handler(StarletteHTTPException)
 async def http_exception_handler(request: Request, exc: StarletteHTTPException) -> JSONResponse:
     """Exception handler for StarletteHTTPException.
 
@@ -136,7 +176,6 @@ async def http_exception_handler(request: Request, exc: StarletteHTTPException)
     )
 
 
-@app.exception_handler(RateLimitExceeded)
 async def rate_limit_exception_handler(request: Request, exc: RateLimitExceeded) -> JSONResponse:
     """Exception handler for RateLimitExceeded.
 
@@ -152,3 +191,14 @@ async def rate_limit_exception_handler(request: Request, exc: RateLimitExceeded)
         ).dict(),
         headers=exc.headers,
     )
+
+
+def register_exception_handlers(app: FastAPI) -> None:
+    """Connect exception handlers from this module to the app.
+
+    Args:
+        app: FastAPI app instance.
+    """
+    app.add_exception_handler(AbstractException, abstract_exception_handler)
+    app.add_exception_handler(StarletteHTTPException, http_exception_handler)
+    app.add_exception_handler(RateLimitExceeded, rate_limit_exception_handler)
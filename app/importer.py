@@ -0,0 +1,278 @@
+"""Bulk user import from CSV or JSONL files.
+
+Records are validated against `UserCreate` and passwords are hashed in a
+process pool, then inserted with multi-row `INSERT ... ON CONFLICT DO NOTHING`
+statements, so users that already exist (same uuid, email or nickname) are skipped.
+
+Every record must contain `email`, `nickname` and either `password` (client-side
+PBKDF2 hash, as sent to `signup`) or `password_hash` (already bcrypt hashed, other
+hashes are rejected).
+Optional fields: `uuid`, `created_at`, `verifed`, `disabled`.
+"""
+
+import csv
+import json
+import os
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from itertools import islice
+from time import monotonic, sleep
+from typing import Iterable, Iterator
+from uuid import UUID, uuid4
+
+from loguru import logger
+from pydantic import ValidationError
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.sql.dml import Insert
+
+from .database import get_engine
+from .models.user import User, UserCreate
+from .utils import int_time
+
+Record = dict[str, str]
+Row = dict[str, str | int | bool | UUID]
+
+# CockroachDB asks to retry the transaction with this SQLSTATE
+RETRY_SQLSTATE = "40001"
+# Bind parameters allowed in one statement: PostgreSQL protocol limit,
+# `SQLITE_MAX_VARIABLE_NUMBER` since SQLite 3.32
+MAX_PARAMETERS = {"sqlite": 32766}
+DEFAULT_MAX_PARAMETERS = 65535
+
+
+@dataclass
+class PreparedBatch:
+    """Batch of records ready to be inserted."""
+
+    last_line: int
+    rows: list[Row] = field(default_factory=list)
+    errors: list[tuple[int, str]] = field(default_factory=list)
+
+
+@dataclass
+class ImportStats:
+    """Import progress counters."""
+
+    inserted: int = 0
+    skipped: int = 0
+    invalid: int = 0
+    last_line: int = 0
+
+
+def read_records(path: str) -> Iterator[tuple[int, Record]]:
+    """Stream records from CSV (with header) or JSONL file.
+
+    Args:
+        path: Path to `.csv` or `.jsonl` file.
+
+    Returns:
+        Iterator of record line number (starting from 1) and record.
+    """
+    with open(path, newline="") as file:
+        if path.endswith(".csv"):
+            for number, record in enumerate(csv.DictReader(file), 1):
+                yield number, record
+        else:
+            for number, line in enumerate(file, 1):
+                if line.strip():
+                    yield number, json.loads(line)
+
+
+def parse_bool(value: str | bool | None, default: bool) -> bool:
+    """Parse boolean from CSV or JSON value."""
+    if value is None or value == "":
+        return default
+    if isinstance(value, bool):
+        return value
+    return value.lower() in ("1", "true", "yes")
+
+
+def prepare_record(record: Record) -> Row:
+    """Validate record and hash its password.
+
+    Imported users are verified by default, otherwise `User.cleanup` would delete them.
+
+    Args:
+        record: Raw record.
+
+    Raises:
+        ValidationError: If record is invalid.
+        ValueError: If uuid, created_at or password_hash is invalid.
+
+    Returns:
+        Row: Values for `user` table.
+    """
+    from .security import get_password_hash, get_pwd_context
+
+    password_hash = record.get("password_hash")
+    # Otherwise it is imported and can't be verified at login
+    if password_hash and get_pwd_context().identify(password_hash) != "bcrypt":
+        raise ValueError("password_hash is not a bcrypt hash")
+    user = UserCreate(
+        email=record.get("email"),
+        nickname=record.get("nickname"),
+        password=record.get("password") or password_hash,
+    )
+    return {
+        "uuid": UUID(record["uuid"]) if record.get("uuid") else uuid4(),
+        "email": user.email,
+        "nickname": user.nickname,
+        "password": password_hash if password_hash else get_password_hash(user.password),
+        "disabled": parse_bool(record.get("disabled"), False),
+        "verifed": parse_bool(record.get("verifed"), True),
+        "created_at": int(record["created_at"]) if record.get("created_at") else int_time(),
+    }
+
+
+def prepare_batch(records: list[tuple[int, Record]]) -> PreparedBatch:
+    """Prepare batch of records, runs in a worker process.
+
+    Args:
+        records: Records with their line numbers.
+
+    Returns:
+        PreparedBatch: Rows and validation errors.
+    """
+    batch = PreparedBatch(last_line=records[-1][0])
+    for number, record in records:
+        try:
+            batch.rows.append(prepare_record(record))
+        except (ValidationError, ValueError, KeyError) as e:
+            batch.errors.append((number, str(e).replace("\n", " ")))
+    return batch
+
+
+def upsert_statement(engine: Engine) -> Insert:
+    """Get `INSERT ... ON CONFLICT DO NOTHING` for `user` table in engine dialect."""
+    table = User.__table__  # type: ignore
+    dialect = sqlite if engine.dialect.name == "sqlite" else postgresql
+    statement: Insert = dialect.insert(table).on_conflict_do_nothing()
+    return statement
+
+
+def max_batch_size(engine: Engine) -> int:
+    """Get the most rows one multi-row `INSERT` can have without exceeding bind parameter limit."""
+    table = User.__table__  # type: ignore
+    limit = MAX_PARAMETERS.get(engine.dialect.name, DEFAULT_MAX_PARAMETERS)
+    return limit // len(table.columns)
+
+
+def insert_rows(engine: Engine, rows: list[Row], max_retries: int = 10) -> int:
+    """Insert rows in one transaction, retrying on CockroachDB serialization errors.
+
+    Args:
+        engine: Database engine.
+        rows: Rows to insert.
+        max_retries: How many times to retry transaction.
+
+    Returns:
+        int: Number of inserted rows, duplicates are not counted.
+    """
+    if not rows:
+        return 0
+    statement = upsert_statement(engine).values(rows)
+    for attempt in range(max_retries + 1):
+        try:
+            with engine.begin() as connection:
+                inserted: int = connection.execute(statement).rowcount
+                return inserted
+        except OperationalError as e:
+            if getattr(e.orig, "pgcode", None) != RETRY_SQLSTATE or attempt == max_retries:
+                raise
+            logger.warning(f"Transaction retry {attempt + 1}/{max_retries}")
+            sleep(min(0.01 * 2**attempt, 1))
+    raise AssertionError("unreachable")
+
+
+def read_checkpoint(path: str | None) -> int:
+    """Get the last imported line number from checkpoint file."""
+    if path is None or not os.path.exists(path):
+        return 0
+    with open(path) as file:
+        line: int = json.load(file)["line"]
+        return line
+
+
+def write_checkpoint(path: str | None, line: int) -> None:
+    """Atomically store the last imported line number."""
+    if path is None:
+        return
+    with open(path + ".tmp", "w") as file:
+        json.dump({"line": line}, file)
+    os.replace(path + ".tmp", path)
+
+
+def batched(records: Iterable[tuple[int, Record]], size: int) -> Iterator[list[tuple[int, Record]]]:
+    """Split records to lists of `size` elements."""
+    iterator = iter(records)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def import_users(
+    path: str,
+    batch_size: int = 1000,
+    workers: int | None = None,
+    checkpoint: str | None = None,
+) -> ImportStats:
+    """Import users from file.
+
+    Batches are prepared in parallel but inserted in file order, so after every
+    insert the checkpoint can store the last imported line. Re-running with the
+    same checkpoint continues from there.
+
+    Examples:
+        >>> import_users("users.jsonl", checkpoint="users.checkpoint")
+        ImportStats(inserted=10000, skipped=2, invalid=1, last_line=10003)
+
+    Args:
+        path: Path to `.csv` or `.jsonl` file.
+        batch_size: Rows per `INSERT` statement, capped by `max_batch_size`.
+        workers: Number of processes for validation and hashing, CPU count by default.
+        checkpoint: Path to checkpoint file.
+
+    Returns:
+        ImportStats: Import counters.
+    """
+    engine = get_engine()
+    max_size = max_batch_size(engine)
+    if batch_size > max_size:
+        logger.warning(f"Batch size {batch_size} exceeds bind parameter limit, using {max_size}")
+        batch_size = max_size
+    stats = ImportStats(last_line=read_checkpoint(checkpoint))
+    if stats.last_line:
+        logger.info(f"Resuming after line {stats.last_line}")
+    records = (item for item in read_records(path) if item[0] > stats.last_line)
+    started = monotonic()
+
+    workers = workers or os.cpu_count() or 1
+    # Limit number of batches in flight, so the file is never read into memory
+    in_flight_limit = 2 * workers
+    with ProcessPoolExecutor(workers) as executor:
+        in_flight: deque[Future[PreparedBatch]] = deque()
+        batches = batched(records, batch_size)
+        while True:
+            for batch in islice(batches, in_flight_limit - len(in_flight)):
+                in_flight.append(executor.submit(prepare_batch, batch))
+            if not in_flight:
+                break
+            prepared = in_flight.popleft().result()
+
+            for number, error in prepared.errors:
+                logger.warning(f"Line {number}: {error}")
+            inserted = insert_rows(engine, prepared.rows)
+            stats.inserted += inserted
+            stats.skipped += len(prepared.rows) - inserted
+            stats.invalid += len(prepared.errors)
+            stats.last_line = prepared.last_line
+            write_checkpoint(checkpoint, stats.last_line)
+
+            rate = (stats.inserted + stats.skipped) / (monotonic() - started)
+            logger.info(
+                f"Line {stats.last_line}: inserted {stats.inserted}, skipped {stats.skipped}, "
+                f"invalid {stats.invalid} ({rate:.0f} rows/s)"
+            )
+    return stats
@@ -1,5 +1,5 @@
 """Module exporting IPFSClient."""
 
-from .client import IPFSClient
+from .client import AddedDirectory, IPFSClient, PeerPinInfo, PinInfo
 
-__all__ = ["IPFSClient"]
+__all__ = ["AddedDirectory", "IPFSClient", "PeerPinInfo", "PinInfo"]
@@ -0,0 +1,128 @@
+"""Cluster peer selection.
+
+Every request goes to the available peer with the least outstanding requests.
+A peer is unavailable while its health check fails or while its circuit
+breaker is open: after `failure_threshold` consecutive failures the peer is
+skipped for `cooldown` seconds, then it gets a trial request, and one more
+failure opens the breaker again.
+"""
+
+from collections import defaultdict, deque
+from time import monotonic
+from typing import Iterable
+
+from loguru import logger
+
+
+class PeerFailure(Exception):
+    """Peer didn't respond or responded with server error, request may be retried."""
+
+
+class Peer:
+    """Cluster peer state."""
+
+    def __init__(self, url: str, failure_threshold: int = 3, cooldown: float = 10) -> None:
+        """Cluster peer state.
+
+        Args:
+            url: Peer REST API url.
+            failure_threshold: Consecutive failures to open circuit breaker.
+            cooldown: Seconds to skip peer after circuit breaker opens.
+        """
+        self.url = url
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.outstanding = 0
+        self.failures = 0
+        self.open_until = 0.0
+        self.healthy = True
+
+    @property
+    def available(self) -> bool:
+        """Whether peer passes health checks and its circuit breaker is closed."""
+        return self.healthy and monotonic() >= self.open_until
+
+    def acquire(self) -> None:
+        """Count request sent to peer."""
+        self.outstanding += 1
+
+    def release(self, *_: object) -> None:
+        """Count request finished, usable as task done callback."""
+        self.outstanding -= 1
+
+    def success(self) -> None:
+        """Record successful request, closes circuit breaker."""
+        self.failures = 0
+        self.open_until = 0.0
+
+    def failure(self) -> None:
+        """Record failed request, opens circuit breaker after too many failures."""
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            if self.failures == self.failure_threshold:
+                logger.warning(f"IPFS cluster peer {self.url} failed, skipping it")
+            self.open_until = monotonic() + self.cooldown
+
+
+class PeerPool:
+    """Cluster peers with shared latency statistics per operation."""
+
+    def __init__(
+        self,
+        urls: list[str],
+        failure_threshold: int = 3,
+        cooldown: float = 10,
+        window: int = 200,
+        min_samples: int = 20,
+    ) -> None:
+        """Cluster peers with shared latency statistics per operation.
+
+        Args:
+            urls: Peer REST API urls.
+            failure_threshold: Consecutive failures to open circuit breaker of a peer.
+            cooldown: Seconds to skip peer after its circuit breaker opens.
+            window: Number of recent request latencies kept per operation.
+            min_samples: Latency percentiles are not reported until this many requests finished.
+        """
+        self.peers = [Peer(url, failure_threshold, cooldown) for url in urls]
+        self.latencies: defaultdict[str, deque[float]] = defaultdict(lambda: deque(maxlen=window))
+        self.min_samples = min_samples
+        self.offset = 0
+
+    def pick(self, exclude: Iterable[Peer] = ()) -> Peer | None:
+        """Get peer with the least outstanding requests.
+
+        Ties are broken round-robin. If every peer is unavailable, requests are
+        still sent to them instead of failing without trying.
+
+        Args:
+            exclude: Peers already tried by this request.
+
+        Returns:
+            Peer: Selected peer, `None` if all peers are excluded.
+        """
+        excluded = set(exclude)
+        candidates = [peer for peer in self.peers if peer not in excluded]
+        if not candidates:
+            return None
+        candidates = [peer for peer in candidates if peer.available] or candidates
+        self.offset = (self.offset + 1) % len(self.peers)
+        start = self.offset % len(candidates)
+        rotated = candidates[start:] + candidates[:start]
+        return min(rotated, key=lambda peer: peer.outstanding)
+
+    def record_latency(self, operation: str, seconds: float) -> None:
+        """Record latency of successful request."""
+        self.latencies[operation].append(seconds)
+
+    def percentile(self, operation: str, percent: float) -> float | None:
+        """Get latency percentile of recent requests of operation.
+
+        Returns:
+            float: Latency in seconds, `None` if there are not enough samples.
+        """
+        if len(self.latencies[operation]) < self.min_samples:
+            return None
+        latencies = sorted(self.latencies[operation])
+        index = min(int(len(latencies) * percent / 100), len(latencies) - 1)
+        return latencies[index]
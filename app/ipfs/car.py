@@ -0,0 +1,147 @@
+"""CARv1 export of DAGs built by `app.ipfs.unixfs`.
+
+CAR header must contain the root CID, which is known only after the whole
+file is imported, so files are read twice: `dag_root` computes the root,
+then `iter_car` streams blocks. Memory usage stays constant.
+"""
+
+from concurrent.futures import Executor
+from typing import Callable, Iterable, Iterator
+
+from .unixfs import (
+    FileImporter,
+    cid_to_str,
+    encode_varint,
+    fixed_size_chunks,
+    iter_file,
+)
+
+Chunker = Callable[[Iterable[bytes]], Iterator[bytes]]
+
+
+def _cbor_head(major: int, value: int) -> bytes:
+    if value < 24:
+        return bytes([major << 5 | value])
+    length = (value.bit_length() + 7) // 8
+    size = 1 if length <= 1 else 2 if length <= 2 else 4 if length <= 4 else 8
+    return bytes([major << 5 | {1: 24, 2: 25, 4: 26, 8: 27}[size]]) + value.to_bytes(size, "big")
+
+
+def car_header(root: bytes) -> bytes:
+    """Encode CARv1 header `{"roots": [root], "version": 1}` as length-prefixed dag-cbor.
+
+    Args:
+        root: Binary root CID.
+
+    Returns:
+        bytes: Header.
+    """
+    link = b"\x00" + root  # CIDs in dag-cbor are bytes with identity multibase prefix
+    header = (
+        _cbor_head(5, 2)
+        + _cbor_head(3, 5)
+        + b"roots"
+        + _cbor_head(4, 1)
+        + b"\xd8\x2a"  # Tag 42: CID
+        + _cbor_head(2, len(link))
+        + link
+        + _cbor_head(3, 7)
+        + b"version"
+        + _cbor_head(0, 1)
+    )
+    return encode_varint(len(header)) + header
+
+
+def car_block(cid: bytes, data: bytes) -> bytes:
+    """Encode CARv1 block section."""
+    return encode_varint(len(cid) + len(data)) + cid + data
+
+
+def dag_root(
+    chunks: Iterable[bytes],
+    cid_version: int = 0,
+    raw_leaves: bool | None = None,
+    executor: Executor | None = None,
+) -> bytes:
+    """Import chunks without storing blocks.
+
+    Returns:
+        bytes: Binary root CID.
+    """
+    importer = FileImporter(cid_version, raw_leaves, executor=executor)
+    for chunk in chunks:
+        importer.add(chunk)
+    importer.finish()
+    assert importer.root is not None
+    return importer.root
+
+
+def iter_car(
+    root: bytes,
+    chunks: Iterable[bytes],
+    cid_version: int = 0,
+    raw_leaves: bool | None = None,
+    executor: Executor | None = None,
+) -> Iterator[bytes]:
+    """Stream CAR of UnixFS file.
+
+    Examples:
+        >>> root = dag_root(rabin_chunks(open("file", "rb")))
+        >>> with open("file.car", "wb") as file:
+        >>>     file.writelines(iter_car(root, rabin_chunks(open("file", "rb"))))
+
+    Args:
+        root: Root CID from `dag_root` with the same chunks and options.
+        chunks: File chunks.
+        cid_version: CID version, 0 or 1.
+        raw_leaves: Store chunks as raw blocks, by default only for CIDv1.
+        executor: Pool to hash chunks in.
+
+    Returns:
+        Iterator of CAR parts.
+    """
+    yield car_header(root)
+    blocks: list[bytes] = []
+    importer = FileImporter(
+        cid_version,
+        raw_leaves,
+        executor=executor,
+        on_block=lambda cid, data: blocks.append(car_block(cid, data)),
+    )
+    for chunk in chunks:
+        importer.add(chunk)
+        yield from blocks
+        blocks.clear()
+    importer.finish()
+    yield from blocks
+    if importer.root != root:
+        raise ValueError("File changed while CAR was written")
+
+
+def file_car(
+    path: str, chunker: Chunker = fixed_size_chunks, cid_version: int = 0
+) -> tuple[str, Iterator[bytes]]:
+    """Compute root CID of file and prepare its CAR stream.
+
+    Root is computed right away, the file is read again when CAR is consumed.
+
+    Examples:
+        >>> root, car = file_car("dummy.txt", rabin_chunks)
+        >>> root
+        "QmRJaHfsTiD5JfhGju8EUKATgKYPn4jgexTipVLCTKEg6j"
+
+    Args:
+        path: Path to file.
+        chunker: Function splitting stream to chunks, see `app.ipfs.unixfs`.
+        cid_version: CID version, 0 or 1.
+
+    Returns:
+        Root CID and iterator of CAR parts.
+    """
+
+    def chunks() -> Iterator[bytes]:
+        with open(path, "rb") as file:
+            yield from chunker(iter_file(file))
+
+    root = dag_root(chunks(), cid_version)
+    return cid_to_str(root), iter_car(root, chunks(), cid_version)
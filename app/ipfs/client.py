@@ -1,16 +1,100 @@
 """Module with IPFSClient."""
 
-from typing import Tuple
+import asyncio
+import json
+from pathlib import PurePosixPath
+from time import monotonic
+from typing import (
+    TYPE_CHECKING,
+    AsyncIterable,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Iterable,
+    Mapping,
+    NamedTuple,
+    Tuple,
+    TypedDict,
+    TypeVar,
+)
 
-import aiohttp
+from fastapi import status
+from loguru import logger
 
-from ..exceptions import InvalidCIDException, IPFSException
+from ..exceptions import (
+    FileTooLargeException,
+    InvalidCIDException,
+    IPFSException,
+)
+from ..tracing import aiohttp_trace_config
+from .balancer import Peer, PeerFailure, PeerPool
+from .unixfs import bytes_cid, file_cid, iter_file
+
+if TYPE_CHECKING:
+    import aiohttp
+
+T = TypeVar("T")
+
+
+async def iterate_in_thread(iterable: Iterable[bytes]) -> AsyncIterator[bytes]:
+    """Iterate over blocking iterable without blocking event loop."""
+    iterator = iter(iterable)
+    while (item := await asyncio.to_thread(next, iterator, None)) is not None:
+        yield item
+
+
+async def read_file(path: str) -> AsyncIterator[bytes]:
+    """Read file in chunks without blocking event loop, it is opened on first chunk."""
+    file = await asyncio.to_thread(open, path, "rb")
+    with file:
+        async for chunk in iterate_in_thread(iter_file(file)):
+            yield chunk
+
+
+class PeerPinInfo(TypedDict, total=False):
+    """CID status on one cluster peer."""
+
+    status: str
+    timestamp: str
+    error: str
+
+
+class PinInfo(TypedDict, total=False):
+    """CID status in cluster, `GlobalPinInfo` in ipfs-cluster API."""
+
+    cid: str
+    name: str
+    created: str
+    peer_map: dict[str, PeerPinInfo]
+
+
+class AddedDirectory(NamedTuple):
+    """Result of `IPFSClient.add_directory`."""
+
+    root: str
+    # CID by relative path, including intermediate directories
+    entries: dict[str, str]
 
 
 class IPFSClient:
-    """IPFS async HTTP API."""
+    """IPFS async HTTP API.
+
+    Requests are balanced between cluster peers, see `app.ipfs.balancer`.
+    Idempotent requests are retried on another peer if a peer fails, and
+    can be hedged: if there is no response within the `hedge_percentile`
+    of recent latencies, the same request is sent to another peer, and the
+    first response wins.
+    """
 
-    def __init__(self, endpoint: str, auth: Tuple[str, str] | None = None) -> None:
+    def __init__(
+        self,
+        endpoint: str | list[str],
+        auth: Tuple[str, str] | None = None,
+        hedge_percentile: float | None = None,
+        health_interval: float = 5,
+        failure_threshold: int = 3,
+        cooldown: float = 10,
+    ) -> None:
         """IPFS async HTTP API.
 
         Examples:
@@ -20,26 +104,187 @@ class IPFSClient:
             "QmdkTR6yFkXLh96DtAgBqW2bDGsxYKDTKZSLGgHkP8niyU"
 
         Args:
-            endpoint: REST API url.
+            endpoint: REST API url of cluster peers, list or comma separated string.
             auth: List containing basic auth [user, password].
+            hedge_percentile: Latency percentile to hedge idempotent requests after,
+                hedging is disabled if `None`.
+            health_interval: Seconds between peer health checks.
+            failure_threshold: Consecutive failures to skip a peer.
+            cooldown: Seconds to skip a failed peer.
         """
+        # aiohttp is heavy to import, so it is loaded on first client creation
+        import aiohttp
+
+        if isinstance(endpoint, str):
+            endpoint = endpoint.split(",")
+        urls = [url.strip().rstrip("/") for url in endpoint if url.strip()]
+        if not urls:
+            raise ValueError("At least one IPFS cluster peer is required")
+
         self.session: aiohttp.ClientSession
-        self.endpoint = endpoint
+        self.endpoint = urls[0]
+        self.pool = PeerPool(urls, failure_threshold, cooldown)
+        self.hedge_percentile = hedge_percentile
+        self.health_interval = health_interval
+        self.health_task: asyncio.Task[None] | None = None
+        self.hedged = 0
         self.auth = None
         if auth is not None:
             self.auth = aiohttp.BasicAuth(*auth)
-        self.req = {"auth": self.auth}
 
     async def __aenter__(self) -> "IPFSClient":
         """With enter point."""
-        self.session = await aiohttp.ClientSession().__aenter__()
+        import aiohttp
+
+        self.session = await aiohttp.ClientSession(
+            trace_configs=[aiohttp_trace_config()]
+        ).__aenter__()
+        if len(self.pool.peers) > 1:
+            self.health_task = asyncio.create_task(self._health_loop())
         return self
 
     async def __aexit__(self, *exc) -> None:  # type: ignore
         """With exit point."""
+        if self.health_task is not None:
+            self.health_task.cancel()
+            await asyncio.gather(self.health_task, return_exceptions=True)
+            self.health_task = None
         await self.session.__aexit__(*exc)
         del self.session
 
+    async def _check_health(self, peer: Peer) -> None:
+        """Mark peer healthy if its `/id` endpoint responds."""
+        import aiohttp
+
+        try:
+            async with self.session.get(
+                peer.url + "/id", auth=self.auth, timeout=aiohttp.ClientTimeout(total=2)
+            ) as response:
+                healthy = response.status == 200
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            healthy = False
+        if healthy != peer.healthy:
+            logger.warning(f"IPFS cluster peer {peer.url} is {'up' if healthy else 'down'}")
+        peer.healthy = healthy
+
+    async def warm_up(self) -> None:
+        """Open connection to every peer and check its health.
+
+        Connections are kept alive by the session, so first requests don't
+        wait for TCP and TLS handshakes.
+        """
+        await asyncio.gather(*(self._check_health(peer) for peer in self.pool.peers))
+
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.gather(*(self._check_health(peer) for peer in self.pool.peers))
+            await asyncio.sleep(self.health_interval)
+
+    async def _attempt(
+        self,
+        operation: str,
+        peer: Peer,
+        method: str,
+        path: str,
+        handle: Callable[["aiohttp.ClientResponse"], Awaitable[T]],
+        **kwargs: object,
+    ) -> T:
+        """Send request to one peer, updating its state.
+
+        Raises:
+            PeerFailure: If peer didn't respond or responded with server error.
+        """
+        import aiohttp
+
+        started = monotonic()
+        try:
+            async with self.session.request(
+                method, peer.url + path, auth=self.auth, **kwargs
+            ) as response:
+                if response.status >= 500:
+                    raise PeerFailure(f"{peer.url} responded with {response.status}")
+                result = await handle(response)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            peer.failure()
+            raise PeerFailure(f"{peer.url}: {e!r}") from e
+        except PeerFailure:
+            peer.failure()
+            raise
+        peer.success()
+        self.pool.record_latency(operation, monotonic() - started)
+        return result
+
+    async def _request(
+        self,
+        operation: str,
+        method: str,
+        path: str,
+        handle: Callable[["aiohttp.ClientResponse"], Awaitable[T]],
+        error: str,
+        idempotent: bool = False,
+        **kwargs: object,
+    ) -> T:
+        """Send request to cluster.
+
+        Args:
+            operation: Operation name, latencies are tracked per operation, so
+                e.g. large uploads don't delay hedging of status requests.
+            method: HTTP method.
+            path: Endpoint path.
+            handle: Coroutine reading successful response.
+            error: Error message if all attempts failed.
+            idempotent: Whether request may be retried and hedged.
+            kwargs: Arguments for `aiohttp.ClientSession.request`.
+
+        Raises:
+            IPFSException: If request failed on all tried peers.
+
+        Returns:
+            Result of `handle`.
+        """
+        tried: list[Peer] = []
+        pending: set[asyncio.Task[T]] = set()
+        hedge_after = None
+        if idempotent and self.hedge_percentile is not None:
+            hedge_after = self.pool.percentile(operation, self.hedge_percentile)
+        try:
+            while True:
+                peer = self.pool.pick(tried)
+                if peer is not None:
+                    tried.append(peer)
+                    # Counted before the task starts, so concurrent requests see it
+                    peer.acquire()
+                    task = asyncio.create_task(
+                        self._attempt(operation, peer, method, path, handle, **kwargs)
+                    )
+                    task.add_done_callback(peer.release)
+                    pending.add(task)
+                elif not pending:
+                    raise IPFSException(detail=error)
+                can_hedge = hedge_after is not None and len(tried) < len(self.pool.peers)
+                done, pending = await asyncio.wait(
+                    pending,
+                    timeout=hedge_after if can_hedge else None,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    self.hedged += 1
+                    continue
+                for task in done:
+                    exception = task.exception()
+                    if exception is None:
+                        return task.result()
+                    if not isinstance(exception, PeerFailure):
+                        raise exception
+                    logger.warning(f"IPFS cluster request failed: {exception}")
+                if not idempotent:
+                    raise IPFSException(detail=error)
+        finally:
+            for task in pending:
+                task.cancel()
+            # Losing attempts close their connections and stop being outstanding
+            await asyncio.gather(*pending, return_exceptions=True)
+
     @staticmethod
     def check_cid(cid: str) -> None:
         """Check if CID valid.
@@ -54,22 +299,13 @@ class IPFSClient:
         if cid.find(" ") != -1:
             raise InvalidCIDException()
 
-    def _get_path(self, path: str) -> str:
-        """Get endpoint path.
-
-        Examples:
-            >>> client._get_path("/add")
-            http://127.0.0.1:9094/add
-
-        Args:
-            path: Endpoint path.
-
-        Returns:
-            str: Absolute endpoint path with host.
-        """
-        return self.endpoint + path
-
-    async def _add_formdata(self, data: aiohttp.FormData, name: str | None = None) -> str:
+    async def _add_formdata(
+        self,
+        data: "aiohttp.FormData",
+        name: str | None = None,
+        expected: str | None = None,
+        params: dict[str, str] | None = None,
+    ) -> str:
         """Post formdata to `/add` cluster endpoint.
 
         Examples:
@@ -81,23 +317,40 @@ class IPFSClient:
         Args:
             data: aiohttp.FormData object.
             name: Pin name.
+            expected: CID computed locally, checked against cluster response.
+            params: Additional `/add` parameters.
+
+        Raises:
+            IPFSException: When cluster returned not `expected` CID.
 
         Returns:
             str: File CID.
         """
-        params = {"quieter": "true"}
+        params = {"quieter": "true", **(params or {})}
         if name is not None:
             params["name"] = name
-        async with self.session.post(
-            self._get_path("/add"), params=params, data=data, **self.req
-        ) as response:
+
+        async def handle(response: "aiohttp.ClientResponse") -> str:
             if response.status != 200:
                 raise IPFSException(detail="Cannot pin file")
             cid: str = (await response.json())["cid"]
+            return cid
+
+        # Body may be a stream which can't be sent twice, so it is never retried
+        cid = await self._request(
+            "add", "POST", "/add", handle, "Cannot pin file", params=params, data=data
+        )
+        if expected is not None and cid != expected:
+            raise IPFSException(detail=f"Cluster returned CID {cid}, expected {expected}")
         return cid
 
     async def add_file(
-        self, file: str, content_type: str, filename: str | None = None, name: str | None = None
+        self,
+        file: str,
+        content_type: str,
+        filename: str | None = None,
+        name: str | None = None,
+        verify: bool = False,
     ) -> str:
         """Add file to IPFS cluster.
 
@@ -110,16 +363,29 @@ class IPFSClient:
             content_type: File content-type.
             filename: Filename.
             name: Pin name.
+            verify: Compute CID locally and check that cluster returned the same,
+                requires default cluster import parameters.
+
+        Raises:
+            IPFSException: When `verify` is set and CIDs differ.
 
         Returns:
             str: File CID.
         """
+        import aiohttp
+
+        expected = await asyncio.to_thread(file_cid, file) if verify else None
         formdata = aiohttp.FormData()
         formdata.add_field("file", open(file, "rb"), content_type=content_type, filename=filename)
-        return await self._add_formdata(formdata, name=name)
+        return await self._add_formdata(formdata, name=name, expected=expected)
 
     async def add_bytes(
-        self, data: bytes, content_type: str, filename: str | None = None, name: str | None = None
+        self,
+        data: bytes,
+        content_type: str,
+        filename: str | None = None,
+        name: str | None = None,
+        verify: bool = False,
     ) -> str:
         """Add bytes to IPFS cluster.
 
@@ -132,14 +398,217 @@ class IPFSClient:
             content_type: File content-type.
             filename: Filename.
             name: Pin name.
+            verify: Compute CID locally and check that cluster returned the same,
+                requires default cluster import parameters.
+
+        Raises:
+            IPFSException: When `verify` is set and CIDs differ.
 
         Returns:
             str: File CID.
         """
+        import aiohttp
+
+        expected = await asyncio.to_thread(bytes_cid, data) if verify else None
         formdata = aiohttp.FormData()
         formdata.add_field("file", data, content_type=content_type, filename=filename)
+        return await self._add_formdata(formdata, name=name, expected=expected)
+
+    async def add_car(
+        self, car: Iterable[bytes], root: str | None = None, name: str | None = None
+    ) -> str:
+        """Add pre-built DAG from CAR stream to IPFS cluster.
+
+        CAR is produced in a thread while it is uploaded, see `app.ipfs.car`.
+
+        Examples:
+            >>> root, car = await asyncio.to_thread(file_car, "video.mp4", rabin_chunks)
+            >>> await client.add_car(car, root)
+            "QmedsYWGvd5DWqwn6Ev5ow5pSgdqDtzsvcDGWQMa1gokEb"
+
+        Args:
+            car: CAR parts.
+            root: Expected root CID, checked against cluster response.
+            name: Pin name.
+
+        Raises:
+            IPFSException: When cluster returned not `root` CID.
+
+        Returns:
+            str: Root CID.
+        """
+        import aiohttp
+
+        formdata = aiohttp.FormData()
+        formdata.add_field(
+            "file",
+            iterate_in_thread(car),
+            content_type="application/vnd.ipld.car",
+            filename="file.car",
+        )
+        return await self._add_formdata(formdata, name, root, {"format": "car"})
+
+    @staticmethod
+    async def _limit_size(stream: AsyncIterable[bytes], max_size: int) -> AsyncIterator[bytes]:
+        """Pass chunks through, raising as soon as `max_size` bytes are exceeded.
+
+        Raises:
+            FileTooLargeException: When stream is larger than `max_size`.
+        """
+        size = 0
+        async for chunk in stream:
+            size += len(chunk)
+            if size > max_size:
+                raise FileTooLargeException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+            yield chunk
+
+    async def add_stream(
+        self,
+        stream: AsyncIterable[bytes],
+        content_type: str,
+        filename: str | None = None,
+        name: str | None = None,
+        max_size: int | None = None,
+    ) -> str:
+        """Add file from async stream of chunks to IPFS cluster.
+
+        Chunks are written to the cluster connection as they are produced, and the
+        next chunk is requested only after the previous one was written, so memory
+        usage doesn't depend on file size. If `max_size` is exceeded the upload
+        is aborted without reading the rest of the stream.
+
+        Examples:
+            >>> await client.add_stream(request.stream(), "text/plain", max_size=1024)
+            "QmdkTR6yFkXLh96DtAgBqW2bDGsxYKDTKZSLGgHkP8niyU"
+
+        Args:
+            stream: Async iterable of file chunks.
+            content_type: File content-type.
+            filename: Filename.
+            name: Pin name.
+            max_size: Maximum file size in bytes.
+
+        Raises:
+            FileTooLargeException: When file is larger than `max_size`.
+
+        Returns:
+            str: File CID.
+        """
+        import aiohttp
+
+        if max_size is not None:
+            stream = self._limit_size(stream, max_size)
+        formdata = aiohttp.FormData()
+        formdata.add_field("file", stream, content_type=content_type, filename=filename or "file")
         return await self._add_formdata(formdata, name=name)
 
+    @staticmethod
+    def _directory_formdata(
+        entries: Mapping[str, str | AsyncIterable[bytes]],
+    ) -> "aiohttp.FormData":
+        """Build multipart body of directory, entries are read while it is sent.
+
+        Parts are sorted by path, so files of a directory follow it, and every
+        intermediate directory is sent as an empty `application/x-directory`
+        part before its files, as IPFS expects.
+
+        Raises:
+            ValueError: When a path is not relative, or is both a file and a directory.
+        """
+        import aiohttp
+
+        paths: dict[tuple[str, ...], str | AsyncIterable[bytes]] = {}
+        for path, source in entries.items():
+            parts = PurePosixPath(path).parts
+            if not parts or parts[0] == "/" or any(part in [".", ".."] for part in parts):
+                raise ValueError(f"Invalid directory entry path {path!r}")
+            paths[parts] = source
+        if not paths:
+            raise ValueError("At least one directory entry is required")
+
+        formdata = aiohttp.FormData()
+        directories: set[tuple[str, ...]] = set()
+        for parts in sorted(paths):
+            if parts in directories:
+                raise ValueError(f"Path {'/'.join(parts)!r} is both a file and a directory")
+            for depth in range(1, len(parts)):
+                directory = parts[:depth]
+                if directory in paths:
+                    raise ValueError(f"Path {'/'.join(directory)!r} is both a file and a directory")
+                if directory not in directories:
+                    directories.add(directory)
+                    formdata.add_field(
+                        "file",
+                        b"",
+                        content_type="application/x-directory",
+                        filename="/".join(directory),
+                    )
+            source = paths[parts]
+            formdata.add_field(
+                "file",
+                read_file(source) if isinstance(source, str) else source,
+                content_type="application/octet-stream",
+                filename="/".join(parts),
+            )
+        return formdata
+
+    async def add_directory(
+        self, entries: Mapping[str, str | AsyncIterable[bytes]], name: str | None = None
+    ) -> AddedDirectory:
+        """Add many files as one directory to IPFS cluster, in a single request.
+
+        All entries are sent in one multipart body wrapped with a directory, so
+        a set of small files costs one round trip and one pin. Files are read
+        chunk by chunk while the body is sent, and cluster output is parsed line
+        by line as it is received, so memory usage doesn't depend on the
+        number or size of files.
+
+        Examples:
+            >>> await client.add_directory({"pack.mcmeta": "pack.mcmeta", "assets/a.png": stream})
+            AddedDirectory(root="QmT78zSuBmuS4z925WZfrqQ1qHaJ56DQaTfyMUF7F8ff5o", entries={...})
+
+        Args:
+            entries: Sources by relative path in directory, path of local file
+                or async iterable of chunks.
+            name: Pin name.
+
+        Raises:
+            ValueError: When paths are invalid.
+            IPFSException: When cluster didn't return root CID.
+
+        Returns:
+            AddedDirectory: Root CID and CID of every entry.
+        """
+        formdata = self._directory_formdata(entries)
+        params = {"wrap-with-directory": "true"}
+        if name is not None:
+            params["name"] = name
+
+        async def handle(response: "aiohttp.ClientResponse") -> AddedDirectory:
+            if response.status != 200:
+                raise IPFSException(detail="Cannot pin directory")
+            root = None
+            added: dict[str, str] = {}
+            # Wrapping directory is the last output, it has empty name
+            async for line in self._iter_lines(response):
+                output = json.loads(line)
+                if "cid" not in output:
+                    if "message" in output:
+                        raise IPFSException(detail=f"Cannot pin directory: {output['message']}")
+                    # Progress report
+                    continue
+                root = output["cid"]
+                if output.get("name"):
+                    added[output["name"]] = root
+            if root is None:
+                raise IPFSException(detail="Cannot pin directory")
+            return AddedDirectory(root, added)
+
+        # Body is a stream which can't be sent twice, so it is never retried
+        return await self._request(
+            "add", "POST", "/add", handle, "Cannot pin directory", params=params, data=formdata
+        )
+
     async def remove(self, cid: str) -> None:
         """Remove CID from cluster.
 
@@ -150,6 +619,146 @@ class IPFSClient:
             cid: CID to remove.
         """
         self.check_cid(cid)
-        async with self.session.delete(self._get_path(f"/pins/ipfs/{cid}"), **self.req) as response:
+
+        async def handle(response: "aiohttp.ClientResponse") -> None:
             if response.status not in [200, 404]:
                 raise IPFSException(detail=f"Cannot remove CID {cid}")
+
+        await self._request(
+            "remove",
+            "DELETE",
+            f"/pins/ipfs/{cid}",
+            handle,
+            f"Cannot remove CID {cid}",
+            idempotent=True,
+        )
+
+    async def pin(self, cid: str, name: str | None = None) -> None:
+        """Pin existing CID to cluster, content is fetched from IPFS network.
+
+        Examples:
+            >>> await client.pin("QmRf22bZar3WKmojipms22PkXH1MZGmvsqzQtuSvQE3uhm", "test.txt")
+
+        Args:
+            cid: CID to pin.
+            name: Pin name.
+        """
+        self.check_cid(cid)
+        params = {"name": name} if name is not None else {}
+
+        async def handle(response: "aiohttp.ClientResponse") -> None:
+            if response.status != 200:
+                raise IPFSException(detail=f"Cannot pin CID {cid}")
+
+        await self._request(
+            "pin",
+            "POST",
+            f"/pins/ipfs/{cid}",
+            handle,
+            f"Cannot pin CID {cid}",
+            idempotent=True,
+            params=params,
+        )
+
+    async def recover(self, cid: str) -> None:
+        """Retry failed pin operation of CID on all cluster peers.
+
+        Args:
+            cid: CID to recover.
+        """
+        self.check_cid(cid)
+
+        async def handle(response: "aiohttp.ClientResponse") -> None:
+            if response.status != 200:
+                raise IPFSException(detail=f"Cannot recover CID {cid}")
+
+        await self._request(
+            "recover",
+            "POST",
+            f"/pins/{cid}/recover",
+            handle,
+            f"Cannot recover CID {cid}",
+            idempotent=True,
+        )
+
+    async def status(self, cid: str) -> PinInfo:
+        """Get CID status on all cluster peers.
+
+        Examples:
+            >>> await client.status("QmRf22bZar3WKmojipms22PkXH1MZGmvsqzQtuSvQE3uhm")
+            {"cid": "QmRf22bZar3WKmojipms22PkXH1MZGmvsqzQtuSvQE3uhm", "peer_map": {...}, ...}
+
+        Args:
+            cid: CID to check.
+
+        Returns:
+            PinInfo: CID status.
+        """
+        self.check_cid(cid)
+
+        async def handle(response: "aiohttp.ClientResponse") -> PinInfo:
+            if response.status != 200:
+                raise IPFSException(detail=f"Cannot get status of CID {cid}")
+            info: PinInfo = await response.json()
+            return info
+
+        return await self._request(
+            "status",
+            "GET",
+            f"/pins/{cid}",
+            handle,
+            f"Cannot get status of CID {cid}",
+            idempotent=True,
+        )
+
+    @staticmethod
+    async def _iter_lines(response: "aiohttp.ClientResponse") -> AsyncIterator[bytes]:
+        """Iterate over non-empty lines of response, every line as soon as it is received."""
+        buffer = b""
+        async for chunk in response.content.iter_any():
+            *lines, buffer = (buffer + chunk).split(b"\n")
+            for line in lines:
+                if line.strip():
+                    yield line
+        if buffer.strip():
+            yield buffer
+
+    async def pins(self) -> AsyncIterator[PinInfo]:
+        """Iterate over status of all pins in cluster.
+
+        Cluster streams the listing as newline-delimited JSON, every line is parsed
+        as soon as it is received, so memory usage doesn't depend on number of pins.
+
+        Examples:
+            >>> async for pin in client.pins():
+            >>>     print(pin["cid"], pin["peer_map"])
+
+        Returns:
+            Iterator of CID statuses.
+        """
+        import aiohttp
+
+        # Listing of a large cluster takes longer than default 5 minutes timeout
+        timeout = aiohttp.ClientTimeout(total=None, sock_read=300)
+        # Response is consumed by caller, so it can't be retried or hedged
+        peer = self.pool.pick()
+        if peer is None:
+            raise IPFSException(detail="Cannot list pins")
+        peer.acquire()
+        try:
+            async with self.session.get(
+                peer.url + "/pins", timeout=timeout, auth=self.auth
+            ) as response:
+                if response.status != 200:
+                    if response.status >= 500:
+                        peer.failure()
+                    raise IPFSException(detail="Cannot list pins")
+                peer.success()
+                async for line in self._iter_lines(response):
+                    info: PinInfo = json.loads(line)
+                    yield info
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            peer.failure()
+            raise IPFSException(detail="Cannot list pins") from e
+        finally:
+            peer.release()
@@ -0,0 +1,392 @@
+"""UnixFS importer computing CIDs locally, the same way as `ipfs add` does.
+
+Data is split to chunks, every chunk becomes a leaf block, and leaves are
+linked by a balanced tree of dag-pb nodes with at most 174 links each. With
+default options (256 KiB fixed-size chunks, CIDv0) the root CID equals the
+one returned by cluster `/add`. Only the current chunk and one list of links
+per tree level are kept in memory, so files of any size can be imported.
+
+Chunks may be hashed in a thread pool, `hashlib` releases the GIL while
+hashing, so this scales with the number of cores.
+"""
+
+import base64
+import hashlib
+import os
+from collections import deque
+from concurrent.futures import Executor, Future
+from functools import lru_cache
+from typing import BinaryIO, Callable, Iterable, Iterator, NamedTuple
+
+DAG_PB = 0x70
+RAW = 0x55
+SHA2_256 = 0x12
+CHUNK_SIZE = 256 * 1024
+MAX_LINKS = 174
+# Irreducible polynomial of degree 53 for Rabin fingerprints
+RABIN_POLYNOMIAL = 17437180132763653
+RABIN_WINDOW = 16
+
+BASE58_ALPHABET = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+
+BlockCallback = Callable[[bytes, bytes], None]
+
+
+def encode_varint(value: int) -> bytes:
+    """Encode unsigned integer as protobuf/multiformats varint."""
+    result = bytearray()
+    while value >= 0x80:
+        result.append(value & 0x7F | 0x80)
+        value >>= 7
+    result.append(value)
+    return bytes(result)
+
+
+def _varint_field(number: int, value: int) -> bytes:
+    return encode_varint(number << 3) + encode_varint(value)
+
+
+def _bytes_field(number: int, value: bytes) -> bytes:
+    return encode_varint(number << 3 | 2) + encode_varint(len(value)) + value
+
+
+def make_cid(data: bytes, version: int = 0, codec: int = DAG_PB) -> bytes:
+    """Get binary CID of block with sha2-256 multihash.
+
+    Args:
+        data: Block data.
+        version: CID version, CIDv0 is only possible for dag-pb blocks.
+        codec: Multicodec of block.
+
+    Returns:
+        bytes: Binary CID.
+    """
+    multihash = bytes([SHA2_256, 32]) + hashlib.sha256(data).digest()
+    if version == 0:
+        return multihash
+    return encode_varint(1) + encode_varint(codec) + multihash
+
+
+def cid_to_str(cid: bytes) -> str:
+    """Encode binary CID, base58btc for CIDv0 and base32 for CIDv1.
+
+    Examples:
+        >>> cid_to_str(make_cid(b"..."))
+        "QmRf22bZar3WKmojipms22PkXH1MZGmvsqzQtuSvQE3uhm"
+    """
+    if cid[0] == SHA2_256:
+        number = int.from_bytes(cid, "big")
+        result = ""
+        while number:
+            number, digit = divmod(number, 58)
+            result = BASE58_ALPHABET[digit] + result
+        return result
+    return "b" + base64.b32encode(cid).decode().lower().rstrip("=")
+
+
+class Link(NamedTuple):
+    """Link to child block."""
+
+    cid: bytes
+    # Size of block and all its descendants
+    tsize: int
+    # Size of file data in block and all its descendants
+    filesize: int
+
+
+def encode_file_node(links: list[Link], data: bytes = b"", filesize: int | None = None) -> bytes:
+    """Encode dag-pb node with UnixFS file data.
+
+    Args:
+        links: Child blocks.
+        data: File data stored in node itself.
+        filesize: File size, sum of data and child file sizes by default.
+
+    Returns:
+        bytes: dag-pb block.
+    """
+    if filesize is None:
+        filesize = len(data) + sum(link.filesize for link in links)
+    unixfs = _varint_field(1, 2)  # Type: File
+    if data:
+        unixfs += _bytes_field(2, data)
+    unixfs += _varint_field(3, filesize)
+    unixfs += b"".join(_varint_field(4, link.filesize) for link in links)
+    # Links are encoded before data, as go-merkledag does
+    encoded_links = b"".join(
+        _bytes_field(
+            2, _bytes_field(1, link.cid) + _bytes_field(2, b"") + _varint_field(3, link.tsize)
+        )
+        for link in links
+    )
+    return encoded_links + _bytes_field(1, unixfs)
+
+
+def fixed_size_chunks(stream: Iterable[bytes], size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Split stream of bytes to chunks of `size` bytes, the last chunk may be smaller."""
+    buffer = bytearray()
+    for data in stream:
+        view = memoryview(data)
+        if buffer:
+            needed = size - len(buffer)
+            buffer += view[:needed]
+            view = view[needed:]
+            if len(buffer) < size:
+                continue
+            yield bytes(buffer)
+            buffer.clear()
+        while len(view) >= size:
+            yield bytes(view[:size])
+            view = view[size:]
+        buffer += view
+    if buffer:
+        yield bytes(buffer)
+
+
+def _degree(polynomial: int) -> int:
+    return polynomial.bit_length() - 1
+
+
+def _mod(value: int, polynomial: int) -> int:
+    degree = _degree(polynomial)
+    while value.bit_length() - 1 >= degree:
+        value ^= polynomial << (value.bit_length() - 1 - degree)
+    return value
+
+
+@lru_cache
+def _rabin_tables(polynomial: int, window: int) -> tuple[list[int], list[int]]:
+    """Tables to remove byte leaving window and to reduce digest modulo polynomial."""
+    out_table = []
+    for byte in range(256):
+        digest = _mod(byte, polynomial)
+        for _ in range(window - 1):
+            digest = _mod(digest << 8, polynomial)
+        out_table.append(digest)
+    degree = _degree(polynomial)
+    mod_table = [_mod(byte << degree, polynomial) | byte << degree for byte in range(256)]
+    return out_table, mod_table
+
+
+def rabin_chunks(
+    stream: Iterable[bytes],
+    average: int = CHUNK_SIZE,
+    minimum: int | None = None,
+    maximum: int | None = None,
+    polynomial: int = RABIN_POLYNOMIAL,
+    window: int = RABIN_WINDOW,
+) -> Iterator[bytes]:
+    """Split stream of bytes to content-defined chunks.
+
+    A chunk ends where Rabin fingerprint of the last `window` bytes has
+    `log2(average)` low zero bits, so inserting data only changes chunks near
+    the insertion. Minimum and maximum default to `average / 3` and
+    `average * 1.5`, as for `ipfs add --chunker rabin`, but boundaries are not
+    guaranteed to match it, so such DAGs should be uploaded as CAR.
+
+    Args:
+        stream: Stream of bytes.
+        average: Average chunk size, must be power of two.
+        minimum: Minimum chunk size.
+        maximum: Maximum chunk size.
+        polynomial: Irreducible polynomial for fingerprint.
+        window: Fingerprint window size.
+
+    Returns:
+        Iterator of chunks.
+    """
+    if average & (average - 1):
+        raise ValueError("Average chunk size must be power of two")
+    minimum = max(minimum if minimum is not None else average // 3, window)
+    maximum = maximum if maximum is not None else average + average // 2
+    mask = average - 1
+    out_table, mod_table = _rabin_tables(polynomial, window)
+    shift = _degree(polynomial) - 8
+
+    buffer = bytearray()
+    for data in stream:
+        view = memoryview(data)
+        while view:
+            if len(buffer) < minimum - window:
+                # Bytes before the last window of minimal chunk don't affect the boundary
+                skipped = min(minimum - window - len(buffer), len(view))
+                buffer += view[:skipped]
+                view = view[skipped:]
+                if not view:
+                    break
+            # Fingerprint depends only on the last window, so it is restored from the
+            # end of buffer. Zeros before it don't change fingerprint.
+            hashed_from = max(len(buffer) - window, minimum - window)
+            tail = bytes(buffer[hashed_from:])
+            data = bytes(window) + tail + bytes(view)
+            new = window + len(tail)
+            # Indexes of bytes completing minimal and maximal chunk
+            check_from = new + max(minimum - len(buffer) - 1, 0)
+            last = new + maximum - len(buffer) - 1
+            digest = 0
+            end = None
+            for index in range(window, len(data)):
+                digest ^= out_table[data[index - window]]
+                digest = ((digest << 8) | data[index]) ^ mod_table[digest >> shift]
+                if index >= check_from and (not digest & mask or index >= last):
+                    end = index - new + 1
+                    break
+            if end is None:
+                buffer += view
+                break
+            buffer += view[:end]
+            view = view[end:]
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+class FileImporter:
+    """Build UnixFS file DAG from chunks."""
+
+    def __init__(
+        self,
+        cid_version: int = 0,
+        raw_leaves: bool | None = None,
+        max_links: int = MAX_LINKS,
+        executor: Executor | None = None,
+        on_block: BlockCallback | None = None,
+    ) -> None:
+        """Build UnixFS file DAG from chunks.
+
+        Examples:
+            >>> importer = FileImporter()
+            >>> for chunk in fixed_size_chunks(open("README.md", "rb")):
+            >>>     importer.add(chunk)
+            >>> importer.finish()
+            "QmedsYWGvd5DWqwn6Ev5ow5pSgdqDtzsvcDGWQMa1gokEb"
+
+        Args:
+            cid_version: CID version, 0 or 1.
+            raw_leaves: Store chunks as raw blocks, by default only for CIDv1, as `ipfs add` does.
+            max_links: Maximum number of links in a node.
+            executor: Pool to hash chunks in, chunks are hashed inline if `None`.
+            on_block: Called with CID and data of every block, in DAG order.
+        """
+        self.cid_version = cid_version
+        self.raw_leaves = cid_version == 1 if raw_leaves is None else raw_leaves
+        self.max_links = max_links
+        self.executor = executor
+        self.on_block = on_block
+        self.levels: list[list[Link]] = []
+        self.pending: deque[Future[tuple[Link, bytes]]] = deque()
+        self.max_pending = 2 * (os.cpu_count() or 1)
+        self.leaves = 0
+        self.root: bytes | None = None
+
+    def _leaf(self, chunk: bytes) -> tuple[Link, bytes]:
+        if self.raw_leaves:
+            return Link(make_cid(chunk, 1, RAW), len(chunk), len(chunk)), chunk
+        block = encode_file_node([], chunk)
+        return Link(make_cid(block, self.cid_version), len(block), len(chunk)), block
+
+    def _emit(self, link: Link, block: bytes) -> None:
+        if self.on_block is not None:
+            self.on_block(link.cid, block)
+
+    def _push(self, level: int, link: Link) -> None:
+        """Add link to level, turning full level to a node of the next level."""
+        if level == len(self.levels):
+            self.levels.append([])
+        self.levels[level].append(link)
+        if len(self.levels[level]) == self.max_links:
+            self._push(level + 1, self._node(self.levels[level]))
+            self.levels[level] = []
+
+    def _node(self, links: list[Link]) -> Link:
+        block = encode_file_node(links)
+        link = Link(
+            make_cid(block, self.cid_version),
+            len(block) + sum(link.tsize for link in links),
+            sum(link.filesize for link in links),
+        )
+        self._emit(link, block)
+        return link
+
+    def _add_leaf(self, link: Link, block: bytes) -> None:
+        self._emit(link, block)
+        self._push(0, link)
+        self.leaves += 1
+
+    def add(self, chunk: bytes) -> None:
+        """Add next chunk of file."""
+        if self.executor is None:
+            self._add_leaf(*self._leaf(chunk))
+            return
+        self.pending.append(self.executor.submit(self._leaf, chunk))
+        # Limit chunks in flight, so memory usage stays constant
+        while len(self.pending) > self.max_pending:
+            self._add_leaf(*self.pending.popleft().result())
+
+    def finish(self) -> str:
+        """Build the rest of DAG.
+
+        Returns:
+            str: Root CID.
+        """
+        while self.pending:
+            self._add_leaf(*self.pending.popleft().result())
+        if not self.leaves:
+            self._add_leaf(*self._leaf(b""))
+        level = 0
+        while True:
+            links = self.levels[level]
+            if level == len(self.levels) - 1 and len(links) == 1:
+                self.root = links[0].cid
+                return cid_to_str(self.root)
+            if links:
+                self.levels[level] = []
+                self._push(level + 1, self._node(links))
+            level += 1
+
+
+def iter_file(file: BinaryIO, size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Read file by blocks of `size` bytes."""
+    while data := file.read(size):
+        yield data
+
+
+def import_chunks(
+    chunks: Iterable[bytes],
+    cid_version: int = 0,
+    raw_leaves: bool | None = None,
+    executor: Executor | None = None,
+    on_block: BlockCallback | None = None,
+) -> str:
+    """Build UnixFS file DAG from chunks.
+
+    Examples:
+        >>> import_chunks(fixed_size_chunks([b"test"]))
+        "QmRf22bZar3WKmojipms22PkXH1MZGmvsqzQtuSvQE3uhm"
+
+    Args:
+        chunks: File chunks, see `fixed_size_chunks` and `rabin_chunks`.
+        cid_version: CID version, 0 or 1.
+        raw_leaves: Store chunks as raw blocks, by default only for CIDv1.
+        executor: Pool to hash chunks in.
+        on_block: Called with CID and data of every block.
+
+    Returns:
+        str: Root CID.
+    """
+    importer = FileImporter(cid_version, raw_leaves, executor=executor, on_block=on_block)
+    for chunk in chunks:
+        importer.add(chunk)
+    return importer.finish()
+
+
+def bytes_cid(data: bytes, cid_version: int = 0) -> str:
+    """Get CID of bytes, as `ipfs add` with default chunker computes it."""
+    return import_chunks(fixed_size_chunks([data]), cid_version)
+
+
+def file_cid(path: str, cid_version: int = 0, executor: Executor | None = None) -> str:
+    """Get CID of file, as `ipfs add` with default chunker computes it."""
+    with open(path, "rb") as file:
+        return import_chunks(fixed_size_chunks(iter_file(file)), cid_version, executor=executor)
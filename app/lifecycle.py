@@ -0,0 +1,199 @@
+"""Worker warm-up and graceful draining.
+
+After startup the worker warms up in background: the database pool is
+filled, connections to IPFS cluster peers are opened and one round of
+bcrypt and JWT loads their lazily imported backends. `GET /ready` responds
+with 200 only after warm-up finished, so a load balancer doesn't send
+requests to a cold worker.
+
+On `SIGTERM` (see `app.server`) or on shutdown the worker starts draining:
+`GET /ready` responds with 503, new requests get 503 with
+`Connection: close`, in-flight requests and database pool checkouts are
+waited for until the deadline, then remaining requests are cancelled.
+"""
+
+import asyncio
+from time import monotonic
+from typing import Callable
+from uuid import uuid4
+
+from loguru import logger
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from .ipfs import IPFSClient
+
+DRAIN_POLL_INTERVAL = 0.05
+# Seconds to wait for cancelled requests to finish
+CANCEL_TIMEOUT = 1
+WARM_UP_RETRY_DELAY = 1
+WARM_UP_MAX_RETRY_DELAY = 30
+
+
+def prefill_pool(engine: Engine, should_stop: Callable[[], bool] = lambda: False) -> int:
+    """Open connections up to pool size, they stay in pool when closed.
+
+    Pools without fixed size (e.g. SQLite `NullPool`) get one connection,
+    which still checks that database is reachable.
+
+    Args:
+        engine: Database engine.
+        should_stop: Checked before every connection, stops filling if `True`.
+
+    Returns:
+        int: Number of connections opened.
+    """
+    size_of = getattr(engine.pool, "size", None)
+    size: int = size_of() if callable(size_of) else 1
+    connections = []
+    try:
+        for _ in range(size):
+            if should_stop():
+                break
+            connection = engine.connect()
+            connection.exec_driver_sql("SELECT 1")
+            connections.append(connection)
+    finally:
+        for connection in connections:
+            connection.close()
+    return len(connections)
+
+
+def warm_up_crypto(should_stop: Callable[[], bool] = lambda: False) -> None:
+    """Run one round of bcrypt and JWT to load their backends.
+
+    Args:
+        should_stop: Checked between steps, stops warming up if `True`.
+    """
+    from .models.token import UserToken, decode, encode
+    from .security import get_password_hash
+
+    if should_stop():
+        return
+    get_password_hash(uuid4().hex)
+    if should_stop():
+        return
+    UserToken.parse(UserToken(user=uuid4()).issue_access_token({}))
+    decode(encode({"sub": uuid4().hex}))
+
+
+async def warm_up(engine: Engine, ipfs: IPFSClient, drainer: "Drainer") -> None:
+    """Warm up database pool, IPFS connections and crypto backends, then mark worker ready.
+
+    Failed warm-up is repeated with backoff, worker is not ready until it succeeds.
+    Warm-up stops as soon as the worker starts draining: cancelling this task
+    doesn't stop its threads, so they check the flag between steps and don't
+    keep an exiting worker alive.
+    """
+
+    def should_stop() -> bool:
+        return drainer.draining
+
+    delay = WARM_UP_RETRY_DELAY
+    while True:
+        if should_stop():
+            return
+        started = monotonic()
+        try:
+            connections, _, _ = await asyncio.gather(
+                asyncio.to_thread(prefill_pool, engine, should_stop),
+                ipfs.warm_up(),
+                asyncio.to_thread(warm_up_crypto, should_stop),
+            )
+        except Exception:
+            logger.exception(f"Warm-up failed, retrying in {delay}s")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, WARM_UP_MAX_RETRY_DELAY)
+            continue
+        break
+    elapsed = monotonic() - started
+    logger.info(f"Warmed up in {elapsed:.2f}s, {connections} database connections")
+    drainer.ready = not drainer.draining
+
+
+class Drainer:
+    """Readiness and in-flight requests of a worker."""
+
+    def __init__(self) -> None:
+        """Readiness and in-flight requests of a worker."""
+        self.ready = False
+        self.deadline: float | None = None
+        self.requests: set[asyncio.Task[object]] = set()
+
+    def reset(self) -> None:
+        """Accept requests again, called on startup."""
+        self.ready = False
+        self.deadline = None
+
+    @property
+    def draining(self) -> bool:
+        """Whether the worker stopped accepting requests."""
+        return self.deadline is not None
+
+    def start_draining(self, timeout: float) -> None:
+        """Stop accepting requests, the deadline is counted from the first call."""
+        if self.deadline is None:
+            logger.info(f"Draining {len(self.requests)} requests")
+            self.deadline = monotonic() + timeout
+            self.ready = False
+
+    async def drain(self, timeout: float, engine: Engine | None = None) -> None:
+        """Wait for in-flight requests and pool checkouts until the deadline.
+
+        Requests still running at the deadline are cancelled.
+
+        Args:
+            timeout: Seconds to wait, ignored if draining already started.
+            engine: Database engine to wait for checked out connections of.
+        """
+        self.start_draining(timeout)
+        assert self.deadline is not None
+        while self.requests and monotonic() < self.deadline:
+            await asyncio.sleep(DRAIN_POLL_INTERVAL)
+        if self.requests:
+            logger.warning(f"Cancelling {len(self.requests)} requests after drain deadline")
+            for task in self.requests:
+                task.cancel()
+            await asyncio.wait(list(self.requests), timeout=CANCEL_TIMEOUT)
+        checkedout = getattr(engine.pool, "checkedout", None) if engine is not None else None
+        while callable(checkedout) and checkedout() > 0 and monotonic() < self.deadline:
+            await asyncio.sleep(DRAIN_POLL_INTERVAL)
+
+
+class DrainMiddleware:
+    """Track in-flight requests and reject new ones while draining.
+
+    Pure ASGI middleware, so the endpoint runs in the tracked task.
+    """
+
+    def __init__(self, app: ASGIApp, drainer: Drainer) -> None:
+        """Track in-flight requests and reject new ones while draining.
+
+        Args:
+            app: ASGI app.
+            drainer: Drainer of the worker.
+        """
+        self.app = app
+        self.drainer = drainer
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Handle request."""
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if self.drainer.draining:
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": 503,
+                    "headers": [(b"connection", b"close"), (b"content-length", b"0")],
+                }
+            )
+            await send({"type": "http.response.body", "body": b""})
+            return
+        task: asyncio.Task[object] = asyncio.current_task()  # type: ignore[assignment]
+        self.drainer.requests.add(task)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.drainer.requests.discard(task)
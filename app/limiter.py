@@ -0,0 +1,11 @@
+"""Module containing rate limiter instance.
+
+A separate file is needed so routers can use it without importing the app.
+"""
+
+from slowapi import Limiter
+from slowapi.util import get_remote_address
+
+limiter = Limiter(key_func=get_remote_address)
+
+__all__ = ["limiter"]
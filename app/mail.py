@@ -0,0 +1,248 @@
+"""Outbound mail queue.
+
+Messages are written to a spool directory before they are queued, so they
+survive restarts: on startup a queue picks up files left by dead processes.
+Sender tasks take messages in batches and send each batch over a long-lived
+SMTP connection owned by the task, reconnecting only when the server drops it.
+"""
+
+import asyncio
+import json
+import os
+import smtplib
+from dataclasses import asdict, dataclass, field
+from email.message import EmailMessage
+from pathlib import Path
+from typing import Coroutine
+from uuid import uuid4
+
+from fastapi import status
+from loguru import logger
+
+from .exceptions import MailQueueFullException
+
+
+@dataclass
+class Mail:
+    """Outgoing mail."""
+
+    to: str
+    subject: str
+    body: str
+    id: str = field(default_factory=lambda: uuid4().hex)
+    attempts: int = 0
+
+
+@dataclass
+class SMTPConfig:
+    """SMTP server connection parameters."""
+
+    host: str
+    port: int = 25
+    username: str | None = None
+    password: str | None = None
+    starttls: bool = False
+    sender: str = "noreply@localhost"
+
+
+class SMTPConnection:
+    """Reusable SMTP connection, its methods are blocking and run in a thread."""
+
+    def __init__(self, config: SMTPConfig) -> None:
+        """Reusable SMTP connection.
+
+        Args:
+            config: SMTP server parameters.
+        """
+        self.config = config
+        self.smtp: smtplib.SMTP | None = None
+
+    def ensure_connected(self) -> smtplib.SMTP:
+        """Check that connection is alive, reconnect if not."""
+        if self.smtp is not None:
+            try:
+                if self.smtp.noop()[0] == 250:
+                    return self.smtp
+            except (smtplib.SMTPException, OSError):
+                pass
+            self.close()
+        smtp = smtplib.SMTP(self.config.host, self.config.port, timeout=30)
+        if self.config.starttls:
+            smtp.starttls()
+        if self.config.username is not None and self.config.password is not None:
+            smtp.login(self.config.username, self.config.password)
+        self.smtp = smtp
+        return smtp
+
+    def send_batch(self, batch: list[Mail]) -> tuple[list[Mail], list[Mail]]:
+        """Send mails over one connection.
+
+        Returns:
+            Finished mails (sent or rejected by server) and mails that should be retried.
+        """
+        done: list[Mail] = []
+        try:
+            smtp = self.ensure_connected()
+            for mail in batch:
+                message = EmailMessage()
+                message["From"] = self.config.sender
+                message["To"] = mail.to
+                message["Subject"] = mail.subject
+                message.set_content(mail.body)
+                try:
+                    smtp.send_message(message)
+                except (smtplib.SMTPRecipientsRefused, smtplib.SMTPDataError) as e:
+                    if isinstance(e, smtplib.SMTPDataError) and e.smtp_code < 500:
+                        raise
+                    logger.error(f"Mail {mail.id} to {mail.to} rejected: {e}")
+                done.append(mail)
+        except (smtplib.SMTPException, OSError):
+            logger.exception("Cannot send mail batch")
+            self.close()
+        return done, [mail for mail in batch if mail not in done]
+
+    def close(self) -> None:
+        """Close connection."""
+        if self.smtp is None:
+            return
+        try:
+            self.smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            self.smtp.close()
+        self.smtp = None
+
+
+class MailQueue:
+    """Durable outbound mail queue."""
+
+    def __init__(
+        self,
+        config: SMTPConfig,
+        spool_dir: str,
+        max_size: int = 1000,
+        connections: int = 2,
+        batch_size: int = 50,
+        max_attempts: int = 5,
+        retry_delay: float = 5,
+    ) -> None:
+        """Durable outbound mail queue.
+
+        Examples:
+            >>> queue = MailQueue(SMTPConfig("127.0.0.1", 25), "mail-spool")
+            >>> await queue.start()
+            >>> await queue.send(Mail("cofob@riseup.net", "Hello", "Hello from cofob!"))
+            >>> await queue.stop()
+
+        Args:
+            config: SMTP server parameters.
+            spool_dir: Directory to store pending mails.
+            max_size: Maximum number of queued mails, `send` waits when it is reached.
+            connections: Number of SMTP connections (and sender tasks).
+            batch_size: Maximum number of mails sent in a row over one connection.
+            max_attempts: Drop mail after this many failed attempts.
+            retry_delay: Delay before the first retry, doubled on every attempt.
+        """
+        self.config = config
+        self.spool = Path(spool_dir)
+        self.queue: asyncio.Queue[Mail] = asyncio.Queue(max_size)
+        self.connections = connections
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.tasks: set[asyncio.Task[None]] = set()
+
+    def _spool_path(self, mail: Mail, pid: int | None = None) -> Path:
+        return self.spool / f"{mail.id}.{pid or os.getpid()}.json"
+
+    def _write_spool(self, mail: Mail) -> None:
+        path = self._spool_path(mail)
+        temp = path.with_suffix(".tmp")
+        temp.write_text(json.dumps(asdict(mail)))
+        os.replace(temp, path)
+
+    def _remove_spool(self, mail: Mail) -> None:
+        self._spool_path(mail).unlink(missing_ok=True)
+
+    def _claim_spool(self) -> list[Mail]:
+        """Take over mails left by processes that are not running anymore."""
+        mails = []
+        for path in self.spool.glob("*.json"):
+            pid = path.name.split(".")[1]
+            if int(pid) != os.getpid():
+                try:
+                    os.kill(int(pid), 0)
+                    continue
+                except ProcessLookupError:
+                    pass
+                except PermissionError:
+                    continue
+            try:
+                mail = Mail(**json.loads(path.read_text()))
+                os.replace(path, self._spool_path(mail))
+            except FileNotFoundError:
+                # Claimed by another worker
+                continue
+            mails.append(mail)
+        return mails
+
+    async def start(self) -> None:
+        """Recover spooled mails and start sender tasks."""
+        self.spool.mkdir(parents=True, exist_ok=True)
+        recovered = await asyncio.to_thread(self._claim_spool)
+        if recovered:
+            logger.info(f"Recovered {len(recovered)} mails from spool")
+        for mail in recovered:
+            self._spawn(self.queue.put(mail))
+        for _ in range(self.connections):
+            self._spawn(self._sender())
+
+    async def stop(self) -> None:
+        """Stop sender tasks, queued mails stay in spool until next start."""
+        tasks = list(self.tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def send(self, mail: Mail, timeout: float = 5) -> None:
+        """Queue mail for sending.
+
+        Raises:
+            MailQueueFullException: If the queue stays full for `timeout` seconds.
+        """
+        await asyncio.to_thread(self._write_spool, mail)
+        try:
+            await asyncio.wait_for(self.queue.put(mail), timeout)
+        except asyncio.TimeoutError:
+            await asyncio.to_thread(self._remove_spool, mail)
+            raise MailQueueFullException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    def _spawn(self, coroutine: Coroutine[object, object, None]) -> None:
+        task = asyncio.create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _retry(self, mail: Mail) -> None:
+        await asyncio.sleep(self.retry_delay * 2 ** (mail.attempts - 1))
+        await self.queue.put(mail)
+
+    async def _sender(self) -> None:
+        connection = SMTPConnection(self.config)
+        try:
+            while True:
+                batch = [await self.queue.get()]
+                while len(batch) < self.batch_size and not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                done, failed = await asyncio.to_thread(connection.send_batch, batch)
+                for mail in done:
+                    await asyncio.to_thread(self._remove_spool, mail)
+                for mail in failed:
+                    mail.attempts += 1
+                    if mail.attempts >= self.max_attempts:
+                        logger.error(f"Mail {mail.id} to {mail.to} dropped after retries")
+                        await asyncio.to_thread(self._remove_spool, mail)
+                    else:
+                        self._spawn(self._retry(mail))
+                if done:
+                    logger.info(f"Processed {len(done)} mails")
+        finally:
+            await asyncio.to_thread(connection.close)
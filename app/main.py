@@ -3,57 +3,186 @@
 Middlewares, routers must be connected here.
 """
 
-from os import environ
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
 
+from fastapi import FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
 from loguru import logger
 
-from .app import app, limiter
-from .routers import auth
-
-# Setup logger
-if environ.get("LOG_FILE") is not None:
-    logger.add(
-        environ.get("LOG_FILE", "logs.txt"),
-        rotation="100 MB",
-        retention="2 days",
-        backtrace=True,
-        diagnose=True,
-    )
-
-# Check for required environment variables
-required_env = ["DB_URL", "IPFS_URL", "SECRET"]
-for env in required_env:
-    if environ.get(env) is None:
-        logger.error(f"{env} is not present in environment variables. Exiting...")
-        exit(1)
-
-
-origins = [environ.get("ORIGIN", "*")]
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+from .audit import audit_log
+from .availability import name_index, refresh_loop
+from .cache import user_cache
+from .changefeed import UserChangefeed
+from .database import dispose_engine, get_engine
+from .exceptions import NotReadyException, register_exception_handlers
+from .ipfs import IPFSClient
+from .lifecycle import Drainer, DrainMiddleware, warm_up
+from .limiter import limiter
+from .mail import MailQueue, SMTPConfig
+from .profiling import ProfilerMiddleware, Sampler
+from .revocations import RevocationFeed
+from .routers import auth, debug, files, users
+from .settings import Settings, configure, get_settings
+from .tracing import (
+    BatchExporter,
+    TracingMiddleware,
+    get_sink,
+    instrument_engine,
+    tracer,
 )
+from .uploads import UploadQueue
 
 
-# Rate limit
-app.state.limiter = limiter
-
-
-@app.get("/", response_model=str)
 async def hello_world() -> str:
     """Hello world endpoint."""
     return "Hello world!"
 
 
-app.include_router(auth.router)
-
+async def ready(request: Request) -> str:
+    """Readiness probe, responds with 200 only after warm-up and before draining."""
+    if not request.app.state.drainer.ready:
+        raise NotReadyException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+    return "Ready"
+
+
+def create_app(settings: Settings | None = None) -> FastAPI:
+    """Create and configure FastAPI app.
+
+    Nothing expensive happens here: database engine and IPFS client are
+    created in lifespan, so the app can be built before forking workers.
+
+    Args:
+        settings: App settings, by default read from environment variables.
+
+    Returns:
+        FastAPI: Configured app.
+    """
+    if settings is None:
+        settings = get_settings()
+    configure(settings)
+
+    # Setup logger
+    if settings.log_file is not None:
+        logger.add(
+            settings.log_file,
+            rotation="100 MB",
+            retention="2 days",
+            backtrace=True,
+            diagnose=True,
+        )
+
+    app = FastAPI()
+    app.state.settings = settings
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=[settings.origin],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
 
-@app.on_event("startup")
-def on_start() -> None:
-    """Started FastAPI event."""
-    logger.info("Started")
+    # Sampling profiler, see `app.profiling`
+    sampler = Sampler(settings.profile_dir, flush_interval=settings.profile_interval)
+    app.state.sampler = sampler
+    app.add_middleware(ProfilerMiddleware, sampler=sampler)
+    # Tracing, see `app.tracing`
+    app.add_middleware(TracingMiddleware)
+    # Readiness and draining, see `app.lifecycle`
+    drainer = Drainer()
+    app.state.drainer = drainer
+    app.add_middleware(DrainMiddleware, drainer=drainer)
+
+    # Rate limit
+    app.state.limiter = limiter
+
+    register_exception_handlers(app)
+
+    app.get("/", response_model=str)(hello_world)
+    app.get("/ready", response_model=str)(ready)
+    app.include_router(auth.router)
+    app.include_router(users.router)
+    app.include_router(files.router)
+    app.include_router(debug.router)
+
+    async def startup() -> None:
+        engine = get_engine()
+        sampler.start()
+        if settings.trace_export is not None:
+            tracer.start(BatchExporter(get_sink(settings.trace_export)), settings.trace_sample_rate)
+            instrument_engine(engine)
+        user_cache.max_size = settings.user_cache_size
+        app.state.user_changefeed = None
+        if settings.user_cache_size > 0 and engine.dialect.name == "cockroachdb":
+            app.state.user_changefeed = UserChangefeed(engine, user_cache, names=name_index)
+            app.state.user_changefeed.start()
+        audit_log.start(engine, settings.audit_spool, settings.audit_retention)
+        app.state.revocations = RevocationFeed(engine, 60 * settings.access_token_expire_minutes)
+        app.state.mail = None
+        if settings.smtp_host is not None:
+            smtp = SMTPConfig(
+                host=settings.smtp_host,
+                port=settings.smtp_port,
+                username=settings.smtp_username,
+                password=settings.smtp_password,
+                starttls=settings.smtp_starttls,
+                sender=settings.mail_from,
+            )
+            app.state.mail = MailQueue(smtp, settings.mail_spool)
+            await app.state.mail.start()
+        ipfs = IPFSClient(
+            settings.ipfs_url, settings.ipfs_auth, hedge_percentile=settings.ipfs_hedge_percentile
+        )
+        app.state.ipfs = await ipfs.__aenter__()
+        app.state.uploads = None
+        if settings.upload_spool is not None:
+            app.state.uploads = UploadQueue(
+                app.state.ipfs, engine, settings.upload_spool, workers=settings.upload_workers
+            )
+            await app.state.uploads.start()
+        logger.info("Started")
+
+    async def shutdown() -> None:
+        if app.state.uploads is not None:
+            await app.state.uploads.stop()
+        await app.state.ipfs.__aexit__(None, None, None)
+        if app.state.mail is not None:
+            await app.state.mail.stop()
+        if app.state.user_changefeed is not None:
+            app.state.user_changefeed.stop()
+        await app.state.revocations.stop()
+        await audit_log.stop()
+        dispose_engine()
+        sampler.stop()
+        tracer.stop()
+        logger.info("Stopped")
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+        await startup()
+        tasks = [asyncio.create_task(warm_up(get_engine(), app.state.ipfs, drainer))]
+        if settings.name_index_refresh > 0:
+            # Index of taken names, see `app.availability`
+            tasks.append(
+                asyncio.create_task(
+                    refresh_loop(name_index, get_engine(), settings.name_index_refresh)
+                )
+            )
+        try:
+            yield
+        finally:
+            await drainer.drain(settings.drain_timeout, get_engine())
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            name_index.reset()
+            await shutdown()
+            # Apps without lifespan (e.g. `TestClient` used without `with`) serve requests
+            drainer.reset()
+
+    # FastAPI of this version has no `lifespan` argument
+    app.router.lifespan_context = lifespan
+
+    return app
@@ -1,4 +1,7 @@
 """Module containing sqlmodel database models."""
 
+from .audit import *  # noqa
+from .pin import *  # noqa
+from .revocation import *  # noqa
 from .token import *  # noqa
 from .user import *  # noqa
@@ -0,0 +1,47 @@
+"""Module with audit log database models."""
+
+from enum import Enum
+from uuid import UUID, uuid4
+
+from sqlalchemy import Index
+from sqlmodel import Field, SQLModel
+
+from app.utils import int_time
+
+DAY = 24 * 60 * 60
+
+
+class AuditKind(str, Enum):
+    """Authentication event kind."""
+
+    signup = "signup"
+    login = "login"
+    login_failed = "login_failed"
+    refresh = "refresh"
+
+
+def int_day() -> int:
+    """Get number of days since epoch."""
+    return int_time() // DAY
+
+
+class AuditEvent(SQLModel, table=True):
+    """Authentication event, written in batches by `app.audit.AuditLog`.
+
+    Rows are clustered by `day`, so old days are removed as contiguous key
+    ranges (see `app.audit.prune`). `user` is not a foreign key, events stay
+    after the user is deleted.
+    """
+
+    __tablename__ = "audit_event"
+    __table_args__ = (Index("ix_audit_event_user_created_at", "user", "created_at"),)
+
+    day: int = Field(default_factory=int_day, primary_key=True)
+    id: UUID = Field(default_factory=uuid4, primary_key=True)
+    created_at: int = Field(default_factory=int_time, nullable=False)
+    kind: AuditKind = Field(max_length=16, nullable=False)
+    user: UUID | None = Field(default=None)
+    # Nickname as entered, failed logins may have no user
+    nickname: str | None = Field(default=None, max_length=64)
+    ip: str | None = Field(default=None, max_length=45)
+    detail: str | None = Field(default=None, max_length=64)
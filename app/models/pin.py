@@ -0,0 +1,49 @@
+"""Module with pin-related database models."""
+
+from enum import Enum
+from uuid import UUID, uuid4
+
+from sqlmodel import Field, SQLModel
+
+from app.utils import int_time
+
+
+class PinStatus(str, Enum):
+    """Pin state in cluster, updated by `app.pins.reconcile`."""
+
+    queued = "queued"
+    pinning = "pinning"
+    pinned = "pinned"
+    error = "error"
+    missing = "missing"
+
+
+class Pin(SQLModel, table=True):
+    """CID pinned to cluster on behalf of a user.
+
+    The same CID may be pinned by several users, it stays in cluster while
+    at least one of them keeps it.
+    """
+
+    cid: str = Field(primary_key=True, max_length=64)
+    owner: UUID = Field(primary_key=True, nullable=False, foreign_key="user.uuid", index=True)
+    name: str | None = Field(default=None, max_length=255)
+    size: int | None = Field(default=None)
+    created_at: int = Field(default_factory=int_time, nullable=False)
+    status: PinStatus = Field(default=PinStatus.queued, max_length=16, nullable=False)
+    # Start of the last reconciliation which found this CID in cluster
+    checked_at: int | None = Field(default=None)
+
+
+class UploadReservation(SQLModel, table=True):
+    """Quota space held by an upload in progress, see `app.pins.reserve_space`.
+
+    Reservations of a process which died are ignored after `expires_at`.
+    """
+
+    __tablename__ = "upload_reservation"
+
+    id: UUID = Field(default_factory=uuid4, primary_key=True)
+    owner: UUID = Field(nullable=False, foreign_key="user.uuid", index=True)
+    size: int = Field(nullable=False)
+    expires_at: int = Field(nullable=False)
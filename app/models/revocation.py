@@ -0,0 +1,33 @@
+"""Module with token revocation database models."""
+
+from enum import Enum
+from uuid import UUID
+
+from sqlmodel import Field, SQLModel
+
+from app.utils import int_time
+
+
+class RevocationKind(str, Enum):
+    """What a revocation event invalidates."""
+
+    # Refresh token `jti` deleted, access tokens with `sid` equal to it are revoked
+    token = "token"
+    # User disabled, all tokens of `user` issued not later than `watermark` are revoked
+    user_disabled = "user_disabled"
+    # All sessions of `user` ended, tokens issued not later than `watermark` are revoked
+    user_revoked = "user_revoked"
+
+
+class Revocation(SQLModel, table=True):
+    """Revocation event, streamed to subscribers by `app.revocations`.
+
+    Written in the same transaction as the change it reports.
+    """
+
+    seq: int | None = Field(default=None, primary_key=True)
+    created_at: int = Field(default_factory=int_time, nullable=False, index=True)
+    kind: RevocationKind = Field(max_length=16, nullable=False)
+    user: UUID = Field(nullable=False)
+    jti: UUID | None = Field(default=None)
+    watermark: int | None = Field(default=None)
@@ -1,30 +1,47 @@
 """Module with jwt token related database models."""
 
+import asyncio
+import hmac
+import json
 from abc import ABCMeta, abstractmethod
+from base64 import urlsafe_b64decode, urlsafe_b64encode
 from calendar import timegm
 from datetime import datetime, timedelta
 from enum import Enum
-from os import environ
-from typing import Type, TypeVar
+from functools import lru_cache
+from hashlib import sha256
+from typing import Sequence, Type, TypeVar
 from uuid import UUID, uuid4
 
-from jose import JWTError, jwt
 from loguru import logger
-from sqlmodel import Field, Session, SQLModel
+from sqlmodel import Field, Session, SQLModel, col, select
 
 from app.exceptions import JWTRevokedException, JWTValidationError
-from app.models.user import User
 
+from .. import cache, queries
 from ..database import get_engine_session
+from ..scopes import scope_claims, user_scopes
+from ..settings import get_settings
+from ..tracing import traced
+from ..utils import SingleFlight
+from .user import User
 
 ALGORITHM = "HS256"
-SECRET_KEY = environ["SECRET"]
 REFRESH_TOKEN_EXPIRE_DAYS = 90
-ACCESS_TOKEN_EXPIRE_MINUTES = 15
+# Tokens per `IN (...)` query of `UserToken.introspect`, below SQLite variables limit
+INTROSPECT_CHUNK = 500
 
 ParsedJWTType = dict[str, str | int | float]
 T = TypeVar("T", bound="TokenABC")
 
+# Claim names of compact access tokens, presence of `t` marks compact profile
+COMPACT_CLAIMS = {"typ": "t", "sid": "i", "scp": "p", "scv": "v", "nickname": "n", "email": "m"}
+EXPANDED_CLAIMS = {short: key for key, short in COMPACT_CLAIMS.items()}
+UUID_CLAIMS = frozenset({"sub", "sid", "jti"})
+COMPACT_HEADER = "eyJhbGciOiJIUzI1NiJ9"  # {"alg":"HS256"}
+# Headers of compact and of `encode` tokens, checked without JSON parsing
+HS256_HEADERS = frozenset({COMPACT_HEADER, "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9"})
+
 
 def generate_refresh_token_expire_ts() -> int:
     """Get JWT refresh token expire timestamp."""
@@ -33,9 +50,8 @@ def generate_refresh_token_expire_ts() -> int:
 
 def generate_access_token_expire_ts() -> int:
     """Get JWT access token expire timestamp."""
-    return timegm(
-        (datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)).utctimetuple()
-    )
+    minutes = get_settings().access_token_expire_minutes
+    return timegm((datetime.utcnow() + timedelta(minutes=minutes)).utctimetuple())
 
 
 def generate_iat_ts() -> int:
@@ -43,6 +59,7 @@ def generate_iat_ts() -> int:
     return timegm(datetime.utcnow().utctimetuple())
 
 
+@traced("jwt.encode")
 def encode(data: ParsedJWTType) -> str:
     """Encode provided data to signed JWT token.
 
@@ -52,9 +69,12 @@ def encode(data: ParsedJWTType) -> str:
     Returns:
         str: JWT string.
     """
-    return jwt.encode(data, SECRET_KEY, algorithm=ALGORITHM)  # type: ignore
+    from jose import jwt
+
+    return jwt.encode(data, get_settings().secret, algorithm=ALGORITHM)  # type: ignore
 
 
+@traced("jwt.decode")
 def decode(token: str, options: dict[str, bool] = {}) -> ParsedJWTType:
     """Decode JWT token and return its data.
 
@@ -67,16 +87,150 @@ def decode(token: str, options: dict[str, bool] = {}) -> ParsedJWTType:
     Returns:
         dict: Parsed JWT data.
     """
+    from jose import JWTError, jwt
+
     try:
-        return jwt.decode(  # type: ignore
+        parsed: ParsedJWTType = jwt.decode(
             token,
-            SECRET_KEY,
+            get_settings().secret,
             algorithms=[ALGORITHM],
             options=options,
         )
     except JWTError:
         logger.exception("JWT exception")
         raise JWTValidationError(detail="JWT decode/verification error")
+    return expand(parsed)
+
+
+def b64encode(value: bytes) -> str:
+    """Encode base64url without padding, as used in JWT."""
+    return urlsafe_b64encode(value).rstrip(b"=").decode()
+
+
+def b64decode(value: str) -> bytes:
+    """Decode base64url without padding, as used in JWT."""
+    return urlsafe_b64decode(value + "=" * (-len(value) % 4))
+
+
+def compact(data: ParsedJWTType) -> ParsedJWTType:
+    """Convert claims to compact profile.
+
+    Registered `sub`, `exp`, `iat` claims keep their names, so compact
+    tokens pass the same checks. Other known claims get one letter names,
+    UUIDs are encoded as base64url of 16 bytes and `class` is dropped.
+    """
+    result: ParsedJWTType = {}
+    for key, value in data.items():
+        if key == "class":
+            continue
+        if key in UUID_CLAIMS:
+            value = b64encode(UUID(str(value)).bytes)
+        result[COMPACT_CLAIMS.get(key, key)] = value
+    return result
+
+
+def expand(data: ParsedJWTType) -> ParsedJWTType:
+    """Convert claims of compact profile back, other claims are returned as is.
+
+    Raises:
+        JWTValidationError: If UUID claim is invalid.
+    """
+    if "t" not in data:
+        return data
+    result: ParsedJWTType = {}
+    for key, value in data.items():
+        key = EXPANDED_CLAIMS.get(key, key)
+        if key in UUID_CLAIMS:
+            # Same as `UUID(bytes=...).hex`, but without creating UUID
+            raw = b64decode(value) if isinstance(value, str) and len(value) == 22 else b""
+            if len(raw) != 16:
+                raise JWTValidationError(f"{key} field is invalid")
+            value = raw.hex()
+        result[key] = value
+    return result
+
+
+@traced("jwt.encode")
+def encode_compact(data: ParsedJWTType) -> str:
+    """Encode data to signed JWT token of compact profile.
+
+    Header has only `alg`, claims are converted with `compact` and
+    serialized without whitespace. Decoded with `decode` as usual.
+    """
+    payload = b64encode(json.dumps(compact(data), separators=(",", ":")).encode())
+    signing_input = f"{COMPACT_HEADER}.{payload}"
+    mac = hmac.new(get_settings().secret.encode(), signing_input.encode(), sha256)
+    return f"{signing_input}.{b64encode(mac.digest())}"
+
+
+@lru_cache(maxsize=1)
+def prepared_mac(secret: str) -> "hmac.HMAC":
+    """HMAC with key already processed, `copy` it for every token."""
+    return hmac.new(secret.encode(), digestmod=sha256)
+
+
+def verify_signed(token: str, mac: "hmac.HMAC", now: int) -> ParsedJWTType:
+    """Verify HS256 signature and claims, same checks as `TokenBase.parse`.
+
+    Raises:
+        ValueError, KeyError, TypeError, AttributeError, JWTValidationError:
+            If token is invalid.
+    """
+    header, payload, signature = token.split(".")
+    token_mac = mac.copy()
+    token_mac.update(f"{header}.{payload}".encode())
+    if not hmac.compare_digest(token_mac.digest(), b64decode(signature)):
+        raise ValueError("signature mismatch")
+    if header not in HS256_HEADERS and json.loads(b64decode(header)).get("alg") != ALGORITHM:
+        raise ValueError("unexpected algorithm")
+    parsed = expand(json.loads(b64decode(payload)))
+    exp, iat, nbf = parsed["exp"], parsed["iat"], parsed.get("nbf", now)
+    if not (isinstance(exp, int) and isinstance(iat, int) and isinstance(nbf, int)):
+        raise ValueError("invalid timestamp")
+    if exp < now or nbf > now or not isinstance(parsed["sub"], str):
+        raise ValueError("expired or invalid sub")
+    return parsed
+
+
+# `binascii.Error` is a `ValueError`
+VERIFY_ERRORS = (ValueError, KeyError, TypeError, AttributeError, JWTValidationError)
+
+
+@traced("jwt.decode")
+def decode_signed(token: str) -> ParsedJWTType:
+    """Decode JWT token with `iat`, `exp` and `sub` claims.
+
+    Same as `decode` with these claims required, but skips generic JOSE
+    handling, which takes most of the time of `decode`.
+
+    Raises:
+        JWTValidationError: If token is invalid.
+    """
+    try:
+        return verify_signed(token, prepared_mac(get_settings().secret), generate_iat_ts())
+    except VERIFY_ERRORS:
+        raise JWTValidationError(detail="JWT decode/verification error")
+
+
+@traced("jwt.decode_batch")
+def decode_batch(tokens: Sequence[str]) -> list[ParsedJWTType | None]:
+    """Decode many JWT tokens, same checks as `TokenBase.parse`.
+
+    Args:
+        tokens: JWT token strings.
+
+    Returns:
+        list: Parsed JWT data in the same order, `None` for invalid tokens.
+    """
+    mac = prepared_mac(get_settings().secret)
+    now = generate_iat_ts()
+    results: list[ParsedJWTType | None] = []
+    for token in tokens:
+        try:
+            results.append(verify_signed(token, mac, now))
+        except VERIFY_ERRORS:
+            results.append(None)
+    return results
 
 
 class TokenTypes(Enum):
@@ -113,7 +267,7 @@ class TokenABC(SQLModel, metaclass=ABCMeta):
         """
 
     @abstractmethod
-    def issue_access_token(self, data: ParsedJWTType = {}) -> str:
+    def issue_access_token(self, data: ParsedJWTType = {}, compact: bool = False) -> str:
         """Issue JWT access token.
 
         Access token used for authorization.
@@ -125,6 +279,7 @@ class TokenABC(SQLModel, metaclass=ABCMeta):
 
         Args:
             dict: JWT data.
+            compact: Issue token of compact profile, see `encode_compact`.
 
         Returns:
             str: JWT token string.
@@ -214,7 +369,7 @@ class TokenBase(TokenABC):
         )
         return encode(to_encode)
 
-    def issue_access_token(self, data: ParsedJWTType = {}) -> str:
+    def issue_access_token(self, data: ParsedJWTType = {}, compact: bool = False) -> str:
         to_encode = data.copy()
         to_encode.update(
             {
@@ -225,7 +380,7 @@ class TokenBase(TokenABC):
                 "class": self.__class__.__name__,
             }
         )
-        return encode(to_encode)
+        return encode_compact(to_encode) if compact else encode(to_encode)
 
     @classmethod
     def cleanup(cls) -> None:
@@ -237,10 +392,7 @@ class TokenBase(TokenABC):
 
     @staticmethod
     def parse(token: str) -> ParsedJWTType:
-        return decode(
-            token,
-            {"require_iat": True, "require_exp": True, "require_sub": True},
-        )
+        return decode_signed(token)
 
     @classmethod
     def verify(cls, parsed: ParsedJWTType, typ: TokenTypes, db: Session) -> None:
@@ -253,7 +405,8 @@ class TokenBase(TokenABC):
             jti_value = parsed.get("jti")
             if jti_value is None:
                 raise JWTValidationError("jti field is not provided")
-            if db.query(cls).filter(cls.uuid == parsed["jti"]).first() is None:
+            table = cls.__table__  # type: ignore[attr-defined]
+            if not queries.token_exists(db.connection(), table, str(jti_value)):
                 raise JWTRevokedException("JWT not found.")
 
 
@@ -267,30 +420,103 @@ class UserToken(TokenBase, table=True):
         data.update({"sub": self.user.hex})
         return super().issue_refresh_token(data)
 
-    def issue_access_token(self, data: ParsedJWTType = {}) -> str:
+    def issue_access_token(self, data: ParsedJWTType = {}, compact: bool = False) -> str:
         assert self.user is not None
-        # TODO: add scopes
-        data.update({"sub": self.user.hex})
-        return super().issue_access_token(data)
+        data.update({"sub": self.user.hex, **scope_claims(user_scopes(self.user))})
+        return super().issue_access_token(data, compact)
 
     def issue_access_token_user_data(self, db: Session, data: ParsedJWTType = {}) -> str:
         """Issue access token with additional user data, such as `scope`, `email`, `nickname`."""
         assert self.user is not None
-        user_model = db.query(User).where(User.uuid == self.user).first()
+        user_model = cache.user_cache.get(db, self.user)
         assert user_model is not None
         data.update({"nickname": user_model.nickname, "email": user_model.email})
         return self.issue_access_token(data)
 
+    async def issue_access_token_user_data_async(
+        self, data: ParsedJWTType = {}, compact: bool = False
+    ) -> str:
+        """Same as `issue_access_token_user_data`, but user is read in a thread.
+
+        Concurrent requests for the same user share one query. Compact tokens
+        are issued without user data, so user is not read at all.
+        """
+        assert self.user is not None
+        if compact:
+            return self.issue_access_token({**data}, compact=True)
+        user_model = await cache.get_user(self.user)
+        assert user_model is not None
+        data = {**data, "nickname": user_model.nickname, "email": user_model.email}
+        return self.issue_access_token(data)
+
     @classmethod
     def verify(cls, parsed: ParsedJWTType, typ: TokenTypes, db: Session) -> None:
         super().verify(parsed, typ, db)
         if typ == TokenTypes.RefreshToken:
-            user = db.query(User).filter(User.uuid == parsed["sub"]).first()
+            try:
+                uuid = UUID(str(parsed["sub"]))
+            except ValueError:
+                raise JWTValidationError("sub field is invalid")
+            user = cache.user_cache.get(db, uuid)
             if user is None:
                 raise JWTRevokedException("User not found.")
             if user.disabled:
                 raise JWTRevokedException("Disabled user.")
 
+    @classmethod
+    def introspect(cls, tokens: Sequence[str], db: Session) -> list[ParsedJWTType | None]:
+        """Verify many access and refresh tokens at once.
+
+        Unlike `verify`, users of access tokens are checked too. Refresh
+        token ids and users are read with one query per `INTROSPECT_CHUNK`
+        tokens instead of one query per token.
+
+        Returns:
+            list: Parsed JWT data in the same order, `None` for invalid tokens.
+        """
+        types = {TokenTypes.AccessToken.value, TokenTypes.RefreshToken.value}
+        results = decode_batch(tokens)
+        jtis: set[UUID] = set()
+        users: set[UUID] = set()
+        for i, parsed in enumerate(results):
+            if parsed is None or parsed.get("typ") not in types:
+                results[i] = None
+                continue
+            try:
+                users.add(UUID(str(parsed["sub"])))
+                if parsed["typ"] == TokenTypes.RefreshToken.value:
+                    jtis.add(UUID(str(parsed["jti"])))
+            except (KeyError, ValueError):
+                results[i] = None
+
+        found_jtis: set[UUID] = set()
+        active_users: set[UUID] = set()
+        jti_list, user_list = list(jtis), list(users)
+        for start in range(0, max(len(jti_list), len(user_list)), INTROSPECT_CHUNK):
+            end = start + INTROSPECT_CHUNK
+            if jti_list[start:end]:
+                found_jtis.update(
+                    db.exec(select(cls.uuid).where(col(cls.uuid).in_(jti_list[start:end])))
+                )
+            if user_list[start:end]:
+                active_users.update(
+                    db.exec(
+                        select(User.uuid).where(
+                            col(User.uuid).in_(user_list[start:end]), col(User.disabled).is_(False)
+                        )
+                    )
+                )
+
+        for i, parsed in enumerate(results):
+            if parsed is None:
+                continue
+            if UUID(str(parsed["sub"])) not in active_users or (
+                parsed["typ"] == TokenTypes.RefreshToken.value
+                and UUID(str(parsed["jti"])) not in found_jtis
+            ):
+                results[i] = None
+        return results
+
     @classmethod
     def from_str(cls: Type[T], token: str, typ: TokenTypes, db: Session) -> T:
         parsed = cls.parse(token)
@@ -301,7 +527,24 @@ class UserToken(TokenBase, table=True):
             user=parsed["sub"],
         )
 
+    @classmethod
+    async def from_str_async(cls, token: str, typ: TokenTypes) -> "UserToken":
+        """Same as `from_str`, but database is queried in a thread.
+
+        Concurrent checks of the same token share one query, e.g. when a client
+        retries refresh.
+        """
+
+        def load() -> UserToken:
+            with get_engine_session() as db:
+                return cls.from_str(token, typ, db)
+
+        return await token_lookups.do((token, typ), lambda: asyncio.to_thread(load))
+
     @classmethod
     def from_str_access_token(cls: Type[T], token: str) -> T:
         """Parse token, assuming its AccessToken and it doesnt require database connection."""
         return cls.from_str(token, TokenTypes.AccessToken, Session())
+
+
+token_lookups: SingleFlight[tuple[str, TokenTypes], UserToken] = SingleFlight()
@@ -1,11 +1,13 @@
 """Module with user-related database models."""
 
+from typing import NamedTuple
 from uuid import UUID, uuid4
 
 from loguru import logger
+from sqlalchemy import Index
 from sqlmodel import Field, SQLModel
 
-from app.database import get_engine_session
+from app.database import get_engine, get_engine_session
 from app.utils import int_time
 
 
@@ -33,6 +35,14 @@ class UserBase(SQLModel):
 class User(UserBase, table=True):
     """User table."""
 
+    __table_args__ = (
+        # Keyset pagination for user export
+        Index("ix_user_created_at_uuid", "created_at", "uuid"),
+        Index(
+            "ix_user_verifed_disabled_created_at_uuid", "verifed", "disabled", "created_at", "uuid"
+        ),
+    )
+
     uuid: UUID = Field(
         default_factory=uuid4, primary_key=True, index=True, nullable=False, unique=True
     )
@@ -46,7 +56,31 @@ class User(UserBase, table=True):
             q = db.query(cls).filter(cls.created_at + 3600 <= int_time(), cls.verifed == False)
             count = q.count()
             q.delete()
+            db.commit()
             logger.info(f"Deleted {count} unverifed User accounts.")
+        if count:
+            # Bloom filter can't remove names, rebuild it
+            from app.availability import name_index
+
+            if name_index.ready:
+                name_index.build(get_engine())
+
+
+class UserProjection(NamedTuple):
+    """User columns needed on hot paths, see `app.queries`."""
+
+    uuid: UUID
+    nickname: str
+    email: str
+    disabled: bool
+    verifed: bool
+
+
+class Credentials(NamedTuple):
+    """User columns needed to check password, see `app.queries`."""
+
+    uuid: UUID
+    password: str
 
 
 class UserCreate(UserBase):
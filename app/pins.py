@@ -0,0 +1,293 @@
+"""Pin registry and its reconciliation with IPFS cluster.
+
+Every CID added or removed through the API is recorded in the `pin` table.
+`reconcile` streams the cluster pin listing and compares it with the table
+batch by batch, so its memory usage depends only on the batch size:
+
+* statuses of known pins are updated, failed pins are recovered;
+* pins missing in the table (orphans) are removed from cluster;
+* pins missing in cluster are pinned again.
+
+Pins younger than `grace` seconds are never touched, so uploads finishing
+during reconciliation are not mistaken for orphans.
+"""
+
+import asyncio
+import re
+from dataclasses import dataclass
+from datetime import datetime
+from typing import AsyncIterable, AsyncIterator, Iterable, TypeVar
+from uuid import UUID
+
+from loguru import logger
+from sqlalchemy import bindparam, delete, func, select, update
+from sqlalchemy.engine import Engine
+from sqlmodel import Session, col
+
+from .exceptions import IPFSException
+from .ipfs import IPFSClient, PinInfo
+from .models.pin import Pin, PinStatus, UploadReservation
+from .models.user import User
+from .utils import int_time
+
+# Cluster peer statuses, see `TrackerStatus` in ipfs-cluster
+ERROR_STATUSES = {"pin_error", "unpin_error", "cluster_error", "error"}
+# Seconds an upload may hold its quota reservation
+RESERVATION_TTL = 60 * 60
+
+T = TypeVar("T")
+
+
+@dataclass
+class ReconcileStats:
+    """Reconciliation counters."""
+
+    checked: int = 0
+    updated: int = 0
+    recovered: int = 0
+    removed: int = 0
+    repinned: int = 0
+
+
+def record_pin(db: Session, cid: str, owner: UUID, name: str | None, size: int | None) -> None:
+    """Record that user pinned CID, pinning the same CID again updates its name and size."""
+    pin = db.get(Pin, (cid, owner))
+    if pin is None:
+        pin = Pin(cid=cid, owner=owner)
+    pin.name, pin.size = name, size
+    db.add(pin)
+    db.commit()
+
+
+def used_space(db: Session, owner: UUID) -> int:
+    """Total size of files pinned by user and reserved by their uploads in progress."""
+    pinned: int = db.execute(
+        select(func.coalesce(func.sum(Pin.size), 0)).where(Pin.owner == owner)
+    ).scalar_one()
+    reserved: int = db.execute(
+        select(func.coalesce(func.sum(UploadReservation.size), 0)).where(
+            UploadReservation.owner == owner, UploadReservation.expires_at > int_time()
+        )
+    ).scalar_one()
+    return pinned + reserved
+
+
+def reserve_space(db: Session, owner: UUID, size: int, quota: int) -> UploadReservation | None:
+    """Reserve quota space for an upload, so concurrent uploads can't share it.
+
+    Reservations of the same user are serialized by locking the user row, on
+    SQLite by the write lock taken by the insert, which goes before the check.
+
+    Args:
+        db: Database session.
+        owner: UUID of user who uploads.
+        size: Bytes wanted, less is reserved if less is left.
+        quota: Space allowed to user.
+
+    Returns:
+        UploadReservation | None: Reservation, `None` if the quota is used up.
+    """
+    db.execute(select(User.uuid).where(User.uuid == owner).with_for_update())
+    reservation = UploadReservation(owner=owner, size=size, expires_at=int_time() + RESERVATION_TTL)
+    db.add(reservation)
+    db.flush()
+    left = quota - used_space(db, owner) + size
+    if left <= 0:
+        db.rollback()
+        return None
+    reservation.size = min(size, left)
+    db.commit()
+    db.refresh(reservation)
+    return reservation
+
+
+def release_space(db: Session, reservation: UploadReservation) -> None:
+    """Remove reservation and expired reservations of the same user."""
+    db.execute(
+        delete(UploadReservation).where(
+            (UploadReservation.id == reservation.id)
+            | (
+                (UploadReservation.owner == reservation.owner)
+                & (UploadReservation.expires_at <= int_time())
+            )
+        )
+    )
+    db.commit()
+
+
+def forget_pin(db: Session, cid: str, owner: UUID) -> tuple[bool, bool]:
+    """Remove user pin record.
+
+    Returns:
+        Whether the record existed and whether other users still pin this CID.
+    """
+    pin = db.get(Pin, (cid, owner))
+    if pin is None:
+        return False, False
+    db.delete(pin)
+    db.commit()
+    other = db.execute(select(Pin.owner).where(Pin.cid == cid).limit(1)).first()
+    return True, other is not None
+
+
+def pin_status(info: PinInfo) -> PinStatus:
+    """Aggregate statuses of CID on all cluster peers to single status."""
+    statuses = [peer.get("status", "") for peer in info.get("peer_map", {}).values()]
+    if "pinned" in statuses:
+        return PinStatus.pinned
+    if ERROR_STATUSES.intersection(statuses):
+        return PinStatus.error
+    return PinStatus.pinning
+
+
+def parse_time(value: str | None) -> int | None:
+    """Parse RFC 3339 timestamp with nanoseconds, as returned by cluster."""
+    if not isinstance(value, str):
+        return None
+    # Python parses up to microseconds
+    value = re.sub(r"(\.\d{6})\d+", r"\1", value.replace("Z", "+00:00"))
+    try:
+        return int(datetime.fromisoformat(value).timestamp())
+    except ValueError:
+        return None
+
+
+def pin_created_at(info: PinInfo) -> int | None:
+    """Get time when CID was pinned, falls back to the latest peer status change."""
+    created = parse_time(info.get("created"))
+    if created is not None and created > 0:
+        return created
+    timestamps = [parse_time(peer.get("timestamp")) for peer in info.get("peer_map", {}).values()]
+    known = [timestamp for timestamp in timestamps if timestamp is not None and timestamp > 0]
+    return max(known) if known else None
+
+
+async def batched(items: AsyncIterable[T], size: int) -> AsyncIterator[list[T]]:
+    """Split async iterable to lists of `size` elements."""
+    batch: list[T] = []
+    async for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def update_statuses(engine: Engine, statuses: dict[str, PinStatus], checked_at: int) -> set[str]:
+    """Store cluster statuses of a batch of CIDs.
+
+    Returns:
+        CIDs which are present in `pin` table.
+    """
+    with engine.begin() as connection:
+        known = {
+            row[0]
+            for row in connection.execute(
+                select(Pin.cid).where(col(Pin.cid).in_(list(statuses))).distinct()
+            )
+        }
+        if known:
+            statement = (
+                update(Pin)
+                .where(Pin.cid == bindparam("_cid"))
+                .values(status=bindparam("_status"), checked_at=checked_at)
+            )
+            connection.execute(
+                statement, [{"_cid": cid, "_status": statuses[cid]} for cid in known]
+            )
+    return known
+
+
+def missing_pins(
+    engine: Engine, checked_before: int, created_before: int, after: str, limit: int
+) -> list[tuple[str, str | None]]:
+    """Get CIDs not found in cluster by reconciliation started at `checked_before`.
+
+    Returns:
+        Batch of CIDs greater than `after` with one of their pin names.
+    """
+    query = (
+        select(Pin.cid, Pin.name)
+        .where(
+            (col(Pin.checked_at) == None) | (col(Pin.checked_at) < checked_before),  # noqa: E711
+            Pin.created_at < created_before,
+            Pin.cid > after,
+        )
+        .order_by(Pin.cid)
+        .limit(limit)
+    )
+    pins: dict[str, str | None] = {}
+    with engine.connect() as connection:
+        for cid, name in connection.execute(query):
+            pins.setdefault(cid, name)
+    return list(pins.items())
+
+
+def set_status(engine: Engine, cids: Iterable[str], status: PinStatus) -> None:
+    """Set status of all pins of CIDs."""
+    with engine.begin() as connection:
+        connection.execute(update(Pin).where(col(Pin.cid).in_(list(cids))).values(status=status))
+
+
+async def reconcile(
+    ipfs: IPFSClient, engine: Engine, batch_size: int = 1000, grace: int = 3600
+) -> ReconcileStats:
+    """Reconcile `pin` table with cluster pins.
+
+    Examples:
+        >>> async with IPFSClient("http://127.0.0.1:9094") as ipfs:
+        >>>     await reconcile(ipfs, get_engine())
+        ReconcileStats(checked=10000, updated=3, recovered=1, removed=2, repinned=0)
+
+    Args:
+        ipfs: Cluster client.
+        engine: Database engine.
+        batch_size: CIDs compared with table at once.
+        grace: Don't remove or re-pin CIDs pinned less than this many seconds ago.
+
+    Returns:
+        ReconcileStats: Reconciliation counters.
+    """
+    stats = ReconcileStats()
+    started = int_time()
+
+    async for batch in batched(ipfs.pins(), batch_size):
+        statuses = {info["cid"]: pin_status(info) for info in batch}
+        known = await asyncio.to_thread(update_statuses, engine, statuses, started)
+        stats.checked += len(batch)
+        stats.updated += len(known)
+        for info in batch:
+            cid = info["cid"]
+            try:
+                if cid in known:
+                    if statuses[cid] == PinStatus.error:
+                        await ipfs.recover(cid)
+                        stats.recovered += 1
+                    continue
+                created_at = pin_created_at(info)
+                if created_at is not None and created_at < started - grace:
+                    logger.info(f"Removing orphan pin {cid}")
+                    await ipfs.remove(cid)
+                    stats.removed += 1
+            except IPFSException:
+                logger.exception(f"Cannot reconcile pin {cid}")
+
+    after = ""
+    while pins := await asyncio.to_thread(
+        missing_pins, engine, started, started - grace, after, batch_size
+    ):
+        after = pins[-1][0]
+        repinned = []
+        for cid, name in pins:
+            try:
+                logger.info(f"Pinning missing CID {cid}")
+                await ipfs.pin(cid, name)
+                repinned.append(cid)
+            except IPFSException:
+                logger.exception(f"Cannot pin missing CID {cid}")
+        await asyncio.to_thread(set_status, engine, repinned, PinStatus.missing)
+        stats.repinned += len(repinned)
+
+    logger.info(f"Pins reconciled: {stats}")
+    return stats
@@ -0,0 +1,269 @@
+"""Statistical profiler for requests.
+
+A background thread samples the stack of the event loop thread every
+`interval` seconds and attributes each sample to the request whose task is
+running at that moment. Stacks are stored in collapsed format
+(`frame;frame;frame count` lines), which is read by `flamegraph.pl`,
+speedscope and similar tools.
+
+Two modes are available:
+
+* on demand, a request from an admin with `X-Profile: 1` header is profiled,
+  its stacks are saved to `PROFILE_DIR` and the response has `X-Profile-Id`
+  header, see `GET /debug/profiles/{id}`;
+* continuous (`PROFILE_INTERVAL`), stacks of all requests are aggregated per
+  endpoint and written to `PROFILE_DIR` every `PROFILE_INTERVAL` seconds.
+
+Time spent in other threads (e.g. `asyncio.to_thread`) is seen as waiting
+in the event loop and is not attributed to requests.
+"""
+
+import asyncio
+import os
+import sys
+import threading
+from collections import Counter
+from pathlib import Path
+from time import monotonic, time
+from types import FrameType
+from uuid import uuid4
+
+from loguru import logger
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .exceptions import AbstractException
+from .settings import get_settings
+
+MAX_DEPTH = 128
+
+
+def frame_name(frame: FrameType) -> str:
+    """Get `module:function` name of frame, qualified name is only available since Python 3.11."""
+    module = frame.f_globals.get("__name__", "?")
+    name: str = getattr(frame.f_code, "co_qualname", frame.f_code.co_name)
+    return f"{module}:{name}"
+
+
+def collapse(frame: FrameType | None) -> str:
+    """Convert stack to collapsed format, outermost frame first."""
+    names: list[str] = []
+    while frame is not None and len(names) < MAX_DEPTH:
+        names.append(frame_name(frame))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def write_collapsed(path: Path, stacks: Counter[str]) -> None:
+    """Write stacks to file in collapsed format."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp = path.with_suffix(".tmp")
+    with open(temp, "w") as file:
+        file.writelines(f"{stack} {count}\n" for stack, count in stacks.most_common())
+    os.replace(temp, path)
+
+
+class Sampler:
+    """Background sampler of event loop stacks."""
+
+    def __init__(
+        self,
+        directory: str = "profiles",
+        interval: float = 0.005,
+        flush_interval: float | None = None,
+    ) -> None:
+        """Background sampler of event loop stacks.
+
+        Examples:
+            >>> sampler = Sampler(flush_interval=60)
+            >>> sampler.start()
+            >>> stacks = sampler.watch(asyncio.current_task())
+            >>> await handle_request()
+            >>> sampler.finish(asyncio.current_task(), "app.routers.auth:login")
+            >>> sampler.stop()
+
+        Args:
+            directory: Directory to store profiles.
+            interval: Seconds between samples.
+            flush_interval: Enables continuous profiling, aggregated stacks of
+                all requests are written every this many seconds.
+        """
+        self.directory = Path(directory)
+        self.interval = interval
+        self.flush_interval = flush_interval
+        self.active: dict[asyncio.Task[None], Counter[str]] = {}
+        self.aggregated: Counter[str] = Counter()
+        self.lock = threading.Lock()
+        self.wanted = threading.Event()
+        self.stopped = threading.Event()
+        self.thread: threading.Thread | None = None
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.loop_thread = 0
+        self.flushed_at = monotonic()
+
+    @property
+    def continuous(self) -> bool:
+        """Whether all requests are profiled."""
+        return self.flush_interval is not None
+
+    def start(self) -> None:
+        """Start sampling thread, must be called from the event loop thread."""
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread = threading.get_ident()
+        self.stopped.clear()
+        if self.continuous:
+            self.wanted.set()
+        self.thread = threading.Thread(target=self._run, name="sampler", daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        """Stop sampling thread and write remaining aggregated stacks."""
+        self.stopped.set()
+        self.wanted.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.continuous:
+            self.flush()
+
+    def watch(self, task: "asyncio.Task[None]") -> Counter[str]:
+        """Start attributing samples to task.
+
+        Returns:
+            Counter: Stacks of the task, updated until `finish`.
+        """
+        stacks: Counter[str] = Counter()
+        with self.lock:
+            self.active[task] = stacks
+        self.wanted.set()
+        return stacks
+
+    def finish(self, task: "asyncio.Task[None]", label: str) -> Counter[str]:
+        """Stop attributing samples to task.
+
+        Args:
+            task: Watched task.
+            label: Endpoint name, root frame of aggregated stacks.
+
+        Returns:
+            Counter: Stacks of the task.
+        """
+        with self.lock:
+            stacks = self.active.pop(task, Counter())
+            if not self.active and not self.continuous:
+                self.wanted.clear()
+            if self.continuous:
+                for stack, count in stacks.items():
+                    self.aggregated[f"{label};{stack}"] += count
+        return stacks
+
+    def save(self, profile_id: str, stacks: Counter[str]) -> None:
+        """Save stacks of a single request."""
+        write_collapsed(self.directory / f"{profile_id}.folded", stacks)
+
+    def flush(self) -> None:
+        """Write aggregated stacks to a new file and reset them."""
+        with self.lock:
+            stacks, self.aggregated = self.aggregated, Counter()
+        self.flushed_at = monotonic()
+        if stacks:
+            name = f"continuous-{os.getpid()}-{int(time())}.folded"
+            write_collapsed(self.directory / name, stacks)
+
+    def sample(self) -> None:
+        """Take one sample of event loop thread."""
+        if self.loop is None:
+            return
+        task = asyncio.current_task(self.loop)
+        if task is None:
+            return
+        stacks = self.active.get(task)
+        if stacks is None:
+            return
+        stack = collapse(sys._current_frames().get(self.loop_thread))
+        with self.lock:
+            stacks[stack] += 1
+
+    def _run(self) -> None:
+        while not self.stopped.is_set():
+            self.wanted.wait()
+            try:
+                self.sample()
+                if (
+                    self.flush_interval is not None
+                    and monotonic() - self.flushed_at >= self.flush_interval
+                ):
+                    self.flush()
+            except Exception:
+                logger.exception("Profiler sample failed")
+            self.stopped.wait(self.interval)
+
+
+def is_admin(authorization: str | None) -> bool:
+    """Check that `Authorization` header contains access token of an admin."""
+    from .models import UserToken
+
+    if authorization is None or not authorization.lower().startswith("bearer "):
+        return False
+    try:
+        usertoken = UserToken.from_str_access_token(authorization[7:])
+    except AbstractException:
+        return False
+    return usertoken.user in get_settings().admins
+
+
+class ProfilerMiddleware:
+    """Profile requests with `Sampler`.
+
+    Pure ASGI middleware, so endpoints run in the same task as the middleware.
+    """
+
+    def __init__(self, app: ASGIApp, sampler: Sampler, header: str = "x-profile") -> None:
+        """Profile requests with `Sampler`.
+
+        Args:
+            app: ASGI app.
+            sampler: Running sampler.
+            header: Request header enabling profiling of the request.
+        """
+        self.app = app
+        self.sampler = sampler
+        self.header = header.lower().encode()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Handle request."""
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        on_demand = headers.get(self.header) == b"1" and is_admin(
+            headers.get(b"authorization", b"").decode("latin-1") or None
+        )
+        if not on_demand and not self.sampler.continuous:
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = uuid4().hex if on_demand else None
+
+        async def send_with_id(message: Message) -> None:
+            if message["type"] == "http.response.start" and profile_id is not None:
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (b"x-profile-id", profile_id.encode()),
+                ]
+            await send(message)
+
+        task: asyncio.Task[None] = asyncio.current_task()  # type: ignore[assignment]
+        self.sampler.watch(task)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            endpoint = scope.get("endpoint")
+            label = (
+                f"{endpoint.__module__}:{endpoint.__qualname__}"
+                if endpoint is not None
+                else scope["path"]
+            )
+            stacks = self.sampler.finish(task, label)
+            if profile_id is not None:
+                await asyncio.to_thread(self.sampler.save, profile_id, stacks)
+                logger.info(f"Request {label} profiled as {profile_id}")
@@ -0,0 +1,74 @@
+"""Core queries of hot paths.
+
+`db.query(Model).first()` builds a full SQLModel object, runs pydantic
+validation and registers it in the session identity map, just to read a
+column or two. Queries here select only needed columns of the tables (not
+ORM attributes, so the ORM compiler is not involved) and return
+`NamedTuple` rows (see `app.models.user`).
+
+Statements are built with `lambda_stmt`: the lambda is analyzed once, later
+calls take the compiled statement from cache by the lambda code location.
+Values are passed as named `bindparam`s rather than closure variables, so
+they get the column type (e.g. `GUID` converting `UUID` for SQLite).
+
+Use these where a model is not modified, otherwise load the model.
+"""
+
+from uuid import UUID
+
+from sqlalchemy import bindparam, lambda_stmt, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.sql.schema import Table
+
+from .models.user import Credentials, User, UserProjection
+
+USER: Table = User.__table__  # type: ignore[attr-defined]
+
+
+def load_credentials(connection: Connection, nickname: str) -> Credentials | None:
+    """Read uuid and password hash by nickname."""
+    statement = lambda_stmt(
+        lambda: select(USER.c.uuid, USER.c.password).where(USER.c.nickname == bindparam("nickname"))
+    )
+    row = connection.execute(statement, {"nickname": nickname}).first()
+    return Credentials(*row) if row is not None else None
+
+
+def load_uuid_by_nickname(connection: Connection, nickname: str) -> UUID | None:
+    """Read user uuid by nickname."""
+    statement = lambda_stmt(
+        lambda: select(USER.c.uuid).where(USER.c.nickname == bindparam("nickname"))
+    )
+    uuid: UUID | None = connection.execute(statement, {"nickname": nickname}).scalar()
+    return uuid
+
+
+def email_taken(connection: Connection, email: str) -> bool:
+    """Check whether a user with email exists."""
+    statement = lambda_stmt(lambda: select(USER.c.uuid).where(USER.c.email == bindparam("email")))
+    return connection.execute(statement, {"email": email}).first() is not None
+
+
+def load_user(connection: Connection, uuid: UUID) -> UserProjection | None:
+    """Read user columns needed on hot paths by uuid."""
+    statement = lambda_stmt(
+        lambda: select(
+            USER.c.uuid, USER.c.nickname, USER.c.email, USER.c.disabled, USER.c.verifed
+        ).where(USER.c.uuid == bindparam("uuid"))
+    )
+    row = connection.execute(statement, {"uuid": uuid}).first()
+    return UserProjection(*row) if row is not None else None
+
+
+def mark_verified(connection: Connection, uuid: UUID) -> None:
+    """Set `verifed` of user."""
+    statement = lambda_stmt(
+        lambda: USER.update().where(USER.c.uuid == bindparam("user_uuid")).values(verifed=True)
+    )
+    connection.execute(statement, {"user_uuid": uuid})
+
+
+def token_exists(connection: Connection, table: Table, uuid: UUID | str) -> bool:
+    """Check whether token with uuid exists in token table."""
+    statement = lambda_stmt(lambda: select(table.c.uuid).where(table.c.uuid == bindparam("uuid")))
+    return connection.execute(statement, {"uuid": uuid}).first() is not None
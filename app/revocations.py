@@ -0,0 +1,266 @@
+"""Feed of token revocations for services caching validated tokens.
+
+Revocations are written to the `revocation` table in the same transaction
+as the change itself (see `revoke_token` and `revoke_user`), so every
+worker sees them. `GET /authorization/revocations` streams them as
+server-sent events, `id` of an event is its `seq` and is used as cursor:
+a subscriber reconnecting with `Last-Event-ID` (or `?cursor=`) first gets
+events after it, then live ones.
+
+Each worker polls the table once per `poll_interval` while it has
+subscribers, and fans events out to them. Sequence values may become
+visible out of order (concurrent transactions, `unique_rowid` on
+CockroachDB), so the poller also rereads the last `grace` seconds and
+sends events it didn't send yet. Delivery is at least once, subscribers
+should treat events as idempotent.
+
+Events are kept for twice the access token lifetime (at least a day): a
+token revoked earlier has expired anyway, so a subscriber resuming from an older cursor
+loses nothing it still needs.
+"""
+
+import asyncio
+import json
+from time import monotonic
+from typing import AsyncIterator, NamedTuple
+from uuid import UUID
+
+from loguru import logger
+from sqlalchemy import delete, func, insert, or_, select, update
+from sqlalchemy.engine import Connection, Engine
+
+from .models.revocation import Revocation, RevocationKind
+from .models.token import UserToken
+from .models.user import User
+from .utils import int_time
+
+PRUNE_INTERVAL = 60 * 60
+# Seconds to keep events at least
+MIN_RETENTION = 24 * 60 * 60
+
+REVOCATION = Revocation.__table__  # type: ignore[attr-defined]
+
+
+class RevocationEvent(NamedTuple):
+    """Revocation row as sent to subscribers."""
+
+    seq: int
+    created_at: int
+    kind: RevocationKind
+    user: UUID
+    jti: UUID | None
+    watermark: int | None
+
+    def sse(self) -> str:
+        """Format as server-sent event."""
+        data = {
+            "seq": self.seq,
+            "created_at": self.created_at,
+            "kind": self.kind.value,
+            "user": self.user.hex,
+            "jti": None if self.jti is None else self.jti.hex,
+            "watermark": self.watermark,
+        }
+        return f"id: {self.seq}\nevent: {self.kind.value}\ndata: {json.dumps(data)}\n\n"
+
+
+def revoke_token(connection: Connection, jti: UUID, user: UUID) -> bool:
+    """Delete refresh token and record revocation of its session.
+
+    Returns:
+        bool: `False` if the token was already deleted.
+    """
+    table = UserToken.__table__  # type: ignore[attr-defined]
+    if connection.execute(delete(table).where(table.c.uuid == jti)).rowcount == 0:
+        return False
+    connection.execute(
+        insert(REVOCATION).values(
+            created_at=int_time(), kind=RevocationKind.token.value, user=user, jti=jti
+        )
+    )
+    return True
+
+
+def revoke_user(connection: Connection, user: UUID, disable: bool = False) -> int:
+    """Delete all refresh tokens of user, optionally disable it, and record revocation.
+
+    Tokens issued not later than the current second are revoked.
+
+    Returns:
+        int: Number of deleted refresh tokens.
+    """
+    tokens = UserToken.__table__  # type: ignore[attr-defined]
+    if disable:
+        users = User.__table__  # type: ignore[attr-defined]
+        connection.execute(update(users).where(users.c.uuid == user).values(disabled=True))
+    deleted: int = connection.execute(delete(tokens).where(tokens.c.user == user)).rowcount
+    kind = RevocationKind.user_disabled if disable else RevocationKind.user_revoked
+    now = int_time()
+    connection.execute(
+        insert(REVOCATION).values(created_at=now, kind=kind.value, user=user, watermark=now)
+    )
+    return deleted
+
+
+def prune(engine: Engine, retention: int) -> int:
+    """Delete events older than `retention` seconds.
+
+    Returns:
+        int: Number of deleted events.
+    """
+    with engine.begin() as connection:
+        deleted: int = connection.execute(
+            delete(REVOCATION).where(REVOCATION.c.created_at < int_time() - retention)
+        ).rowcount
+    return deleted
+
+
+class RevocationFeed:
+    """Per-worker poller fanning revocation events out to subscribers."""
+
+    def __init__(
+        self,
+        engine: Engine,
+        token_lifetime: int,
+        poll_interval: float = 1,
+        grace: int = 5,
+        queue_size: int = 1000,
+    ) -> None:
+        """Per-worker poller fanning revocation events out to subscribers.
+
+        Examples:
+            >>> feed = RevocationFeed(get_engine(), token_lifetime=15 * 60)
+            >>> async for event in feed.subscribe(cursor=None, heartbeat=15):
+            >>>     print(event)
+
+        Args:
+            engine: Database engine.
+            token_lifetime: Access token lifetime in seconds, events are kept
+                twice as long, but at least a day.
+            poll_interval: Seconds between polls while there are subscribers.
+            grace: Seconds of events reread on every poll.
+            queue_size: Events buffered per subscriber, a slower subscriber is disconnected.
+        """
+        self.engine = engine
+        self.retention = max(2 * token_lifetime, MIN_RETENTION)
+        self.poll_interval = poll_interval
+        self.grace = grace
+        self.queue_size = queue_size
+        self.subscribers: set[asyncio.Queue[RevocationEvent | None]] = set()
+        self.task: asyncio.Task[None] | None = None
+        self.pruned_at: float | None = None
+
+    def _load(self, after: int | None, since: int | None = None) -> list[RevocationEvent]:
+        """Read events with `seq` after cursor or created since timestamp."""
+        conditions = []
+        if after is not None:
+            conditions.append(REVOCATION.c.seq > after)
+        if since is not None:
+            conditions.append(REVOCATION.c.created_at >= since)
+        query = select(REVOCATION).where(or_(*conditions)).order_by(REVOCATION.c.seq)
+        with self.engine.connect() as connection:
+            return [
+                RevocationEvent(
+                    row.seq,
+                    row.created_at,
+                    RevocationKind(row.kind),
+                    row.user,
+                    row.jti,
+                    row.watermark,
+                )
+                for row in connection.execute(query)
+            ]
+
+    def _position(self) -> tuple[int, dict[int, int]]:
+        """Get last `seq` and events of the grace window, they are not sent as new."""
+        with self.engine.connect() as connection:
+            last: int | None = connection.execute(select(func.max(REVOCATION.c.seq))).scalar()
+        recent = self._load(None, int_time() - self.grace)
+        return last or 0, {event.seq: event.created_at for event in recent}
+
+    async def subscribe(
+        self, cursor: int | None, heartbeat: float
+    ) -> AsyncIterator[RevocationEvent | None]:
+        """Iterate over events after `cursor`, then over new events.
+
+        Args:
+            cursor: `seq` of the last received event, only new events if `None`.
+            heartbeat: Seconds without events after which `None` is yielded.
+
+        Yields:
+            Events, and `None` every `heartbeat` seconds without events. Stops
+            if the subscriber falls behind or the feed is stopped.
+        """
+        queue: asyncio.Queue[RevocationEvent | None] = asyncio.Queue(self.queue_size)
+        self.subscribers.add(queue)
+        try:
+            if self.task is None:
+                # Position is taken before replay, so events committed while
+                # replaying are sent by poller and nothing falls in between
+                position = await asyncio.to_thread(self._position)
+                if self.task is None:
+                    self.task = asyncio.create_task(self._poll(position))
+            sent: set[int] = set()
+            if cursor is not None:
+                for event in await asyncio.to_thread(self._load, cursor):
+                    sent.add(event.seq)
+                    yield event
+            while True:
+                try:
+                    item = await asyncio.wait_for(queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                if item is None:
+                    return
+                if item.seq not in sent:
+                    yield item
+        finally:
+            self.subscribers.discard(queue)
+
+    def _broadcast(self, event: RevocationEvent) -> None:
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                logger.warning("Revocation subscriber is too slow, disconnecting")
+                self.subscribers.discard(queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+    async def _poll(self, position: tuple[int, dict[int, int]]) -> None:
+        try:
+            # Creation time of sent events of the grace window, by seq
+            last_seq, seen = position
+            while self.subscribers:
+                await asyncio.sleep(self.poll_interval)
+                since = int_time() - self.grace
+                try:
+                    events = await asyncio.to_thread(self._load, last_seq, since)
+                    if self.pruned_at is None or monotonic() - self.pruned_at > PRUNE_INTERVAL:
+                        self.pruned_at = monotonic()
+                        await asyncio.to_thread(prune, self.engine, self.retention)
+                except Exception:
+                    logger.exception("Cannot read revocations")
+                    continue
+                for event in events:
+                    if event.seq in seen:
+                        continue
+                    seen[event.seq] = event.created_at
+                    last_seq = max(last_seq, event.seq)
+                    self._broadcast(event)
+                seen = {seq: created_at for seq, created_at in seen.items() if created_at >= since}
+        finally:
+            self.task = None
+
+    async def stop(self) -> None:
+        """Disconnect subscribers and stop polling."""
+        for queue in list(self.subscribers):
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(None)
+        self.subscribers.clear()
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
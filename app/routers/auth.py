@@ -1,23 +1,53 @@
 """Authorization router."""
 
+import asyncio
 from calendar import timegm
 from datetime import datetime, timedelta
+from typing import AsyncIterator
 from uuid import UUID, uuid4
 
-from fastapi import APIRouter, Body, Depends, Query, Request
+from fastapi import APIRouter, Body, Depends, Header, Query, Request, status
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from pydantic import BaseModel
+from slowapi.util import get_remote_address
 from sqlmodel import Session
 
-from app.exceptions import JWTValidationError, UserNotFoundException
-from app.models.user import User, UserCreate
+from app.exceptions import (
+    InvalidOTPException,
+    JWTValidationError,
+    MailException,
+    MailQueueFullException,
+    UserNotFoundException,
+)
+from app.models.audit import AuditKind
+from app.models.user import User, UserCreate, UserProjection
 
-from ..app import limiter
-from ..dependencies import get_session
+from .. import queries
+from ..audit import audit_log
+from ..availability import name_index
+from ..database import get_engine, get_engine_session
+from ..dependencies import (
+    get_current_user_row,
+    get_mail,
+    get_revocations,
+    get_session,
+    service_only,
+)
+from ..limiter import limiter
+from ..mail import Mail, MailQueue
 from ..models import token
+from ..otp import OTP_PERIOD, generate_otp, verify_otp
+from ..revocations import RevocationFeed, revoke_token
+from ..scopes import token_scopes
 from ..security import authenticate_user, get_password_hash
+from ..utils import SingleFlight
 
 router: APIRouter = APIRouter(prefix="/authorization", tags=["authorization"])
+nickname_lookups: SingleFlight[str, UUID | None] = SingleFlight()
+# Seconds between keep-alive comments of revocation feed
+REVOCATIONS_HEARTBEAT = 15
+COMPACT_DESCRIPTION = "Issue compact access token, about half the size, without nickname and email."
 
 
 class AccessToken(BaseModel):
@@ -36,11 +66,45 @@ class TokenPair(BaseModel):
     token_type: str = "bearer"
 
 
+class TokenInfo(BaseModel):
+    """Introspection result, fields are named as in RFC 7662."""
+
+    active: bool
+    token_type: str | None = None
+    sub: UUID | None = None
+    exp: int | None = None
+    iat: int | None = None
+    jti: str | None = None
+    scope: str | None = None
+    username: str | None = None
+
+
+class Introspection(BaseModel):
+    results: list[TokenInfo]
+
+
+class Availability(BaseModel):
+    """Whether names are free, `None` for names not asked."""
+
+    nickname: bool | None = None
+    email: bool | None = None
+
+
 class RegistrationDone(BaseModel):
     pair: TokenPair
     uuid: UUID
 
 
+def verification_mail(user: User | UserProjection) -> Mail:
+    """Build mail with email verification code."""
+    code = generate_otp(user.uuid, user.email)
+    return Mail(
+        to=user.email,
+        subject="Firesquare email verification",
+        body=f"Your verification code is {code}. " f"It is valid for {OTP_PERIOD // 60} minutes.",
+    )
+
+
 @router.post("/signup/", response_model=RegistrationDone)
 @limiter.limit("10/minute")
 async def signup(
@@ -48,9 +112,14 @@ async def signup(
     db: Session = Depends(get_session),
     user: UserCreate = Body(),
     uuid_token: str = Body(description="Answer from `reserve_uuid` endpoint."),
+    mail: MailQueue | None = Depends(get_mail),
+    compact: bool = Query(False, description=COMPACT_DESCRIPTION),
 ) -> RegistrationDone:
     """Register account and return token pair.
 
+    Email verification code is sent in background, account must be verified
+    with `verify` endpoint within an hour.
+
     **PASSWORD MUST BE HASHED WITH `PBKDF2` WITH `UUID` SALT!**
     """
     parsed = token.decode(uuid_token)
@@ -60,18 +129,64 @@ async def signup(
     new_user.password = get_password_hash(user.password)
     db.add(new_user)
     db.commit()
+    name_index.add(new_user.nickname, new_user.email)
+    audit_log.record(
+        AuditKind.signup,
+        user=new_user.uuid,
+        nickname=new_user.nickname,
+        ip=get_remote_address(request),
+    )
     usertoken = token.UserToken(user=new_user.uuid)
     db.add(usertoken)
     db.commit()
+    if mail is not None:
+        try:
+            await mail.send(verification_mail(new_user))
+        except MailQueueFullException:
+            # Code can be requested again with `verify/send`
+            pass
     return RegistrationDone(
         uuid=new_user.uuid,
         pair=TokenPair(
-            access_token=usertoken.issue_access_token_user_data(db),
+            access_token=await usertoken.issue_access_token_user_data_async(compact=compact),
             refresh_token=usertoken.issue_refresh_token(),
         ),
     )
 
 
+def email_taken(email: str) -> bool:
+    """Check in database whether email is taken."""
+    with get_engine().connect() as connection:
+        return queries.email_taken(connection, email)
+
+
+@router.get("/signup/available", response_model=Availability)
+@limiter.limit("60/minute")
+async def check_availability(
+    request: Request,
+    nickname: str | None = Query(None, max_length=16),
+    email: str | None = Query(None, max_length=64),
+) -> Availability:
+    """Check whether nickname and email are free for registration.
+
+    A free name may still be taken by someone else before `signup`.
+    """
+    result = Availability()
+    if nickname is not None:
+        result.nickname = not (
+            name_index.may_contain_nickname(nickname)
+            and await nickname_lookups.do(
+                nickname, lambda: asyncio.to_thread(load_uuid_by_nickname, nickname)
+            )
+            is not None
+        )
+    if email is not None:
+        result.email = not (
+            name_index.may_contain_email(email) and await asyncio.to_thread(email_taken, email)
+        )
+    return result
+
+
 @router.get("/signup/reserve_uuid", response_model=str)
 @limiter.limit("2/minute")
 async def reserve_uuid(request: Request) -> str:
@@ -97,14 +212,17 @@ async def login(
     request: Request,
     db: Session = Depends(get_session),
     form_data: OAuth2PasswordRequestForm = Depends(),
+    compact: bool = Query(False, description=COMPACT_DESCRIPTION),
 ) -> TokenPair:
     """Authenticate and return token pair."""
-    user = authenticate_user(db, form_data.username, form_data.password)
+    user = authenticate_user(
+        db, form_data.username, form_data.password, get_remote_address(request)
+    )
     usertoken = token.UserToken(user=user.uuid)
     db.add(usertoken)
     db.commit()
     return TokenPair(
-        access_token=usertoken.issue_access_token_user_data(db),
+        access_token=await usertoken.issue_access_token_user_data_async(compact=compact),
         refresh_token=usertoken.issue_refresh_token(),
     )
 
@@ -112,19 +230,149 @@ async def login(
 @router.post("/login/get_access_token", response_model=AccessToken)
 @limiter.limit("2/minute")
 async def get_access_token(
-    request: Request, db: Session = Depends(get_session), refresh_token: str = Body(embed=True)
+    request: Request,
+    refresh_token: str = Body(embed=True),
+    compact: bool = Query(False, description=COMPACT_DESCRIPTION),
 ) -> AccessToken:
     """Get access token by refresh token."""
-    usertoken = token.UserToken.from_str(refresh_token, token.TokenTypes.RefreshToken, db)
-    return AccessToken(access_token=usertoken.issue_access_token_user_data(db))
+    usertoken = await token.UserToken.from_str_async(refresh_token, token.TokenTypes.RefreshToken)
+    audit_log.record(
+        AuditKind.refresh,
+        user=usertoken.user,
+        ip=get_remote_address(request),
+        detail=usertoken.uuid.hex,
+    )
+    return AccessToken(
+        access_token=await usertoken.issue_access_token_user_data_async(compact=compact)
+    )
+
+
+def load_uuid_by_nickname(nickname: str) -> UUID | None:
+    """Read user UUID by nickname from database."""
+    with get_engine().connect() as connection:
+        return queries.load_uuid_by_nickname(connection, nickname)
 
 
 @router.get("/login/get_uuid", response_model=UUID)
-async def get_uuid_by_nickname(
-    db: Session = Depends(get_session), nickname: str = Query(max_length=16)
-) -> UUID:
+async def get_uuid_by_nickname(nickname: str = Query(max_length=16)) -> UUID:
     """Get UUID by user nickname."""
-    user: User | None = db.query(User).where(User.nickname == nickname).first()
+    uuid = await nickname_lookups.do(
+        nickname, lambda: asyncio.to_thread(load_uuid_by_nickname, nickname)
+    )
+    if uuid is None:
+        raise UserNotFoundException()
+    return uuid
+
+
+def token_info(parsed: token.ParsedJWTType | None) -> TokenInfo:
+    """Convert parsed token to introspection result."""
+    if parsed is None:
+        return TokenInfo(active=False)
+    info = {key: parsed.get(key) for key in ("sub", "exp", "iat")}
+    if parsed["typ"] == token.TokenTypes.RefreshToken.value:
+        info.update(token_type="refresh_token", jti=parsed["jti"])
+    else:
+        info.update(
+            token_type="access_token",
+            jti=parsed.get("sid"),
+            scope=" ".join(sorted(token_scopes(parsed))),
+            username=parsed.get("nickname"),
+        )
+    return TokenInfo.parse_obj({"active": True, **info})
+
+
+def introspect_tokens(tokens: list[str]) -> list[TokenInfo]:
+    """Verify tokens and read database in a thread."""
+    with get_engine_session() as db:
+        return [token_info(parsed) for parsed in token.UserToken.introspect(tokens, db)]
+
+
+@router.post("/introspect", response_model=Introspection, dependencies=[Depends(service_only)])
+async def introspect(tokens: list[str] = Body(embed=True, max_items=1000)) -> Introspection:
+    """Check access and refresh tokens for other services, like RFC 7662 but batched.
+
+    Requires `Authorization: Bearer <key>` with a key from `INTROSPECTION_KEYS`.
+    Results are in the same order as tokens, invalid, expired and revoked
+    tokens and tokens of disabled users have only `"active": false`.
+    """
+    return Introspection(results=await asyncio.to_thread(introspect_tokens, tokens))
+
+
+@router.post("/logout", response_model=bool)
+async def logout(
+    db: Session = Depends(get_session),
+    refresh_token: str = Body(embed=True),
+) -> bool:
+    """Delete refresh token, its access tokens are reported to revocation feed."""
+    usertoken = token.UserToken.from_str(refresh_token, token.TokenTypes.RefreshToken, db)
+    # Table models are not validated, claims are strings
+    revoke_token(db.connection(), UUID(str(usertoken.uuid)), UUID(str(usertoken.user)))
+    db.commit()
+    return True
+
+
+@router.get("/revocations", response_class=StreamingResponse, dependencies=[Depends(service_only)])
+async def revocations(
+    request: Request,
+    cursor: int | None = Query(None, description="`id` of the last received event."),
+    last_event_id: int | None = Header(None),
+    feed: RevocationFeed = Depends(get_revocations),
+) -> StreamingResponse:
+    """Stream token revocations as server-sent events, for services caching tokens.
+
+    Requires `Authorization: Bearer <key>` with a key from `INTROSPECTION_KEYS`.
+    Events are `token` (refresh token `jti` deleted, access tokens with this
+    `sid` are revoked), `user_disabled` and `user_revoked` (tokens of `user`
+    with `iat` not after `watermark` are revoked). Reconnect with
+    `Last-Event-ID` or `cursor` to get events missed in between.
+    """
+    drainer = request.app.state.drainer
+
+    async def stream() -> AsyncIterator[str]:
+        # Tell the client to reconnect after a second if the stream ends
+        yield "retry: 1000\n\n"
+        async for event in feed.subscribe(
+            cursor if cursor is not None else last_event_id, REVOCATIONS_HEARTBEAT
+        ):
+            if drainer.draining:
+                # Client reconnects to another worker with `Last-Event-ID`
+                return
+            yield ": ping\n\n" if event is None else event.sse()
+
+    return StreamingResponse(
+        stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"}
+    )
+
+
+@router.post("/verify/send", response_model=bool)
+@limiter.limit("2/minute")
+async def send_verification_code(
+    request: Request,
+    user: UserProjection | None = Depends(get_current_user_row),
+    mail: MailQueue | None = Depends(get_mail),
+) -> bool:
+    """Send email verification code to current user again."""
     if user is None:
         raise UserNotFoundException()
-    return user.uuid
+    if mail is None:
+        raise MailException("Mail is not configured", status.HTTP_503_SERVICE_UNAVAILABLE)
+    await mail.send(verification_mail(user))
+    return True
+
+
+@router.post("/verify", response_model=bool)
+@limiter.limit("10/minute")
+async def verify_email(
+    request: Request,
+    db: Session = Depends(get_session),
+    user: UserProjection | None = Depends(get_current_user_row),
+    code: str = Body(embed=True, regex=r"^[0-9]{6}$"),
+) -> bool:
+    """Verify current user email with code from mail."""
+    if user is None:
+        raise UserNotFoundException()
+    if not verify_otp(user.uuid, user.email, code):
+        raise InvalidOTPException(status_code=status.HTTP_400_BAD_REQUEST)
+    queries.mark_verified(db.connection(), user.uuid)
+    db.commit()
+    return True
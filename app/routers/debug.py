@@ -0,0 +1,46 @@
+"""Debugging router, available only to admins."""
+
+import asyncio
+
+from fastapi import APIRouter, Depends, Path, Request, status
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel
+
+from app.exceptions import ProfileNotFoundException
+
+from ..cache import user_lookups
+from ..dependencies import admin_only
+from ..models.token import token_lookups
+from ..profiling import Sampler
+from .auth import nickname_lookups
+
+router: APIRouter = APIRouter(prefix="/debug", tags=["debug"], dependencies=[Depends(admin_only)])
+
+
+class FlightStats(BaseModel):
+    calls: int
+    coalesced: int
+
+
+@router.get("/profiles/{profile_id}", response_class=PlainTextResponse)
+async def get_profile(request: Request, profile_id: str = Path(regex=r"^[0-9a-f]{32}$")) -> str:
+    """Get stacks of request profiled with `X-Profile: 1` header in collapsed format.
+
+    The result can be opened in speedscope or rendered with `flamegraph.pl`.
+    """
+    sampler: Sampler = request.app.state.sampler
+    path = sampler.directory / f"{profile_id}.folded"
+    try:
+        return await asyncio.to_thread(path.read_text)
+    except FileNotFoundError:
+        raise ProfileNotFoundException(status_code=status.HTTP_404_NOT_FOUND)
+
+
+@router.get("/single-flight", response_model=dict[str, FlightStats])
+async def get_single_flight_stats() -> dict[str, FlightStats]:
+    """Get calls made and calls joined to an in-flight one by lookup, since worker start."""
+    return {
+        "nickname": FlightStats(calls=nickname_lookups.calls, coalesced=nickname_lookups.coalesced),
+        "token": FlightStats(calls=token_lookups.calls, coalesced=token_lookups.coalesced),
+        "user": FlightStats(calls=user_lookups.calls, coalesced=user_lookups.coalesced),
+    }
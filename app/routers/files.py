@@ -0,0 +1,186 @@
+"""Files router."""
+
+from typing import AsyncIterable, AsyncIterator
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, Path, Query, Request, Response, status
+from pydantic import BaseModel
+from sqlmodel import Session
+
+from app.exceptions import (
+    FileTooLargeException,
+    PinNotFoundException,
+    UploadJobNotFoundException,
+    UploadQueueDisabledException,
+)
+
+from ..dependencies import (
+    get_current_user_uuid,
+    get_ipfs,
+    get_session,
+    get_uploads,
+    require_scopes,
+)
+from ..ipfs import IPFSClient
+from ..limiter import limiter
+from ..pins import forget_pin, record_pin, release_space, reserve_space
+from ..scopes import Scope
+from ..settings import get_settings
+from ..uploads import JobStatus, UploadQueue
+
+router: APIRouter = APIRouter(prefix="/files", tags=["files"])
+
+
+class UploadDone(BaseModel):
+    cid: str
+    size: int
+    job: str | None = None
+
+
+class UploadJob(BaseModel):
+    id: str
+    cid: str
+    size: int
+    status: JobStatus
+    attempts: int
+    error: str | None
+    created_at: int
+    updated_at: int
+
+
+class Counter:
+    """Count bytes passing through async stream."""
+
+    def __init__(self) -> None:
+        self.size = 0
+
+    async def count(self, stream: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+        async for chunk in stream:
+            self.size += len(chunk)
+            yield chunk
+
+
+@router.post(
+    "/upload",
+    response_model=UploadDone,
+    dependencies=[Depends(require_scopes(Scope.files_write))],
+)
+@limiter.limit("10/minute")
+async def upload(
+    request: Request,
+    response: Response,
+    ipfs: IPFSClient = Depends(get_ipfs),
+    uploads: UploadQueue | None = Depends(get_uploads),
+    db: Session = Depends(get_session),
+    owner: UUID = Depends(get_current_user_uuid),
+    filename: str | None = Query(None, max_length=255),
+    name: str | None = Query(None, max_length=255, description="Pin name."),
+    background: bool = Query(False, description="Respond before the file is pinned."),
+) -> UploadDone:
+    """Upload request body to IPFS.
+
+    The body is sent as is (not as a form), `Content-Type` header is used as file
+    content type. It is streamed to the cluster while it is received and is never
+    stored on the server. Files larger than `UPLOAD_MAX_SIZE`, or than the space
+    left of `UPLOAD_QUOTA` of the user, are rejected as soon as the limit is exceeded.
+
+    With `background` the file is saved to the upload queue and the response
+    (202) is sent right away, with locally computed CID and job ID for
+    `GET /files/jobs/{job}`.
+    """
+    settings = get_settings()
+    max_size = settings.upload_max_size
+    header = request.headers.get("content-length")
+    length = int(header) if header is not None and header.isdigit() else None
+    if length is not None and length > max_size:
+        raise FileTooLargeException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+    reservation = None
+    if settings.upload_quota is not None:
+        # Space is held until the pin is recorded, so concurrent uploads don't share it
+        wanted = length if length is not None else max_size
+        reservation = reserve_space(db, owner, wanted, settings.upload_quota)
+        if reservation is None:
+            raise FileTooLargeException(
+                "Upload quota exceeded", status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+            )
+        max_size = reservation.size
+    try:
+        if length is not None and length > max_size:
+            raise FileTooLargeException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        content_type = request.headers.get("content-type", "application/octet-stream")
+        if background:
+            if uploads is None:
+                raise UploadQueueDisabledException(status_code=status.HTTP_400_BAD_REQUEST)
+            job = await uploads.enqueue(
+                request.stream(),
+                content_type,
+                owner,
+                filename=filename,
+                name=name,
+                max_size=max_size,
+            )
+            record_pin(db, job.cid, owner, name, job.size)
+            response.status_code = status.HTTP_202_ACCEPTED
+            return UploadDone(cid=job.cid, size=job.size, job=job.id)
+        counter = Counter()
+        cid = await ipfs.add_stream(
+            counter.count(request.stream()),
+            content_type,
+            filename=filename,
+            name=name,
+            max_size=max_size,
+        )
+        record_pin(db, cid, owner, name, counter.size)
+        return UploadDone(cid=cid, size=counter.size)
+    finally:
+        if reservation is not None:
+            release_space(db, reservation)
+
+
+@router.get(
+    "/jobs/{job_id}",
+    response_model=UploadJob,
+    dependencies=[Depends(require_scopes(Scope.files_read))],
+)
+async def get_job(
+    job_id: str = Path(regex=r"^[0-9a-f]{32}$"),
+    uploads: UploadQueue | None = Depends(get_uploads),
+    owner: UUID = Depends(get_current_user_uuid),
+) -> UploadJob:
+    """Get status of background upload job.
+
+    Finished jobs are available for a day.
+    """
+    job = await uploads.get(job_id) if uploads is not None else None
+    if job is None or job.owner != owner:
+        raise UploadJobNotFoundException(status_code=status.HTTP_404_NOT_FOUND)
+    return UploadJob(
+        id=job.id,
+        cid=job.cid,
+        size=job.size,
+        status=job.status,
+        attempts=job.attempts,
+        error=job.error,
+        created_at=job.created_at,
+        updated_at=job.updated_at,
+    )
+
+
+@router.delete("/{cid}", dependencies=[Depends(require_scopes(Scope.files_write))])
+@limiter.limit("10/minute")
+async def remove(
+    request: Request,
+    cid: str = Path(regex=r"^(Qm[0-9A-Za-z]{44}|b[a-z2-7]{58})$"),
+    ipfs: IPFSClient = Depends(get_ipfs),
+    db: Session = Depends(get_session),
+    owner: UUID = Depends(get_current_user_uuid),
+) -> None:
+    """Unpin file uploaded by current user.
+
+    File is removed from cluster when no other user pins it.
+    """
+    found, shared = forget_pin(db, cid, owner)
+    if not found:
+        raise PinNotFoundException(status_code=status.HTTP_404_NOT_FOUND)
+    if not shared:
+        await ipfs.remove(cid)
@@ -0,0 +1,72 @@
+"""Users administration router."""
+
+from enum import Enum
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, Query, status
+from fastapi.responses import StreamingResponse
+from sqlmodel import Session
+
+from app.exceptions import InvalidCursorException, UserNotFoundException
+
+from ..database import get_engine
+from ..dependencies import admin_only, get_session
+from ..exporter import iter_csv, iter_ndjson, iter_users, parse_cursor
+from ..queries import load_user
+from ..revocations import revoke_user
+
+router: APIRouter = APIRouter(prefix="/users", tags=["users"])
+
+
+class ExportFormat(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+
+@router.get("/export", dependencies=[Depends(admin_only)], response_class=StreamingResponse)
+async def export_users(
+    format: ExportFormat = Query(ExportFormat.ndjson),
+    verifed: bool | None = Query(None),
+    disabled: bool | None = Query(None),
+    after: str | None = Query(None, description="`created_at:uuid` of the last received user."),
+) -> StreamingResponse:
+    """Stream all users without password hashes, ordered by `created_at` and `uuid`.
+
+    An interrupted export can be continued by passing the last received user as `after`.
+    """
+    position = None
+    if after is not None:
+        try:
+            position = parse_cursor(after)
+        except ValueError:
+            raise InvalidCursorException(status_code=400)
+    users = iter_users(get_engine(), verifed=verifed, disabled=disabled, after=position)
+    if format == ExportFormat.csv:
+        return StreamingResponse(iter_csv(users), media_type="text/csv")
+    return StreamingResponse(iter_ndjson(users), media_type="application/x-ndjson")
+
+
+@router.post("/{uuid}/disable", dependencies=[Depends(admin_only)], response_model=int)
+async def disable_user(uuid: UUID, db: Session = Depends(get_session)) -> int:
+    """Disable user and end all their sessions, reported to revocation feed.
+
+    Returns number of deleted refresh tokens.
+    """
+    if load_user(db.connection(), uuid) is None:
+        raise UserNotFoundException("User not found", status.HTTP_404_NOT_FOUND)
+    deleted = revoke_user(db.connection(), uuid, disable=True)
+    db.commit()
+    return deleted
+
+
+@router.post("/{uuid}/revoke", dependencies=[Depends(admin_only)], response_model=int)
+async def revoke_user_sessions(uuid: UUID, db: Session = Depends(get_session)) -> int:
+    """End all sessions of user, reported to revocation feed.
+
+    Returns number of deleted refresh tokens.
+    """
+    if load_user(db.connection(), uuid) is None:
+        raise UserNotFoundException("User not found", status.HTTP_404_NOT_FOUND)
+    deleted = revoke_user(db.connection(), uuid)
+    db.commit()
+    return deleted
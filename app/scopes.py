@@ -0,0 +1,96 @@
+"""Access token scopes.
+
+Scopes are packed to an integer `scp` claim, bit positions are defined by
+the layout with version from `scv` claim. To change the bit layout, add a
+new version to `LAYOUTS`: tokens are issued with the latest one, while
+tokens issued with older layouts are still read correctly. Old layouts may
+be removed when tokens issued with them expired (access tokens live for
+`ACCESS_TOKEN_EXPIRE_MINUTES` minutes).
+
+Checks don't touch the database: masks of required scopes are computed
+for every layout once, so a check is a single bitwise AND.
+"""
+
+from enum import Enum
+from typing import Iterable, Mapping
+from uuid import UUID
+
+
+class Scope(str, Enum):
+    """Named permission."""
+
+    files_read = "files:read"
+    files_write = "files:write"
+
+
+# Scope of bit N is at position N. Never reorder a published layout, add a new version
+LAYOUTS: dict[int, tuple[Scope, ...]] = {
+    1: (Scope.files_read, Scope.files_write),
+}
+CURRENT_VERSION = max(LAYOUTS)
+
+USER_SCOPES = frozenset({Scope.files_read, Scope.files_write})
+# Tokens issued before scopes were added have no `scv` claim
+LEGACY_SCOPES = USER_SCOPES
+
+ClaimsType = Mapping[str, str | int | float]
+
+
+def pack(scopes: Iterable[Scope], version: int = CURRENT_VERSION) -> int:
+    """Pack scopes to integer.
+
+    Raises:
+        ValueError: If scope is not present in layout.
+    """
+    layout = LAYOUTS[version]
+    value = 0
+    for scope in scopes:
+        value |= 1 << layout.index(scope)
+    return value
+
+
+def unpack(value: int, version: int = CURRENT_VERSION) -> frozenset[Scope]:
+    """Unpack integer to scopes, unknown bits are ignored."""
+    return frozenset(scope for bit, scope in enumerate(LAYOUTS[version]) if value >> bit & 1)
+
+
+def user_scopes(user: UUID) -> frozenset[Scope]:
+    """Get scopes granted to user, the same for everyone until roles are added."""
+    return USER_SCOPES
+
+
+def scope_claims(scopes: Iterable[Scope]) -> dict[str, str | int | float]:
+    """Get JWT claims with packed scopes."""
+    return {"scp": pack(scopes), "scv": CURRENT_VERSION}
+
+
+def token_scopes(claims: ClaimsType) -> frozenset[Scope]:
+    """Get scopes from decoded JWT claims."""
+    version = claims.get("scv")
+    if version is None:
+        return LEGACY_SCOPES
+    value = claims.get("scp")
+    if not isinstance(version, int) or version not in LAYOUTS or not isinstance(value, int):
+        return frozenset()
+    return unpack(value, version)
+
+
+class ScopeMask:
+    """Precomputed check of required scopes for every layout."""
+
+    def __init__(self, scopes: Iterable[Scope]) -> None:
+        """Precomputed check of required scopes for every layout."""
+        self.scopes = frozenset(scopes)
+        # `None` if a layout lacks some scope, tokens with such layout never pass
+        self.masks: dict[int, int | None] = {}
+        for version, layout in LAYOUTS.items():
+            self.masks[version] = pack(self.scopes, version) if self.scopes <= set(layout) else None
+
+    def check(self, claims: ClaimsType) -> bool:
+        """Check that decoded JWT claims contain all required scopes."""
+        version = claims.get("scv")
+        if version is None:
+            return self.scopes <= LEGACY_SCOPES
+        mask = self.masks.get(version) if isinstance(version, int) else None
+        value = claims.get("scp")
+        return mask is not None and isinstance(value, int) and value & mask == mask
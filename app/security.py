@@ -1,16 +1,41 @@
 """Module containing authentication-related functions."""
 
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
+from fastapi import status
 from fastapi.security import OAuth2PasswordBearer
-from passlib.context import CryptContext
 from sqlmodel import Session
 
 from app.exceptions import InvalidPasswordException, UserNotFoundException
-from app.models.user import User
+from app.models.audit import AuditKind
+from app.models.user import Credentials
+
+from .audit import audit_log
+from .queries import load_credentials
+from .tracing import traced
+
+if TYPE_CHECKING:
+    from passlib.context import CryptContext
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="authorization/login/get_token_pair")
 
 
+@lru_cache(maxsize=None)
+def get_pwd_context() -> "CryptContext":
+    """Get password hashing context.
+
+    passlib is imported on the first call, not at module import.
+
+    Returns:
+        CryptContext: Bcrypt password context.
+    """
+    from passlib.context import CryptContext
+
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+@traced("password.verify")
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Compare plain password and password hash.
 
@@ -19,11 +44,17 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
         hashed_password: Hashed password string.
 
     Returns:
-        bool: `True` if the password matched the hash, else `False`.
+        bool: `True` if the password matched the hash, else `False`. Empty or
+            unknown hash (e.g. of users created before passwords were stored)
+            never matches.
     """
-    return pwd_context.verify(plain_password, hashed_password)  # type: ignore
+    context = get_pwd_context()
+    if not hashed_password or context.identify(hashed_password) is None:
+        return False
+    return context.verify(plain_password, hashed_password)  # type: ignore
 
 
+@traced("password.hash")
 def get_password_hash(password: str) -> str:
     """Compute pasword hash from plain password string.
 
@@ -33,27 +64,35 @@ def get_password_hash(password: str) -> str:
     Returns:
         str: Hashed password.
     """
-    return pwd_context.hash(password)  # type: ignore
+    return get_pwd_context().hash(password)  # type: ignore
 
 
-def authenticate_user(db: Session, nickname: str, password: str) -> User:
-    """Verify nickname and password.
+def authenticate_user(
+    db: Session, nickname: str, password: str, ip: str | None = None
+) -> Credentials:
+    """Verify nickname and password, the attempt is recorded to audit log.
 
     Args:
         db: Database session.
         nickname: User nickname.
         password: Plain password.
+        ip: Client address for audit log.
 
     Raises:
         UserNotFoundException: If nickname not found in database.
         InvalidPasswordException: If password invalid.
 
     Returns:
-        User: If everything ok.
+        Credentials: Uuid and password hash, if everything ok.
     """
-    user: User | None = db.query(User).where(User.nickname == nickname).first()
-    if not user:
+    user = load_credentials(db.connection(), nickname)
+    if user is None:
+        audit_log.record(AuditKind.login_failed, nickname=nickname, ip=ip, detail="unknown_user")
         raise UserNotFoundException()
     if not verify_password(password, user.password):
-        raise InvalidPasswordException()
+        audit_log.record(
+            AuditKind.login_failed, user=user.uuid, nickname=nickname, ip=ip, detail="password"
+        )
+        raise InvalidPasswordException(status_code=status.HTTP_401_UNAUTHORIZED)
+    audit_log.record(AuditKind.login, user=user.uuid, nickname=nickname, ip=ip)
     return user
@@ -0,0 +1,363 @@
+"""Production server with multi-worker supervision.
+
+The supervisor builds the app once, forks worker processes that serve it with
+uvicorn (uvloop + httptools) and keeps the configured number of them alive.
+
+Signals handled by the supervisor:
+- `SIGTERM`, `SIGINT`: graceful shutdown of all workers, each worker drains
+  in-flight requests for up to `DRAIN_TIMEOUT` seconds, see `app.lifecycle`.
+- `SIGHUP`: graceful restart, a new generation of workers is started and every
+  old worker is stopped once its replacement is ready. New workers are forked
+  from the same supervisor, so they run the same code with the same settings,
+  restart the supervisor to deploy new code or settings.
+
+A worker that served max requests keeps serving until its replacement is
+ready, so there is always a warm worker accepting connections. Workers report
+to the supervisor through a pipe with lines like `ready <pid>`.
+"""
+
+import asyncio
+import os
+import signal
+import socket
+import time
+from random import randint
+from types import FrameType
+
+import uvicorn
+from fastapi import FastAPI
+from loguru import logger
+
+
+def default_workers() -> int:
+    """Get number of workers sized to available CPU cores.
+
+    Returns:
+        int: Number of CPU cores this process may run on.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def bind_socket(
+    host: str, port: int, reuse_port: bool = False, backlog: int = 2048
+) -> socket.socket:
+    """Create listening TCP socket.
+
+    Args:
+        host: Host to bind.
+        port: Port to bind.
+        reuse_port: Set `SO_REUSEPORT`, so several sockets can listen on the same port
+            and the kernel balances connections between them.
+        backlog: Listen backlog.
+
+    Returns:
+        socket.socket: Listening socket.
+    """
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class WorkerServer(uvicorn.Server):  # type: ignore[misc]
+    """Uvicorn server which starts draining the app on exit signal.
+
+    Uvicorn itself waits for in-flight requests without a limit, draining
+    cancels them at the deadline, so lifespan shutdown runs in time.
+    """
+
+    def __init__(
+        self, config: uvicorn.Config, notify: int | None = None, max_requests: int | None = None
+    ) -> None:
+        """Uvicorn server which starts draining the app on exit signal.
+
+        Args:
+            config: Uvicorn config.
+            notify: Pipe to report `ready` and `retire` to supervisor. Without it
+                worker exits right after max requests.
+            max_requests: Ask for replacement after serving this many requests.
+        """
+        super().__init__(config)
+        self.notify = notify
+        self.max_requests = max_requests
+        self.reported_ready = False
+        self.retiring = False
+
+    def _report(self, message: str) -> None:
+        if self.notify is not None:
+            os.write(self.notify, f"{message} {os.getpid()}\n".encode())
+
+    async def on_tick(self, counter: int) -> bool:
+        """Report readiness and max requests to supervisor.
+
+        Returns:
+            bool: Whether the worker should exit.
+        """
+        if await super().on_tick(counter):
+            return True
+        app: FastAPI = self.config.app
+        if not self.reported_ready and app.state.drainer.ready:
+            self.reported_ready = True
+            self._report("ready")
+        if self.max_requests is None or self.server_state.total_requests < self.max_requests:
+            return False
+        if self.notify is None:
+            return True
+        if not self.retiring:
+            # Supervisor stops this worker once its replacement is ready
+            self.retiring = True
+            self._report("retire")
+        return False
+
+    def handle_exit(self, sig: int, frame: FrameType | None) -> None:
+        """Handle `SIGTERM` and `SIGINT`."""
+        from .settings import get_settings
+
+        # Stop accepting right away, new connections go to other workers
+        # instead of getting 503 from draining one
+        for server in self.servers:
+            server.close()
+        app: FastAPI = self.config.app
+        if not app.state.drainer.draining:
+            self.drain_task = asyncio.get_event_loop().create_task(
+                app.state.drainer.drain(get_settings().drain_timeout)
+            )
+        super().handle_exit(sig, frame)
+
+
+def preload() -> FastAPI:
+    """Build the app and import lazily loaded modules in the supervisor.
+
+    Everything loaded here is shared with workers through copy-on-write memory.
+    Connection pools are not created, each worker opens its own in startup hook.
+
+    Returns:
+        FastAPI: App instance.
+    """
+    import aiohttp  # noqa: F401
+    import jose.jwt  # noqa: F401
+
+    from .main import create_app
+    from .security import get_pwd_context
+
+    app = create_app()
+    get_pwd_context()
+    return app
+
+
+class Supervisor:
+    """Pre-fork worker supervisor."""
+
+    def __init__(
+        self,
+        app: FastAPI,
+        host: str = "127.0.0.1",
+        port: int = 8000,
+        workers: int = 1,
+        reuse_port: bool = False,
+        max_requests: int | None = None,
+        max_requests_jitter: int = 0,
+        graceful_timeout: float = 30,
+    ) -> None:
+        """Pre-fork worker supervisor.
+
+        Examples:
+            >>> Supervisor(preload(), port=8000, workers=4, max_requests=10000).run()
+
+        Args:
+            app: Preloaded app.
+            host: Host to listen.
+            port: Port to listen.
+            workers: Number of worker processes.
+            reuse_port: Bind a separate `SO_REUSEPORT` socket in every worker
+                instead of sharing one socket bound by supervisor.
+            max_requests: Restart worker after it served this many requests.
+            max_requests_jitter: Random value up to this number is added to
+                `max_requests`, so workers don't restart at the same time.
+            graceful_timeout: Seconds to wait for a stopping worker before killing it.
+        """
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.reuse_port = reuse_port
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.graceful_timeout = graceful_timeout
+
+        self.sock: socket.socket | None = None
+        self.notify_read = -1
+        self.notify_write = -1
+        self.notify_buffer = b""
+        self.generation = 0
+        # pid -> generation
+        self.children: dict[int, int] = {}
+        # pid -> time when SIGTERM was sent
+        self.stopping: dict[int, float] = {}
+        # new pid -> old pid, old worker is stopped once the new one is ready
+        self.replacing: dict[int, int] = {}
+        self.should_exit = False
+        self.should_reload = False
+
+    def run(self) -> None:
+        """Start workers and supervise them until shutdown."""
+        if not self.reuse_port:
+            self.sock = bind_socket(self.host, self.port)
+        self.notify_read, self.notify_write = os.pipe()
+        os.set_blocking(self.notify_read, False)
+        signal.signal(signal.SIGTERM, self._handle_exit)
+        signal.signal(signal.SIGINT, self._handle_exit)
+        signal.signal(signal.SIGHUP, self._handle_reload)
+        logger.info(f"Starting {self.workers} workers on {self.host}:{self.port}")
+
+        self._spawn_generation()
+        while not self.should_exit:
+            if self.should_reload:
+                self.should_reload = False
+                self._reload()
+            self._read_messages()
+            self._reap()
+            self._kill_stuck()
+            self._spawn_missing()
+            time.sleep(0.1)
+
+        logger.info("Shutting down workers")
+        for pid in list(self.children):
+            self._stop(pid)
+        while self.children:
+            self._reap()
+            self._kill_stuck()
+            time.sleep(0.1)
+        if self.sock is not None:
+            self.sock.close()
+        os.close(self.notify_read)
+        os.close(self.notify_write)
+        logger.info("Stopped")
+
+    def _handle_exit(self, signum: int, frame: FrameType | None) -> None:
+        self.should_exit = True
+
+    def _handle_reload(self, signum: int, frame: FrameType | None) -> None:
+        self.should_reload = True
+
+    def _spawn_generation(self) -> list[int]:
+        self.generation += 1
+        return [self._spawn() for _ in range(self.workers)]
+
+    def _spawn(self) -> int:
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                self._run_worker()
+            except BaseException:
+                logger.exception("Worker crashed")
+                code = 1
+            finally:
+                os._exit(code)
+        self.children[pid] = self.generation
+        logger.info(f"Started worker {pid} (generation {self.generation})")
+        return pid
+
+    def _run_worker(self) -> None:
+        """Worker process entry point."""
+        for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            signal.signal(sig, signal.SIG_DFL)
+        os.close(self.notify_read)
+        sock = self.sock
+        if sock is None:
+            sock = bind_socket(self.host, self.port, reuse_port=True)
+        max_requests = None
+        if self.max_requests is not None:
+            max_requests = self.max_requests + randint(0, self.max_requests_jitter)
+        config = uvicorn.Config(
+            self.app,
+            loop="uvloop",
+            http="httptools",
+            lifespan="on",
+        )
+        WorkerServer(config, self.notify_write, max_requests).run(sockets=[sock])
+
+    def _reload(self) -> None:
+        logger.info("Restarting workers")
+        # Replacements which are not ready yet are superseded by the new generation
+        for pid in self.replacing:
+            self._stop(pid)
+        old = [pid for pid in self.children if pid not in self.stopping]
+        self.replacing = dict(zip(self._spawn_generation(), old))
+
+    def _read_messages(self) -> None:
+        try:
+            self.notify_buffer += os.read(self.notify_read, 4096)
+        except BlockingIOError:
+            return
+        *lines, self.notify_buffer = self.notify_buffer.split(b"\n")
+        for line in lines:
+            message, _, pid_of = line.decode().partition(" ")
+            pid = int(pid_of)
+            if pid not in self.children or pid in self.stopping:
+                continue
+            if message == "retire" and pid not in self.replacing.values():
+                logger.info(f"Worker {pid} reached max requests, starting replacement")
+                self.replacing[self._spawn()] = pid
+            elif message == "ready" and pid in self.replacing:
+                old = self.replacing.pop(pid)
+                if old in self.children:
+                    self._stop(old)
+
+    def _stop(self, pid: int) -> None:
+        if pid in self.stopping:
+            return
+        self.stopping[pid] = time.monotonic()
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+    def _reap(self) -> None:
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self.children.clear()
+                return
+            if pid == 0:
+                return
+            self.children.pop(pid, None)
+            # Replacement died before it was ready, old worker waits for the next one
+            old = self.replacing.pop(pid, None)
+            if old is not None and old in self.children and not self.should_exit:
+                self.replacing[self._spawn()] = old
+            if self.stopping.pop(pid, None) is None:
+                code = os.waitstatus_to_exitcode(status)
+                logger.warning(f"Worker {pid} exited with status {code}")
+
+    def _kill_stuck(self) -> None:
+        deadline = time.monotonic() - self.graceful_timeout
+        for pid, stopped_at in list(self.stopping.items()):
+            if stopped_at < deadline:
+                logger.warning(f"Worker {pid} did not stop in time, killing")
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+
+    def _spawn_missing(self) -> None:
+        """Replace workers of the current generation that crashed."""
+        if self.should_exit:
+            return
+        retiring = set(self.replacing.values())
+        alive = sum(
+            1
+            for pid, generation in self.children.items()
+            if generation == self.generation and pid not in self.stopping and pid not in retiring
+        )
+        for _ in range(self.workers - alive):
+            self._spawn()
@@ -0,0 +1,92 @@
+"""Module containing typed application settings.
+
+Settings are read from environment variables once and cached, so modules
+don't have to touch `os.environ` at import time.
+"""
+
+from uuid import UUID
+
+from pydantic import BaseSettings, root_validator
+
+
+class Settings(BaseSettings):
+    """Application settings.
+
+    Every field is read from the environment variable with the same name
+    in upper case, e.g. `db_url` is read from `DB_URL`.
+    """
+
+    db_url: str
+    ipfs_url: str
+    secret: str
+    ipfs_username: str | None = None
+    ipfs_password: str | None = None
+    ipfs_hedge_percentile: float | None = None
+    log_file: str | None = None
+    profile_dir: str = "profiles"
+    profile_interval: float | None = None
+    trace_export: str | None = None
+    trace_sample_rate: float = 1.0
+    origin: str = "*"
+    admins: list[UUID] = []
+    introspection_keys: list[str] = []
+    access_token_expire_minutes: int = 15
+    user_cache_size: int = 100_000
+    name_index_refresh: float = 300
+    upload_max_size: int = 100 * 1024 * 1024
+    upload_quota: int | None = None
+    upload_spool: str | None = None
+    upload_workers: int = 4
+    drain_timeout: float = 20
+    smtp_host: str | None = None
+    smtp_port: int = 25
+    smtp_username: str | None = None
+    smtp_password: str | None = None
+    smtp_starttls: bool = False
+    mail_from: str = "noreply@firesquare.ru"
+    mail_spool: str = "mail-spool"
+    audit_spool: str | None = None
+    audit_retention: int = 90
+
+    @root_validator(skip_on_failure=True)
+    def check_ipfs_auth(cls, values: dict[str, str | None]) -> dict[str, str | None]:
+        """Check that `IPFS_PASSWORD` is present if `IPFS_USERNAME` is set."""
+        if values.get("ipfs_username") is not None and values.get("ipfs_password") is None:
+            raise ValueError("IPFS_PASSWORD is required if IPFS_USERNAME is set")
+        return values
+
+    @property
+    def ipfs_auth(self) -> tuple[str, str] | None:
+        """Basic auth pair for IPFS cluster, if configured."""
+        if self.ipfs_username is None or self.ipfs_password is None:
+            return None
+        return (self.ipfs_username, self.ipfs_password)
+
+
+_settings: Settings | None = None
+
+
+def get_settings() -> Settings:
+    """Get current settings.
+
+    Settings are parsed from environment on the first call and cached.
+
+    Returns:
+        Settings: Current settings.
+    """
+    global _settings
+    if _settings is None:
+        _settings = Settings()  # type: ignore[call-arg]
+    return _settings
+
+
+def configure(settings: Settings) -> None:
+    """Replace current settings.
+
+    Must be called before the database engine is created, `create_app` does it.
+
+    Args:
+        settings: New settings.
+    """
+    global _settings
+    _settings = settings
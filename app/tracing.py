@@ -0,0 +1,526 @@
+"""Request tracing compatible with OpenTelemetry.
+
+Spans are created around requests (`TracingMiddleware`), SQL statements
+(`instrument_engine`), IPFS cluster calls (`aiohttp_trace_config`) and
+functions decorated with `traced`, e.g. password hashing and JWT encoding.
+Trace context is read from and sent in the W3C `traceparent` header, so
+traces continue across services.
+
+Finished spans are put to an in-memory queue and exported in batches by a
+background thread as OTLP/JSON, either appended to a file (one batch per
+line) or posted to an OTLP/HTTP collector. The request path never waits for
+the exporter: when the queue is full, spans are dropped and counted.
+
+Tracing is disabled until `Tracer.start` is called, then all spans cost a
+few attribute lookups.
+"""
+
+import json
+import os
+import queue
+import random
+import re
+import threading
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from time import time_ns
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Callable, Iterator, ParamSpec, TypeVar
+
+from loguru import logger
+from sqlalchemy import event
+from sqlalchemy.engine import Connection, Engine, ExceptionContext
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+if TYPE_CHECKING:
+    import aiohttp
+
+P = ParamSpec("P")
+T = TypeVar("T")
+AttributeValue = str | int | float | bool
+
+TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+# OTLP span kinds
+INTERNAL, SERVER, CLIENT = 1, 2, 3
+
+
+class Span:
+    """Timed operation of a trace."""
+
+    __slots__ = (
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "name",
+        "kind",
+        "start",
+        "end",
+        "attributes",
+        "error",
+        "sampled",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        trace_id: str,
+        parent_id: str | None,
+        kind: int = INTERNAL,
+        sampled: bool = True,
+    ) -> None:
+        """Timed operation of a trace, started on creation."""
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start = time_ns()
+        self.end = 0
+        self.attributes: dict[str, AttributeValue] = {}
+        self.error: str | None = None
+        self.sampled = sampled
+
+    @property
+    def traceparent(self) -> str:
+        """W3C `traceparent` header value with this span as parent."""
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def to_otlp(self) -> dict[str, object]:
+        """Convert to OTLP/JSON span."""
+        span: dict[str, object] = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start),
+            "endTimeUnixNano": str(self.end),
+            "attributes": [
+                {"key": key, "value": otlp_value(value)} for key, value in self.attributes.items()
+            ],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 0},
+        }
+        if self.parent_id is not None:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def otlp_value(value: AttributeValue) -> dict[str, AttributeValue]:
+    """Convert attribute value to OTLP/JSON `AnyValue`."""
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        # 64-bit integers are strings in OTLP/JSON
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": value}
+
+
+def parse_traceparent(header: str | None) -> tuple[str, str, bool] | None:
+    """Parse W3C `traceparent` header.
+
+    Returns:
+        Trace ID, parent span ID and sampled flag, `None` if header is absent or invalid.
+    """
+    if header is None:
+        return None
+    match = TRACEPARENT.match(header.strip().lower())
+    if match is None or match[1] == "0" * 32 or match[2] == "0" * 16:
+        return None
+    return match[1], match[2], bool(int(match[3], 16) & 1)
+
+
+class FileSink:
+    """Append batches of spans to a file, one OTLP/JSON request per line."""
+
+    def __init__(self, path: str) -> None:
+        """Append batches of spans to a file."""
+        self.path = path
+
+    def __call__(self, body: bytes) -> None:
+        """Write batch."""
+        with open(self.path, "ab") as file:
+            file.write(body + b"\n")
+
+
+class OTLPHTTPSink:
+    """Post batches of spans to OTLP/HTTP collector, e.g. `http://127.0.0.1:4318/v1/traces`."""
+
+    def __init__(self, url: str, timeout: float = 10) -> None:
+        """Post batches of spans to OTLP/HTTP collector."""
+        self.url = url
+        self.timeout = timeout
+
+    def __call__(self, body: bytes) -> None:
+        """Send batch."""
+        request = urllib.request.Request(
+            self.url, body, {"Content-Type": "application/json"}, method="POST"
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout):
+            pass
+
+
+def get_sink(target: str) -> Callable[[bytes], None]:
+    """Get sink by `TRACE_EXPORT` value: `http(s)://` collector url or file path."""
+    if target.startswith(("http://", "https://")):
+        return OTLPHTTPSink(target)
+    return FileSink(target.removeprefix("file://"))
+
+
+class BatchExporter:
+    """Export spans in batches from a background thread."""
+
+    def __init__(
+        self,
+        sink: Callable[[bytes], None],
+        service: str = "firesquare-api",
+        max_queue: int = 4096,
+        batch_size: int = 512,
+        interval: float = 5,
+    ) -> None:
+        """Export spans in batches from a background thread.
+
+        Args:
+            sink: Function writing OTLP/JSON request body.
+            service: `service.name` resource attribute.
+            max_queue: Spans are dropped when this many are waiting.
+            batch_size: Maximum spans in one batch.
+            interval: Seconds to wait for a full batch before exporting a partial one.
+        """
+        self.sink = sink
+        self.service = service
+        self.queue: queue.Queue[Span | None] = queue.Queue(max_queue)
+        self.batch_size = batch_size
+        self.interval = interval
+        self.dropped = 0
+        self.exported = 0
+        self.thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        """Start exporter thread."""
+        self.thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        """Export remaining spans and stop exporter thread."""
+        if self.thread is None:
+            return
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+
+    def export(self, span: Span) -> None:
+        """Queue finished span, never blocks."""
+        try:
+            self.queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def encode(self, spans: list[Span]) -> bytes:
+        """Build OTLP/JSON `ExportTraceServiceRequest`."""
+        request = {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [
+                            {"key": "service.name", "value": {"stringValue": self.service}},
+                            {"key": "process.pid", "value": {"intValue": str(os.getpid())}},
+                        ]
+                    },
+                    "scopeSpans": [
+                        {"scope": {"name": "app"}, "spans": [span.to_otlp() for span in spans]}
+                    ],
+                }
+            ]
+        }
+        return json.dumps(request, separators=(",", ":")).encode()
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            batch: list[Span] = []
+            try:
+                span = self.queue.get(timeout=self.interval)
+                while span is not None:
+                    batch.append(span)
+                    if len(batch) >= self.batch_size:
+                        break
+                    span = self.queue.get_nowait()
+                stopping = span is None
+            except queue.Empty:
+                pass
+            if not batch:
+                continue
+            try:
+                self.sink(self.encode(batch))
+                self.exported += len(batch)
+            except Exception:
+                logger.exception(f"Cannot export {len(batch)} spans")
+
+
+class Tracer:
+    """Creates spans and sends finished ones to exporter."""
+
+    def __init__(self) -> None:
+        """Creates spans and sends finished ones to exporter, disabled until `start`."""
+        self.exporter: BatchExporter | None = None
+        self.sample_rate = 1.0
+        self.current: ContextVar[Span | None] = ContextVar("span", default=None)
+
+    @property
+    def enabled(self) -> bool:
+        """Whether spans are recorded."""
+        return self.exporter is not None
+
+    def start(self, exporter: BatchExporter, sample_rate: float = 1.0) -> None:
+        """Start recording spans.
+
+        Args:
+            exporter: Exporter of finished spans, started here.
+            sample_rate: Share of traces recorded, traces continued from
+                `traceparent` follow its sampled flag.
+        """
+        exporter.start()
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+
+    def stop(self) -> None:
+        """Stop recording spans and flush exporter."""
+        exporter, self.exporter = self.exporter, None
+        if exporter is not None:
+            exporter.stop()
+
+    def start_span(
+        self,
+        name: str,
+        kind: int = INTERNAL,
+        parent: Span | None = None,
+        traceparent: str | None = None,
+        require_parent: bool = False,
+    ) -> Span | None:
+        """Start span without making it current.
+
+        Args:
+            name: Operation name.
+            kind: OTLP span kind.
+            parent: Parent span, the current span by default.
+            traceparent: Remote parent from W3C `traceparent` header, used if there is no parent.
+            require_parent: Don't start new trace, e.g. for queries of background tasks.
+
+        Returns:
+            Span: New span, `None` if tracing is disabled or trace is not sampled.
+        """
+        if self.exporter is None:
+            return None
+        if parent is None:
+            parent = self.current.get()
+        if parent is not None:
+            span = Span(name, parent.trace_id, parent.span_id, kind, parent.sampled)
+        elif (remote := parse_traceparent(traceparent)) is not None:
+            span = Span(name, remote[0], remote[1], kind, remote[2])
+        elif require_parent:
+            return None
+        else:
+            sampled = self.sample_rate >= 1 or random.random() < self.sample_rate
+            span = Span(name, f"{random.getrandbits(128):032x}", None, kind, sampled)
+        return span
+
+    def end_span(self, span: Span | None, error: BaseException | str | None = None) -> None:
+        """Finish span and queue it for export."""
+        if span is None:
+            return
+        span.end = time_ns()
+        if error is not None:
+            span.error = error if isinstance(error, str) else f"{type(error).__name__}: {error}"
+        if span.sampled and self.exporter is not None:
+            self.exporter.export(span)
+
+    @contextmanager
+    def span(self, name: str, kind: int = INTERNAL) -> Iterator[Span | None]:
+        """Run block in a new current span.
+
+        Examples:
+            >>> with tracer.span("hash") as span:
+            >>>     hash_password()
+        """
+        span = self.start_span(name, kind)
+        if span is None:
+            yield None
+            return
+        token = self.current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            self.end_span(span, e)
+            raise
+        else:
+            self.end_span(span)
+        finally:
+            self.current.reset(token)
+
+
+tracer = Tracer()
+
+
+def traced(name: str) -> Callable[[Callable[P, T]], Callable[P, T]]:
+    """Decorate function to run it in a span.
+
+    Examples:
+        >>> @traced("password.verify")
+        >>> def verify_password(plain_password: str, hashed_password: str) -> bool:
+        >>>     ...
+    """
+
+    def decorator(func: Callable[P, T]) -> Callable[P, T]:
+        @wraps(func)
+        def wrapper(*args: P.args, **kwargs: P.kwargs) -> T:
+            if tracer.exporter is None:
+                return func(*args, **kwargs)
+            with tracer.span(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Record span for every SQL statement executed by engine."""
+
+    def before_execute(
+        connection: Connection,
+        cursor: object,
+        statement: str,
+        parameters: object,
+        context: object,
+        executemany: bool,
+    ) -> None:
+        name = statement.split(None, 1)[0].upper() if statement else "SQL"
+        span = tracer.start_span(name, CLIENT, require_parent=True)
+        if span is not None:
+            span.attributes["db.system"] = engine.dialect.name
+            span.attributes["db.statement"] = statement[:2048]
+        connection.info.setdefault("spans", []).append(span)
+
+    def after_execute(
+        connection: Connection,
+        cursor: object,
+        statement: str,
+        parameters: object,
+        context: object,
+        executemany: bool,
+    ) -> None:
+        spans = connection.info.get("spans")
+        if spans:
+            tracer.end_span(spans.pop())
+
+    def on_error(context: ExceptionContext) -> None:
+        spans = context.connection.info.get("spans") if context.connection is not None else None
+        if spans:
+            tracer.end_span(spans.pop(), context.original_exception)
+
+    event.listen(engine, "before_cursor_execute", before_execute)
+    event.listen(engine, "after_cursor_execute", after_execute)
+    event.listen(engine, "handle_error", on_error)
+
+
+def aiohttp_trace_config() -> "aiohttp.TraceConfig":
+    """Get aiohttp trace config recording a client span for every request.
+
+    The `traceparent` header is added to requests, so cluster proxies can continue the trace.
+    """
+    import aiohttp
+
+    async def on_start(
+        session: aiohttp.ClientSession,
+        context: SimpleNamespace,
+        params: aiohttp.TraceRequestStartParams,
+    ) -> None:
+        span = tracer.start_span(f"HTTP {params.method}", CLIENT, require_parent=True)
+        context.span = span
+        if span is not None:
+            span.attributes["http.method"] = params.method
+            span.attributes["http.url"] = str(params.url.with_query(None))
+            params.headers["traceparent"] = span.traceparent
+
+    async def on_end(
+        session: aiohttp.ClientSession,
+        context: SimpleNamespace,
+        params: aiohttp.TraceRequestEndParams,
+    ) -> None:
+        span = getattr(context, "span", None)
+        if span is not None:
+            span.attributes["http.status_code"] = params.response.status
+            tracer.end_span(
+                span, f"HTTP {params.response.status}" if params.response.status >= 500 else None
+            )
+
+    async def on_exception(
+        session: aiohttp.ClientSession,
+        context: SimpleNamespace,
+        params: aiohttp.TraceRequestExceptionParams,
+    ) -> None:
+        tracer.end_span(getattr(context, "span", None), params.exception)
+
+    config = aiohttp.TraceConfig()
+    config.on_request_start.append(on_start)  # type: ignore[arg-type]
+    config.on_request_end.append(on_end)  # type: ignore[arg-type]
+    config.on_request_exception.append(on_exception)  # type: ignore[arg-type]
+    return config
+
+
+class TracingMiddleware:
+    """Record server span for every HTTP request.
+
+    Pure ASGI middleware, so the span is current in the endpoint.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        """Record server span for every HTTP request."""
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Handle request."""
+        if scope["type"] != "http" or tracer.exporter is None:
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        traceparent = headers.get(b"traceparent")
+        span = tracer.start_span(
+            f"{scope['method']} {scope['path']}",
+            SERVER,
+            traceparent=traceparent.decode("latin-1") if traceparent is not None else None,
+        )
+        assert span is not None
+        span.attributes["http.method"] = scope["method"]
+        span.attributes["http.target"] = scope["path"]
+
+        async def send_with_status(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                span.attributes["http.status_code"] = message["status"]
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (b"traceparent", span.traceparent.encode()),
+                ]
+            await send(message)
+
+        token = tracer.current.set(span)
+        error: BaseException | None = None
+        try:
+            await self.app(scope, receive, send_with_status)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            tracer.current.reset(token)
+            route = scope.get("route")
+            if route is not None and hasattr(route, "path"):
+                span.name = f"{scope['method']} {route.path}"
+                span.attributes["http.route"] = route.path
+            status = span.attributes.get("http.status_code", 500)
+            if error is None and isinstance(status, int) and status >= 500:
+                tracer.end_span(span, f"HTTP {status}")
+            else:
+                tracer.end_span(span, error)
@@ -0,0 +1,488 @@
+"""Durable background upload queue.
+
+Uploaded files are written to a spool directory on local disk and jobs are
+recorded in a SQLite database (WAL mode) next to them, so the client gets a
+response as soon as the body is received. The file CID is computed locally,
+see `app.ipfs.unixfs`.
+
+Worker tasks of every process sharing the spool claim jobs one by one and
+add files to the cluster, failed uploads are retried with exponential backoff.
+A claim is a lease of the queue instance, renewed while it runs. Jobs whose
+lease expired are returned to the queue, so nothing is lost when a worker
+crashes, even if a restarted process gets the same PID. Finished jobs are
+kept for `retention` seconds to report their status.
+"""
+
+import asyncio
+import os
+import sqlite3
+import time
+from contextlib import closing
+from dataclasses import dataclass
+from enum import Enum
+from pathlib import Path
+from typing import AsyncIterable, Coroutine
+from uuid import UUID, uuid4
+
+from fastapi import status
+from loguru import logger
+from sqlalchemy.engine import Engine
+
+from .exceptions import FileTooLargeException, IPFSException
+from .ipfs import IPFSClient
+from .ipfs.unixfs import file_cid
+from .models.pin import PinStatus
+from .pins import set_status
+from .utils import int_time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS job (
+    id TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    cid TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    content_type TEXT NOT NULL,
+    filename TEXT,
+    name TEXT,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    pid INTEGER,
+    claimed_by TEXT,
+    lease_until INTEGER,
+    next_attempt INTEGER NOT NULL,
+    created_at INTEGER NOT NULL,
+    updated_at INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS job_queue ON job (status, next_attempt);
+"""
+# Columns added after the first version, for existing spools
+LEASE_COLUMNS = {"claimed_by": "TEXT", "lease_until": "INTEGER"}
+
+
+class JobStatus(str, Enum):
+    """Upload job state."""
+
+    queued = "queued"
+    uploading = "uploading"
+    done = "done"
+    failed = "failed"
+
+
+@dataclass
+class Job:
+    """Upload job."""
+
+    id: str
+    owner: UUID
+    cid: str
+    size: int
+    content_type: str
+    filename: str | None
+    name: str | None
+    status: JobStatus
+    attempts: int
+    error: str | None
+    created_at: int
+    updated_at: int
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> "Job":
+        """Build job from `job` table row."""
+        return cls(
+            id=row["id"],
+            owner=UUID(row["owner"]),
+            cid=row["cid"],
+            size=row["size"],
+            content_type=row["content_type"],
+            filename=row["filename"],
+            name=row["name"],
+            status=JobStatus(row["status"]),
+            attempts=row["attempts"],
+            error=row["error"],
+            created_at=row["created_at"],
+            updated_at=row["updated_at"],
+        )
+
+
+class UploadQueue:
+    """Durable queue of files to add to IPFS cluster."""
+
+    def __init__(
+        self,
+        ipfs: IPFSClient,
+        engine: Engine,
+        spool_dir: str,
+        workers: int = 4,
+        max_attempts: int = 8,
+        retry_delay: float = 5,
+        retention: int = 24 * 3600,
+        poll_interval: float = 1,
+        lease: int = 60,
+    ) -> None:
+        """Durable queue of files to add to IPFS cluster.
+
+        Examples:
+            >>> queue = UploadQueue(ipfs, get_engine(), "upload-spool")
+            >>> await queue.start()
+            >>> job = await queue.enqueue(request.stream(), "text/plain", owner)
+            >>> (await queue.get(job.id)).status
+            <JobStatus.done: 'done'>
+            >>> await queue.stop()
+
+        Args:
+            ipfs: Cluster client.
+            engine: Database engine, statuses of uploaded pins are updated in `pin` table.
+            spool_dir: Directory to store files and job database.
+            workers: Maximum number of files added to cluster at once by this process.
+            max_attempts: Mark job as failed after this many failed uploads.
+            retry_delay: Delay before the first retry, doubled on every attempt.
+            retention: Seconds to keep finished jobs.
+            poll_interval: Seconds between checks for jobs queued by other processes.
+            lease: Seconds a claimed job or a received body stays owned by this
+                instance without renewal, after that it is taken over.
+        """
+        self.ipfs = ipfs
+        self.engine = engine
+        self.spool = Path(spool_dir)
+        self.database = self.spool / "jobs.sqlite3"
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.retention = retention
+        self.poll_interval = poll_interval
+        self.lease = lease
+        # Unlike PID, not reused by a process started after a crash
+        self.instance = uuid4().hex
+        # Bodies being received, kept fresh by `_renew`
+        self.parts: set[Path] = set()
+        self.wakeup = asyncio.Event()
+        self.tasks: set[asyncio.Task[None]] = set()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.database, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=FULL")
+        return connection
+
+    def _execute(self, query: str, *parameters: object) -> list[sqlite3.Row]:
+        with closing(self._connect()) as connection:
+            return connection.execute(query, parameters).fetchall()
+
+    def _file(self, job_id: str) -> Path:
+        return self.spool / job_id
+
+    def _init(self) -> None:
+        """Create database and clean up after dead processes."""
+        self.spool.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as connection:
+            connection.executescript(SCHEMA)
+            columns = {row["name"] for row in connection.execute("PRAGMA table_info(job)")}
+            for column, type_ in LEASE_COLUMNS.items():
+                if column not in columns:
+                    connection.execute(f"ALTER TABLE job ADD COLUMN {column} {type_}")
+        self._remove_stale_parts()
+
+    def _remove_stale_parts(self) -> None:
+        """Remove bodies which were being received by dead processes.
+
+        Also removes job files without a job, left by a process which died after
+        moving the body into place, but before inserting its job.
+        """
+        expired = time.time() - self.lease
+        orphans = []
+        for path in self.spool.iterdir():
+            if path.suffix == ".part":
+                if path in self.parts:
+                    continue
+            elif len(path.name) != 32 or not path.name.isalnum():
+                # Job database and its journals
+                continue
+            try:
+                if path.stat().st_mtime >= expired:
+                    continue
+            except FileNotFoundError:
+                # Finished or removed by another process
+                continue
+            if path.suffix == ".part":
+                path.unlink(missing_ok=True)
+            else:
+                orphans.append(path)
+        if not orphans:
+            return
+        jobs = {
+            row["id"]
+            for row in self._execute(
+                f"SELECT id FROM job WHERE id IN ({', '.join('?' * len(orphans))})",
+                *(path.name for path in orphans),
+            )
+        }
+        for path in orphans:
+            if path.name not in jobs:
+                logger.warning(f"Removing upload job file {path.name} without a job")
+                path.unlink(missing_ok=True)
+
+    def _renew(self) -> None:
+        """Extend leases of jobs and bodies of this instance."""
+        self._execute(
+            "UPDATE job SET lease_until = ? WHERE status = ? AND claimed_by = ?",
+            int_time() + self.lease,
+            JobStatus.uploading,
+            self.instance,
+        )
+        for path in list(self.parts):
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                continue
+
+    def _recover(self) -> int:
+        """Return jobs with expired lease to the queue.
+
+        Jobs claimed before leases were added have no lease and are recovered too.
+        """
+        rows = self._execute(
+            "UPDATE job SET status = ?, pid = NULL, claimed_by = NULL, lease_until = NULL"
+            " WHERE status = ? AND (lease_until IS NULL OR lease_until < ?) RETURNING id",
+            JobStatus.queued,
+            JobStatus.uploading,
+            int_time(),
+        )
+        return len(rows)
+
+    def _release(self) -> None:
+        """Return jobs claimed by this instance to the queue."""
+        self._execute(
+            "UPDATE job SET status = ?, pid = NULL, claimed_by = NULL, lease_until = NULL"
+            " WHERE status = ? AND claimed_by = ?",
+            JobStatus.queued,
+            JobStatus.uploading,
+            self.instance,
+        )
+
+    def _insert(self, job: Job) -> None:
+        self._execute(
+            "INSERT INTO job (id, owner, cid, size, content_type, filename, name, status,"
+            " next_attempt, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            job.id,
+            str(job.owner),
+            job.cid,
+            job.size,
+            job.content_type,
+            job.filename,
+            job.name,
+            job.status,
+            job.created_at,
+            job.created_at,
+            job.updated_at,
+        )
+
+    def _claim(self) -> Job | None:
+        """Take the oldest queued job which is due."""
+        rows = self._execute(
+            "UPDATE job SET status = ?, pid = ?, claimed_by = ?, lease_until = ?, updated_at = ?"
+            " WHERE id = ("
+            " SELECT id FROM job WHERE status = ? AND next_attempt <= ?"
+            " ORDER BY next_attempt LIMIT 1"
+            ") RETURNING *",
+            JobStatus.uploading,
+            os.getpid(),
+            self.instance,
+            int_time() + self.lease,
+            int_time(),
+            JobStatus.queued,
+            int_time(),
+        )
+        return Job.from_row(rows[0]) if rows else None
+
+    def _finish(self, job: Job, error: str | None) -> None:
+        now = int_time()
+        if error is None:
+            job.status = JobStatus.done
+            next_attempt = now
+        elif job.attempts >= self.max_attempts:
+            job.status = JobStatus.failed
+            next_attempt = now
+        else:
+            job.status = JobStatus.queued
+            next_attempt = now + int(self.retry_delay * 2 ** (job.attempts - 1))
+        self._execute(
+            "UPDATE job SET status = ?, attempts = ?, error = ?, pid = NULL, claimed_by = NULL,"
+            " lease_until = NULL, next_attempt = ?, updated_at = ? WHERE id = ?",
+            job.status,
+            job.attempts,
+            error,
+            next_attempt,
+            now,
+            job.id,
+        )
+        # File goes after status, so a crash in between doesn't retry a finished job
+        if job.status != JobStatus.queued:
+            self._file(job.id).unlink(missing_ok=True)
+
+    def _prune(self) -> None:
+        """Remove finished jobs older than retention."""
+        self._execute(
+            "DELETE FROM job WHERE status IN (?, ?) AND updated_at < ?",
+            JobStatus.done,
+            JobStatus.failed,
+            int_time() - self.retention,
+        )
+
+    async def start(self) -> None:
+        """Recover jobs of dead processes and start worker tasks.
+
+        Jobs of a crashed process are recovered once their lease expires,
+        at most `lease` seconds plus a maintenance interval after the crash.
+        """
+        await asyncio.to_thread(self._init)
+        recovered = await asyncio.to_thread(self._recover)
+        if recovered:
+            logger.info(f"Recovered {recovered} upload jobs")
+        for _ in range(self.workers):
+            self._spawn(self._worker())
+        self._spawn(self._maintenance())
+        self._spawn(self._heartbeat())
+
+    async def stop(self) -> None:
+        """Stop worker tasks, unfinished jobs are picked up on the next start."""
+        tasks = list(self.tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.to_thread(self._release)
+
+    async def enqueue(
+        self,
+        stream: AsyncIterable[bytes],
+        content_type: str,
+        owner: UUID,
+        filename: str | None = None,
+        name: str | None = None,
+        max_size: int | None = None,
+    ) -> Job:
+        """Save file to spool and queue its upload.
+
+        Args:
+            stream: File content.
+            content_type: File content-type.
+            owner: UUID of user who uploads the file.
+            filename: Filename.
+            name: Pin name.
+            max_size: Maximum file size in bytes.
+
+        Raises:
+            FileTooLargeException: If file is larger than `max_size`.
+
+        Returns:
+            Job: Queued job with locally computed CID.
+        """
+        job_id = uuid4().hex
+        part = self.spool / f"{job_id}.part"
+        size = 0
+        self.parts.add(part)
+        try:
+            with open(part, "wb") as file:
+                async for chunk in stream:
+                    size += len(chunk)
+                    if max_size is not None and size > max_size:
+                        raise FileTooLargeException(
+                            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+                        )
+                    await asyncio.to_thread(file.write, chunk)
+                await asyncio.to_thread(file.flush)
+                await asyncio.to_thread(os.fsync, file.fileno())
+            cid = await asyncio.to_thread(file_cid, str(part))
+            os.replace(part, self._file(job_id))
+        finally:
+            self.parts.discard(part)
+            part.unlink(missing_ok=True)
+        now = int_time()
+        job = Job(
+            id=job_id,
+            owner=owner,
+            cid=cid,
+            size=size,
+            content_type=content_type,
+            filename=filename,
+            name=name,
+            status=JobStatus.queued,
+            attempts=0,
+            error=None,
+            created_at=now,
+            updated_at=now,
+        )
+        await asyncio.to_thread(self._insert, job)
+        self.wakeup.set()
+        return job
+
+    async def get(self, job_id: str) -> Job | None:
+        """Get job by ID, `None` if it doesn't exist or was pruned."""
+        rows = await asyncio.to_thread(self._execute, "SELECT * FROM job WHERE id = ?", job_id)
+        return Job.from_row(rows[0]) if rows else None
+
+    def _spawn(self, coroutine: Coroutine[object, object, None]) -> None:
+        task = asyncio.create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _upload(self, job: Job) -> None:
+        job.attempts += 1
+        error = None
+        try:
+            cid = await self.ipfs.add_file(
+                str(self._file(job.id)), job.content_type, filename=job.filename, name=job.name
+            )
+            if cid != job.cid:
+                # Cluster has non-default import parameters, retrying won't help
+                job.attempts = self.max_attempts
+                error = f"Cluster returned CID {cid}, expected {job.cid}"
+        except IPFSException as e:
+            error = e.detail or "Cannot pin file"
+        except OSError as e:
+            error = str(e)
+        if error is not None:
+            logger.error(f"Upload job {job.id} failed (attempt {job.attempts}): {error}")
+        await asyncio.to_thread(self._finish, job, error)
+        if job.status == JobStatus.done:
+            await asyncio.to_thread(set_status, self.engine, [job.cid], PinStatus.pinning)
+        elif job.status == JobStatus.failed:
+            await asyncio.to_thread(set_status, self.engine, [job.cid], PinStatus.error)
+
+    async def _worker(self) -> None:
+        while True:
+            try:
+                job = await asyncio.to_thread(self._claim)
+                if job is None:
+                    self.wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self.wakeup.wait(), self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await self._upload(job)
+            except Exception:
+                # Claimed job is recovered when its lease expires
+                logger.exception("Upload worker failed")
+                await asyncio.sleep(self.poll_interval)
+
+    async def _heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                await asyncio.to_thread(self._renew)
+            except sqlite3.Error:
+                logger.exception("Cannot renew upload job leases")
+
+    async def _maintenance(self) -> None:
+        while True:
+            await asyncio.sleep(max(self.poll_interval, 1) * 60)
+            try:
+                recovered = await asyncio.to_thread(self._recover)
+                if recovered:
+                    logger.info(f"Recovered {recovered} upload jobs")
+                await asyncio.to_thread(self._prune)
+                await asyncio.to_thread(self._remove_stale_parts)
+            except (sqlite3.Error, OSError):
+                logger.exception("Cannot maintain upload queue")
@@ -1,6 +1,11 @@
 """Small utilities used across all project."""
 
+import asyncio
 from time import time
+from typing import Awaitable, Callable, Generic, Hashable, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+T = TypeVar("T")
 
 
 def int_time() -> int:
@@ -10,3 +15,70 @@ def int_time() -> int:
         int: Current timestamp.
     """
     return int(time())
+
+
+class _Flight(Generic[T]):
+    def __init__(self, task: "asyncio.Task[T]") -> None:
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight(Generic[K, T]):
+    """Share one in-flight call among concurrent callers with the same key.
+
+    Results are not cached: a call made after the shared one finished runs
+    again. Cancelling one caller doesn't affect the others, the shared call
+    is cancelled only when every caller gave up on it.
+    """
+
+    def __init__(self) -> None:
+        """Share one in-flight call among concurrent callers with the same key."""
+        self.flights: dict[K, _Flight[T]] = {}
+        # Calls actually made and calls which joined an in-flight one
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key: K, func: Callable[[], Awaitable[T]]) -> T:
+        """Call `func`, or wait for the result of a call with the same key in flight.
+
+        Examples:
+            >>> lookups: SingleFlight[str, int] = SingleFlight()
+            >>> await asyncio.gather(*(lookups.do("a", slow_query) for _ in range(10)))
+            >>> lookups.calls, lookups.coalesced
+            (1, 9)
+
+        Args:
+            key: Operation key, calls with equal keys must return equal results.
+            func: Function returning awaitable with the result.
+
+        Returns:
+            Result of `func`, exceptions are raised to every caller.
+        """
+        flight = self.flights.get(key)
+        if flight is None:
+
+            async def call() -> T:
+                return await func()
+
+            flight = _Flight(asyncio.create_task(call()))
+            self.flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._done(key, flight))
+            self.calls += 1
+        else:
+            self.coalesced += 1
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Everybody was cancelled, new callers must not join the cancelled call
+                self._done(key, flight)
+                flight.task.cancel()
+
+    def _done(self, key: K, flight: _Flight[T]) -> None:
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+        if flight.task.done() and not flight.task.cancelled():
+            # Mark exception as retrieved, all callers may be gone
+            flight.task.exception()
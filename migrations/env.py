@@ -8,6 +8,8 @@ from os import environ
 
 from alembic import context
 
+from migrations.online import PROGRESS_TABLE
+
 # Import all models from your models.py here!
 from app.models import *
 
@@ -32,6 +34,12 @@ if config.config_file_name is not None:
 # target_metadata = mymodel.Base.metadata
 target_metadata = SQLModel.metadata
 
+
+def include_object(object, name, type_, reflected, compare_to):  # type: ignore
+    """Skip progress table of online migrations in autogenerate."""
+    return not (type_ == "table" and name == PROGRESS_TABLE)
+
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -76,7 +84,13 @@ def run_migrations_online() -> None:
     )
 
     with connectable.connect() as connection:
-        context.configure(connection=connection, target_metadata=target_metadata)
+        # Online migrations (see `migrations/online.py`) commit in the middle
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            transaction_per_migration=True,
+            include_object=include_object,
+        )
 
         with context.begin_transaction():
             context.run_migrations()
@@ -0,0 +1,232 @@
+"""Helpers for online schema changes of large tables.
+
+Alembic runs a migration in one transaction, which on a populated table
+means long locks and huge transactions. These helpers split the work:
+
+* `add_column` adds a column as nullable with a server default, backfills
+  it with `backfill` and only then sets `NOT NULL`, on PostgreSQL through a
+  validated `CHECK` constraint, so the table isn't scanned under exclusive lock;
+* `backfill` updates rows in keyset batches, every batch is committed on its
+  own, progress is stored in `online_migration` table, so an interrupted
+  migration continues from the last batch, and the runner sleeps between
+  batches to leave the database to live traffic;
+* `create_index` builds index without blocking writes: `CONCURRENTLY` on
+  PostgreSQL, on CockroachDB index creation is an online schema change
+  running in background anyway.
+
+Examples:
+    >>> from migrations.online import add_column
+    >>> def upgrade() -> None:
+    >>>     add_column("user", sa.Column("verifed", sa.Boolean(), nullable=False), False)
+"""
+
+import logging
+from time import monotonic, sleep
+
+import sqlalchemy as sa
+from alembic import op
+
+logger = logging.getLogger("alembic.online")
+
+PROGRESS_TABLE = "online_migration"
+CONCURRENT_DIALECTS = ("postgresql", "cockroachdb")
+
+
+def _progress_table() -> sa.Table:
+    return sa.Table(
+        PROGRESS_TABLE,
+        sa.MetaData(),
+        sa.Column("name", sa.String(255), primary_key=True),
+        sa.Column("last_key", sa.String(255), nullable=True),
+        sa.Column("rows", sa.Integer(), nullable=False),
+    )
+
+
+def backfill(
+    table: str,
+    values: dict[str, object],
+    where: str,
+    key: str = "uuid",
+    batch_size: int = 1000,
+    duty_cycle: float = 0.5,
+    name: str | None = None,
+) -> int:
+    """Update rows matching `where` in committed keyset batches.
+
+    Every batch updates rows with `key` in range of the next `batch_size`
+    keys. The update must make rows stop matching `where`, so a batch
+    repeated after interruption changes nothing.
+
+    Args:
+        table: Table name.
+        values: Column values, SQL expressions or plain values.
+        where: SQL condition of rows to update, e.g. `"verifed IS NULL"`.
+        key: Unique column to paginate by, primary key usually.
+        batch_size: Rows per batch and transaction.
+        duty_cycle: Share of time spent in batches, after a batch the runner
+            sleeps so that backfill takes at most this share of the time.
+        name: Progress name, `table.column` of the first value by default.
+
+    Returns:
+        int: Number of updated rows.
+    """
+    context = op.get_context()
+    target = sa.table(table, sa.column(key), *(sa.column(column) for column in values))
+    condition = sa.text(where)
+    if context.as_sql:
+        # Offline mode can't loop, emit a single statement
+        op.execute(target.update().where(condition).values(values))
+        return 0
+
+    name = name or f"{table}.{next(iter(values))}"
+    progress = _progress_table()
+    with context.autocommit_block():
+        bind = op.get_bind()
+        progress.create(bind, checkfirst=True)
+        state = bind.execute(sa.select(progress).where(progress.c.name == name)).first()
+        if state is None:
+            bind.execute(progress.insert().values(name=name, last_key=None, rows=0))
+            last_key, rows = None, 0
+        else:
+            last_key, rows = state.last_key, state.rows
+            logger.info(f"Resuming backfill {name} after {rows} rows")
+        remaining = bind.execute(
+            sa.select(sa.func.count()).select_from(target).where(condition)
+        ).scalar_one()
+        logger.info(f"Backfill {name}: {remaining} rows to update")
+
+        started = monotonic()
+        while True:
+            batch_started = monotonic()
+            keys = sa.select(target.c[key]).order_by(target.c[key]).limit(batch_size)
+            if last_key is not None:
+                keys = keys.where(target.c[key] > last_key)
+            batch = [str(row[0]) for row in bind.execute(keys)]
+            if not batch:
+                break
+            statement = target.update().where(condition).values(values)
+            if last_key is not None:
+                statement = statement.where(target.c[key] > last_key)
+            statement = statement.where(target.c[key] <= batch[-1])
+            rows += bind.execute(statement).rowcount
+            last_key = batch[-1]
+            bind.execute(
+                progress.update()
+                .where(progress.c.name == name)
+                .values(last_key=last_key, rows=rows)
+            )
+
+            elapsed = monotonic() - started
+            rate = rows / elapsed if elapsed > 0 else 0
+            eta = (
+                f", about {(remaining - rows) / rate:.0f}s left"
+                if rate and remaining > rows
+                else ""
+            )
+            logger.info(f"Backfill {name}: {rows}/{remaining} rows, {rate:.0f} rows/s{eta}")
+            batch_time = monotonic() - batch_started
+            sleep(batch_time * (1 / duty_cycle - 1))
+
+        bind.execute(progress.delete().where(progress.c.name == name))
+    logger.info(f"Backfill {name} finished, {rows} rows updated")
+    return rows
+
+
+def _set_not_null_postgresql(table: str, column: str) -> None:
+    """Set `NOT NULL` without scanning the table under `ACCESS EXCLUSIVE` lock.
+
+    `VALIDATE CONSTRAINT` scans holding only `SHARE UPDATE EXCLUSIVE` lock,
+    and since PostgreSQL 12 `SET NOT NULL` skips the scan when a validated
+    `CHECK` constraint proves it. Every step is committed on its own, so
+    exclusive locks are held only briefly. Constraint added by an interrupted
+    run of the migration is reused.
+    """
+    context = op.get_context()
+    constraint = f"{table}_{column}_not_null"
+    with context.autocommit_block():
+        existing = [] if context.as_sql else sa.inspect(op.get_bind()).get_check_constraints(table)
+        if not any(check["name"] == constraint for check in existing):
+            op.execute(
+                f'ALTER TABLE "{table}" ADD CONSTRAINT "{constraint}" '
+                f'CHECK ("{column}" IS NOT NULL) NOT VALID'
+            )
+        op.execute(f'ALTER TABLE "{table}" VALIDATE CONSTRAINT "{constraint}"')
+        op.alter_column(table, column, nullable=False)
+        op.drop_constraint(constraint, table, type_="check")
+
+
+def add_column(
+    table: str,
+    column: sa.Column,
+    default: object,
+    keep_default: bool = False,
+    **kwargs: object,
+) -> None:
+    """Add column without rewriting the table in one transaction.
+
+    The column is added as nullable with `default` as server default, rows
+    still having `NULL` are backfilled (see `backfill`), then `NOT NULL` is
+    set if `column` is not nullable. Column added by an interrupted run of
+    the migration is reused.
+
+    Args:
+        table: Table name.
+        column: Column as it should be in the end.
+        default: Value of existing rows.
+        keep_default: Keep server default after migration.
+        kwargs: Passed to `backfill`.
+    """
+    context = op.get_context()
+    server_default = sa.literal(default, column.type).compile(
+        dialect=context.dialect, compile_kwargs={"literal_binds": True}
+    )
+    existing = [] if context.as_sql else sa.inspect(op.get_bind()).get_columns(table)
+    if any(existing_column["name"] == column.name for existing_column in existing):
+        logger.info(f"Column {table}.{column.name} already exists")
+    else:
+        op.add_column(
+            table,
+            sa.Column(
+                column.name,
+                column.type,
+                nullable=True,
+                server_default=sa.text(str(server_default)),
+            ),
+        )
+    value = sa.literal(default, column.type)
+    backfill(table, {column.name: value}, f'"{column.name}" IS NULL', **kwargs)
+    changes: dict[str, object] = {}
+    if not column.nullable:
+        changes["nullable"] = False
+    if not keep_default:
+        changes["server_default"] = None
+    if context.dialect.name == "postgresql" and changes.pop("nullable", True) is False:
+        _set_not_null_postgresql(table, column.name)
+    if not changes:
+        return
+    if context.dialect.name == "sqlite":
+        # SQLite can't alter columns, the table is copied
+        with op.batch_alter_table(table) as batch:
+            batch.alter_column(column.name, existing_type=column.type, **changes)
+    else:
+        op.alter_column(table, column.name, existing_type=column.type, **changes)
+
+
+def create_index(name: str, table: str, columns: list[str], unique: bool = False) -> None:
+    """Create index without blocking writes, skipped if it already exists.
+
+    On PostgreSQL `CREATE INDEX CONCURRENTLY` runs outside of transaction.
+    CockroachDB builds indexes online anyway and accepts `CONCURRENTLY` as
+    well. Other databases get a plain `CREATE INDEX`.
+    """
+    context = op.get_context()
+    if not context.as_sql:
+        existing = sa.inspect(op.get_bind()).get_indexes(table)
+        if any(index["name"] == name for index in existing):
+            logger.info(f"Index {name} already exists")
+            return
+    if context.dialect.name not in CONCURRENT_DIALECTS:
+        op.create_index(name, table, columns, unique=unique)
+        return
+    with context.autocommit_block():
+        op.create_index(name, table, columns, unique=unique, postgresql_concurrently=True)
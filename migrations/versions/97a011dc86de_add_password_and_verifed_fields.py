@@ -5,10 +5,12 @@ Revises: d3409f086e74
 Create Date: 2022-10-02 03:07:54.588275
 
 """
+
 from alembic import op
 import sqlalchemy as sa
 import sqlmodel
 
+from migrations.online import add_column
 
 # revision identifiers, used by Alembic.
 revision = "97a011dc86de"
@@ -18,12 +20,16 @@ depends_on = None
 
 
 def upgrade() -> None:
-    # ### commands auto generated by Alembic - please adjust! ###
-    op.add_column(
-        "user", sa.Column("password", sqlmodel.sql.sqltypes.AutoString(length=128), nullable=False)
+    # Existing users had no password and can't log in until they reset it, an
+    # empty hash never matches (see `app.security.verify_password`)
+    add_column(
+        "user",
+        sa.Column("password", sqlmodel.sql.sqltypes.AutoString(length=128), nullable=False),
+        "",
     )
-    op.add_column("user", sa.Column("verifed", sa.Boolean(), nullable=False))
-    # ### end Alembic commands ###
+    # Existing users are counted as verified, otherwise `User.cleanup` would
+    # delete them, as for imported users (see `app.importer`)
+    add_column("user", sa.Column("verifed", sa.Boolean(), nullable=False), True)
 
 
 def downgrade() -> None:
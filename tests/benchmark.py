@@ -0,0 +1,111 @@
+"""Minimal benchmark harness, used by `benchmark` fixture from `conftest.py`.
+
+Every benchmark takes `rounds` samples, each sample runs the function enough
+times to last at least `min_time` seconds and records time of one call.
+A benchmark regressed if its samples are significantly slower than the
+baseline samples (one-sided Mann-Whitney U test) and the median slowed down
+by more than `threshold`.
+"""
+
+import json
+import math
+from pathlib import Path
+from statistics import median
+from time import perf_counter
+from typing import Callable, TypeVar
+
+T = TypeVar("T")
+
+
+class Benchmark:
+    def __init__(self, name: str, rounds: int, min_time: float = 0.002) -> None:
+        self.name = name
+        self.rounds = rounds
+        self.min_time = min_time
+        self.samples: list[float] = []
+        # Shown next to the time, e.g. size of the benchmarked data
+        self.note = ""
+
+    def __call__(self, func: Callable[[], T]) -> T:
+        # Calibrate number of calls per sample
+        iterations = 1
+        while True:
+            started = perf_counter()
+            for _ in range(iterations):
+                result = func()
+            elapsed = perf_counter() - started
+            if elapsed >= self.min_time:
+                break
+            iterations *= 2 if elapsed == 0 else max(2, int(self.min_time / elapsed) + 1)
+        for _ in range(self.rounds):
+            started = perf_counter()
+            for _ in range(iterations):
+                func()
+            self.samples.append((perf_counter() - started) / iterations)
+        return result
+
+
+def ranks(values: list[float]) -> list[float]:
+    """Ranks starting from 1, ties get average rank."""
+    order = sorted(range(len(values)), key=values.__getitem__)
+    result = [0.0] * len(values)
+    i = 0
+    while i < len(order):
+        j = i
+        while j + 1 < len(order) and values[order[j + 1]] == values[order[i]]:
+            j += 1
+        for k in range(i, j + 1):
+            result[order[k]] = (i + j) / 2 + 1
+        i = j + 1
+    return result
+
+
+def slower_p_value(current: list[float], baseline: list[float]) -> float:
+    """P-value of Mann-Whitney U test that `current` is stochastically greater than `baseline`.
+
+    Uses normal approximation with tie correction, good for 10+ samples each.
+    """
+    n1, n2 = len(current), len(baseline)
+    combined = current + baseline
+    rank = ranks(combined)
+    u = sum(rank[:n1]) - n1 * (n1 + 1) / 2
+    n = n1 + n2
+    ties = {}
+    for value in combined:
+        ties[value] = ties.get(value, 0) + 1
+    tie_term = sum(t**3 - t for t in ties.values()) / (n * (n - 1))
+    sigma = math.sqrt(n1 * n2 / 12 * (n + 1 - tie_term))
+    if sigma == 0:
+        return 1.0
+    z = (u - n1 * n2 / 2 - 0.5) / sigma
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def regression(
+    current: list[float], baseline: list[float], alpha: float = 0.01, threshold: float = 0.2
+) -> str | None:
+    """Describe regression, `None` if there is no significant one."""
+    ratio = median(current) / median(baseline)
+    p_value = slower_p_value(current, baseline)
+    if p_value < alpha and ratio > 1 + threshold:
+        return f"median {ratio:.2f}x of baseline (p={p_value:.2g})"
+    return None
+
+
+def load(path: Path) -> dict[str, list[float]]:
+    if not path.exists():
+        return {}
+    samples: dict[str, list[float]] = json.loads(path.read_text())
+    return samples
+
+
+def save(path: Path, samples: dict[str, list[float]]) -> None:
+    path.write_text(json.dumps(samples, indent=1, sort_keys=True))
+
+
+def describe(samples: list[float]) -> str:
+    value = median(samples)
+    for unit, scale in (("s", 1.0), ("ms", 1e-3), ("us", 1e-6)):
+        if value >= scale:
+            return f"{value / scale:.2f} {unit}"
+    return f"{value / 1e-9:.0f} ns"
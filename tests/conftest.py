@@ -0,0 +1,77 @@
+from pathlib import Path
+from typing import Iterator
+
+import pytest
+from _pytest.terminal import TerminalReporter
+
+from tests.benchmark import Benchmark, describe, load, regression, save
+
+DEFAULT_BASELINE = ".benchmarks.json"
+results_key = pytest.StashKey[dict[str, list[float]]]()
+notes_key = pytest.StashKey[dict[str, str]]()
+
+
+def pytest_addoption(parser: pytest.Parser) -> None:
+    group = parser.getgroup("benchmark")
+    group.addoption(
+        "--benchmark-save",
+        nargs="?",
+        const=DEFAULT_BASELINE,
+        default=None,
+        help=f"store benchmark samples as baseline, {DEFAULT_BASELINE} by default",
+    )
+    group.addoption(
+        "--benchmark-compare",
+        nargs="?",
+        const=DEFAULT_BASELINE,
+        default=None,
+        help="fail benchmarks significantly slower than baseline",
+    )
+    group.addoption("--benchmark-rounds", type=int, default=None, help="samples per benchmark")
+    group.addoption(
+        "--benchmark-threshold",
+        type=float,
+        default=0.2,
+        help="ignore significant slowdowns of median smaller than this share",
+    )
+
+
+def pytest_configure(config: pytest.Config) -> None:
+    config.stash[results_key] = {}
+    config.stash[notes_key] = {}
+
+
+@pytest.fixture
+def benchmark(request: pytest.FixtureRequest) -> Iterator[Benchmark]:
+    config = request.config
+    gated = config.getoption("benchmark_save") or config.getoption("benchmark_compare")
+    # Without baseline a few rounds are enough to check that benchmarks work
+    rounds = config.getoption("benchmark_rounds") or (30 if gated else 3)
+    bench = Benchmark(request.node.name, rounds)
+    yield bench
+    if not bench.samples:
+        return
+    config.stash[results_key][bench.name] = bench.samples
+    config.stash[notes_key][bench.name] = bench.note
+    baseline_path = config.getoption("benchmark_compare")
+    if baseline_path is not None:
+        baseline = load(Path(baseline_path)).get(bench.name)
+        if baseline is not None:
+            threshold = config.getoption("benchmark_threshold")
+            problem = regression(bench.samples, baseline, threshold=threshold)
+            if problem is not None:
+                pytest.fail(f"{bench.name} regressed: {describe(bench.samples)}, {problem}")
+
+
+def pytest_terminal_summary(terminalreporter: TerminalReporter, config: pytest.Config) -> None:
+    results = config.stash[results_key]
+    if not results:
+        return
+    terminalreporter.section("benchmarks (median per call)")
+    for name, samples in sorted(results.items()):
+        note = config.stash[notes_key].get(name, "")
+        terminalreporter.write_line(f"{name:<40} {describe(samples):>12}  {note}".rstrip())
+    path = config.getoption("benchmark_save")
+    if path is not None:
+        save(Path(path), {**load(Path(path)), **results})
+        terminalreporter.write_line(f"Baseline saved to {path}")
@@ -0,0 +1,110 @@
+import asyncio
+from pathlib import Path
+from uuid import UUID, uuid4
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+
+from app import app
+from app.audit import AuditLog, prune
+from app.database import get_engine, get_engine_session
+from app.models import AuditEvent, AuditKind
+from app.models.audit import int_day
+from app.security import get_password_hash
+from tests.utils import get_user
+
+
+def events(nickname: str) -> list[AuditEvent]:
+    with get_engine_session() as db:
+        return list(db.exec(select(AuditEvent).where(AuditEvent.nickname == nickname)).scalars())
+
+
+@pytest.mark.asyncio
+async def test_audit_log_batches() -> None:
+    nickname = uuid4().hex
+    audit = AuditLog(batch_size=2, flush_interval=60)
+    audit.start(get_engine())
+    try:
+        for _ in range(2):
+            audit.record(AuditKind.login, nickname=nickname, ip="127.0.0.1")
+        # Full batch wakes the writer before the flush interval
+        for _ in range(100):
+            if events(nickname):
+                break
+            await asyncio.sleep(0.05)
+        assert len(events(nickname)) == 2
+        audit.record(AuditKind.login, nickname=nickname, ip="127.0.0.1")
+    finally:
+        await audit.stop()
+    assert len(events(nickname)) == 3
+
+
+def test_spill_and_replay(tmp_path: Path) -> None:
+    nickname = uuid4().hex
+    user = uuid4()
+    audit = AuditLog(max_size=1)
+    audit.spool = tmp_path
+    audit.record(AuditKind.refresh, user=user, nickname=nickname)
+    # Buffer is full, event goes to disk
+    audit.record(AuditKind.refresh, user=user, nickname=nickname)
+    assert len(list(tmp_path.glob("audit.*.jsonl"))) == 1
+
+    audit.engine = get_engine()
+    assert audit.flush() == 1
+    assert audit.replay_spool() == 1
+    assert not list(tmp_path.iterdir())
+    assert [event.user for event in events(nickname)] == [user, user]
+
+    # Without spool events are dropped
+    audit.spool = None
+    audit.record(AuditKind.refresh, nickname=nickname)
+    audit.record(AuditKind.refresh, nickname=nickname)
+    assert audit.dropped == 1
+
+
+def test_replay_skips_corrupt_lines(tmp_path: Path) -> None:
+    nickname = uuid4().hex
+    audit = AuditLog(max_size=0)
+    audit.spool = tmp_path
+    audit.record(AuditKind.login, nickname=nickname)
+    (spilled,) = tmp_path.glob("audit.*.jsonl")
+    # Crash in the middle of spilling, in a file of a dead process
+    with spilled.open("a") as file:
+        file.write('{"id": "')
+    spilled.rename(tmp_path / "audit.999999999.jsonl")
+    audit.record(AuditKind.login, nickname=nickname)
+
+    audit.engine = get_engine()
+    assert audit.replay_spool() == 2
+    assert len(events(nickname)) == 2
+    (corrupt,) = tmp_path.iterdir()
+    assert corrupt.name.startswith("corrupt.") and corrupt.read_text() == '{"id": "\n'
+
+
+def test_prune() -> None:
+    nickname = uuid4().hex
+    with get_engine_session() as db:
+        for age in (100, 95, 10):
+            db.add(AuditEvent(day=int_day() - age, kind=AuditKind.login, nickname=nickname))
+        db.commit()
+    assert prune(get_engine(), 90) >= 2
+    assert [int_day() - event.day for event in events(nickname)] == [10]
+
+
+def test_login_is_audited() -> None:
+    user = get_user(uuid4())
+    user.password = get_password_hash("password")
+    uuid, nickname = user.uuid, user.nickname
+    with get_engine_session() as db:
+        db.add(user)
+        db.commit()
+    with TestClient(app) as client:
+        response = client.post(
+            "/authorization/login/", data={"username": nickname, "password": "wrong"}
+        )
+        assert response.status_code != 200
+    # Buffer is flushed on shutdown
+    (event,) = events(nickname)
+    assert event.kind == AuditKind.login_failed
+    assert UUID(str(event.user)) == uuid and event.detail == "password"
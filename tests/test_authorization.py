@@ -1,7 +1,11 @@
+from uuid import uuid4
+
 from fastapi.testclient import TestClient
 
 from app import app
+from app.database import get_engine_session
 from app.models.token import decode
+from tests.utils import get_user
 
 client = TestClient(app)
 
@@ -10,3 +14,15 @@ def test_uuid_token() -> None:
     response = client.get("/authorization/signup/reserve_uuid")
     assert response.status_code == 200
     decode(response.json())
+
+
+def test_legacy_user_login() -> None:
+    # Users created before passwords were stored are migrated with empty hash
+    user = get_user(uuid4())
+    user.password = ""
+    nickname = user.nickname
+    with get_engine_session() as db:
+        db.add(user)
+        db.commit()
+    response = client.post("/authorization/login/", data={"username": nickname, "password": "x"})
+    assert response.status_code == 401
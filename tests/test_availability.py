@@ -0,0 +1,102 @@
+from uuid import uuid4
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import app
+from app.availability import BloomFilter, NameIndex, name_index
+from app.database import get_engine, get_engine_session
+from app.routers import auth
+from tests.utils import get_user
+
+
+def test_bloom_filter() -> None:
+    bloom = BloomFilter(1000)
+    items = [uuid4().hex for _ in range(1000)]
+    for item in items:
+        bloom.add(item)
+    assert all(item in bloom for item in items)
+    false_positives = sum(uuid4().hex in bloom for _ in range(10_000))
+    assert false_positives < 300
+
+
+def test_name_index_build() -> None:
+    user = get_user(uuid4())
+    nickname, email = user.nickname, user.email
+    with get_engine_session() as db:
+        db.add(user)
+        db.commit()
+    index = NameIndex()
+    assert index.may_contain_nickname("free")
+    index.feed_started()
+    assert index.build(get_engine()) >= 1
+    assert index.may_contain_nickname(nickname) and index.may_contain_email(email)
+    assert not index.may_contain_email(nickname)
+    index.add("added", "added@bar.com")
+    assert index.may_contain_nickname("added")
+    index.reset()
+    assert not index.ready
+
+
+def test_name_index_complete_with_feed() -> None:
+    index = NameIndex()
+    index.build(get_engine())
+    # Without change feed names taken in other workers may be missing
+    assert not index.complete and index.may_contain_nickname("free")
+    index.feed_started()
+    # Filter built before the feed started may miss names too
+    assert not index.complete and index.needs_rebuild
+    index.build(get_engine())
+    assert index.complete and not index.may_contain_nickname("free")
+    index.feed_stopped()
+    assert not index.complete and index.may_contain_nickname("free")
+
+
+def test_availability_endpoint(monkeypatch: pytest.MonkeyPatch) -> None:
+    user = get_user(uuid4())
+    nickname, email = user.nickname, user.email
+    with get_engine_session() as db:
+        db.add(user)
+        db.commit()
+    client = TestClient(app)
+    url = "/authorization/signup/available"
+    # Without index every name is checked in database
+    response = client.get(url, params={"nickname": nickname, "email": "free@bar.com"})
+    assert response.json() == {"nickname": False, "email": True}
+
+    name_index.build(get_engine())
+    try:
+        # User created through another worker without change feed is not in filter
+        other = get_user(uuid4())
+        other_nickname = other.nickname
+        with get_engine_session() as db:
+            db.add(other)
+            db.commit()
+        response = client.get(url, params={"nickname": other_nickname})
+        assert response.json() == {"nickname": False, "email": None}
+
+        name_index.feed_started()
+        name_index.build(get_engine())
+        lookups: list[str] = []
+
+        def load_uuid_by_nickname(nickname: str) -> None:
+            lookups.append(nickname)
+
+        def email_taken(email: str) -> bool:
+            lookups.append(email)
+            return True
+
+        monkeypatch.setattr(auth, "load_uuid_by_nickname", load_uuid_by_nickname)
+        monkeypatch.setattr(auth, "email_taken", email_taken)
+        # Definite negatives don't touch database
+        free = uuid4().hex
+        response = client.get(url, params={"nickname": free[:16], "email": f"{free}@bar.com"})
+        assert response.json() == {"nickname": True, "email": True}
+        assert not lookups
+
+        response = client.get(url, params={"email": email})
+        assert response.json() == {"nickname": None, "email": False}
+        assert lookups == [email]
+    finally:
+        name_index.feed_stopped()
+        name_index.reset()
@@ -0,0 +1,125 @@
+import asyncio
+from time import monotonic
+
+import pytest
+
+from app.ipfs import IPFSClient
+from app.ipfs.balancer import PeerPool
+from tests.utils import FakeCluster, get_free_port
+
+CID = "QmRf22bZar3WKmojipms22PkXH1MZGmvsqzQtuSvQE3uhm"
+
+
+def test_pick() -> None:
+    pool = PeerPool(["a", "b", "c"], failure_threshold=2)
+    a, b, c = pool.peers
+    a.outstanding, b.outstanding, c.outstanding = 2, 0, 1
+    assert pool.pick() is b
+    assert pool.pick([b]) is c
+    b.failure()
+    assert pool.pick() is b
+    b.failure()
+    assert not b.available
+    assert pool.pick() is c
+    b.success()
+    assert pool.pick() is b
+    assert pool.pick([a, b, c]) is None
+
+    # All peers unavailable, requests are still sent
+    for peer in pool.peers:
+        peer.healthy = False
+    assert pool.pick() is b
+
+
+def test_percentile() -> None:
+    pool = PeerPool(["a"], min_samples=10)
+    for latency in range(9):
+        pool.record_latency("status", latency)
+    assert pool.percentile("status", 90) is None
+    pool.record_latency("status", 9)
+    assert pool.percentile("status", 90) == 9
+    assert pool.percentile("status", 50) == 5
+    # Slow uploads don't delay hedging of other operations
+    for _ in range(10):
+        pool.record_latency("add", 60)
+    assert pool.percentile("status", 90) == 9
+    assert pool.percentile("add", 50) == 60
+
+
+@pytest.mark.asyncio
+async def test_least_outstanding() -> None:
+    peers = [FakeCluster(), FakeCluster()]
+    for peer in peers:
+        peer.delay = 0.2
+        await peer.start()
+    try:
+        async with IPFSClient([peer.url for peer in peers]) as ipfs:
+            await asyncio.gather(*(ipfs.status(CID) for _ in range(10)))
+        assert [peer.requests for peer in peers] == [5, 5]
+    finally:
+        for peer in peers:
+            await peer.stop()
+
+
+@pytest.mark.asyncio
+async def test_circuit_breaker() -> None:
+    failing, good = FakeCluster(), FakeCluster()
+    failing.fail = True
+    await failing.start()
+    await good.start()
+    try:
+        async with IPFSClient(
+            f"{failing.url},{good.url}", failure_threshold=2, cooldown=60
+        ) as ipfs:
+            for _ in range(10):
+                await ipfs.remove(CID)
+            assert failing.requests == 2
+            assert good.requests == 10
+            assert not ipfs.pool.peers[0].available
+            # Not idempotent, but goes to the good peer
+            await ipfs.add_bytes(b"test", "text/plain")
+            assert failing.requests == 2
+    finally:
+        await failing.stop()
+        await good.stop()
+
+
+@pytest.mark.asyncio
+async def test_health_check() -> None:
+    good = FakeCluster()
+    await good.start()
+    dead = f"http://127.0.0.1:{get_free_port()}"
+    try:
+        async with IPFSClient([dead, good.url], health_interval=0.05) as ipfs:
+            await asyncio.sleep(0.2)
+            assert not ipfs.pool.peers[0].healthy
+            for _ in range(10):
+                await ipfs.status(CID)
+            assert good.requests == 10
+            assert ipfs.pool.peers[0].failures == 0
+    finally:
+        await good.stop()
+
+
+@pytest.mark.asyncio
+async def test_hedging() -> None:
+    slow, fast = FakeCluster(), FakeCluster()
+    await slow.start()
+    await fast.start()
+    try:
+        async with IPFSClient([slow.url, fast.url], hedge_percentile=90) as ipfs:
+            for _ in range(20):
+                await ipfs.status(CID)
+            assert ipfs.hedged == 0
+
+            slow.delay = 1
+            for _ in range(4):
+                started = monotonic()
+                await ipfs.status(CID)
+                assert monotonic() - started < 0.5
+            assert ipfs.hedged >= 1
+            # Hedged requests to the slow peer are cancelled before the request returns
+            assert [peer.outstanding for peer in ipfs.pool.peers] == [0, 0]
+    finally:
+        await slow.stop()
+        await fast.stop()
@@ -0,0 +1,147 @@
+"""Microbenchmarks of hot functions, run offline without database or IPFS cluster.
+
+Run `make bench-save` to store baseline on a machine and `make bench-check`
+to fail on significant regressions against it.
+"""
+
+from typing import Iterator
+from uuid import uuid4
+
+import pytest
+from pydantic import ValidationError
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel
+
+from app.settings import Settings, configure, get_settings
+
+try:
+    get_settings()
+except ValidationError:
+    # Nothing is connected to, any values will do
+    configure(Settings(db_url="sqlite://", ipfs_url="http://127.0.0.1:9094", secret="benchmark"))
+
+from app.exceptions import (  # noqa: E402
+    UserNotFoundException,
+    abstract_exception_handler,
+)
+from app.ipfs import IPFSClient  # noqa: E402
+from app.models.token import TokenTypes, UserToken, decode, encode  # noqa: E402
+from app.models.user import User, UserCreate  # noqa: E402
+from app.queries import load_credentials, load_user  # noqa: E402
+from app.security import get_password_hash, verify_password  # noqa: E402
+from tests.benchmark import Benchmark  # noqa: E402
+
+USER = uuid4()
+PAYLOAD: dict[str, str | int | float] = {
+    "sub": USER.hex,
+    "typ": TokenTypes.AccessToken.value,
+    "exp": 2**40,
+    "iat": 1,
+    "sid": uuid4().hex,
+    "class": "UserToken",
+}
+PROFILE: dict[str, str | int | float] = {"nickname": "cofob_123", "email": "cofob@riseup.net"}
+
+
+def test_encode(benchmark: Benchmark) -> None:
+    benchmark(lambda: encode(PAYLOAD))
+
+
+def test_decode(benchmark: Benchmark) -> None:
+    token = encode(PAYLOAD)
+    assert benchmark(lambda: decode(token)) == PAYLOAD
+
+
+def test_decode_access_token(benchmark: Benchmark) -> None:
+    token = UserToken(user=USER).issue_access_token({**PROFILE})
+    benchmark.note = f"{len(token)} B/token"
+    assert benchmark(lambda: UserToken.parse(token))["nickname"] == PROFILE["nickname"]
+
+
+def test_decode_compact_access_token(benchmark: Benchmark) -> None:
+    token = UserToken(user=USER).issue_access_token({}, compact=True)
+    benchmark.note = f"{len(token)} B/token"
+    assert benchmark(lambda: UserToken.parse(token))["sub"] == USER.hex
+
+
+def test_issue_access_token(benchmark: Benchmark) -> None:
+    usertoken = UserToken(user=USER)
+    benchmark(usertoken.issue_access_token)
+
+
+def test_issue_refresh_token(benchmark: Benchmark) -> None:
+    usertoken = UserToken(user=USER)
+    benchmark(usertoken.issue_refresh_token)
+
+
+def test_access_token_from_str(benchmark: Benchmark) -> None:
+    token = UserToken(user=USER).issue_access_token()
+    assert benchmark(lambda: UserToken.from_str_access_token(token)).user == USER
+
+
+def test_check_cid(benchmark: Benchmark) -> None:
+    benchmark(lambda: IPFSClient.check_cid("QmRf22bZar3WKmojipms22PkXH1MZGmvsqzQtuSvQE3uhm"))
+
+
+def test_verify_password(benchmark: Benchmark) -> None:
+    # Hash with configured bcrypt cost
+    hashed = get_password_hash("password")
+    assert benchmark(lambda: verify_password("password", hashed))
+
+
+def test_error_response(benchmark: Benchmark) -> None:
+    exception = UserNotFoundException()
+
+    def handle() -> bytes:
+        # Handler never awaits, so it finishes on the first step
+        coroutine = abstract_exception_handler(None, exception)  # type: ignore[arg-type]
+        try:
+            coroutine.send(None)
+        except StopIteration as stop:
+            return bytes(stop.value.body)
+        raise AssertionError("Handler awaited")
+
+    assert b"UserNotFoundException" in benchmark(handle)
+
+
+def test_user_create(benchmark: Benchmark) -> None:
+    data = {"email": "cofob@riseup.net", "nickname": "cofob_123", "password": "x" * 64}
+    benchmark(lambda: UserCreate(**data))
+
+
+@pytest.fixture(scope="module")
+def users_db() -> Iterator[Engine]:
+    # Private in-memory database, query overhead dominates lookup by primary key
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as db:
+        db.add(User(uuid=USER, nickname="cofob_123", email="cofob@riseup.net", password="x"))
+        db.commit()
+    yield engine
+    engine.dispose()
+
+
+def test_query_user_orm(benchmark: Benchmark, users_db: Engine) -> None:
+    with Session(users_db) as db:
+        user = benchmark(lambda: db.query(User).filter(User.uuid == USER).first())
+        assert user is not None and user.nickname == "cofob_123"
+
+
+def test_query_user_core(benchmark: Benchmark, users_db: Engine) -> None:
+    with users_db.connect() as connection:
+        user = benchmark(lambda: load_user(connection, USER))
+        assert user is not None and user.nickname == "cofob_123"
+
+
+def test_query_credentials_orm(benchmark: Benchmark, users_db: Engine) -> None:
+    with Session(users_db) as db:
+        user = benchmark(lambda: db.query(User).where(User.nickname == "cofob_123").first())
+        assert user is not None and user.uuid == USER
+
+
+def test_query_credentials_core(benchmark: Benchmark, users_db: Engine) -> None:
+    with users_db.connect() as connection:
+        credentials = benchmark(lambda: load_credentials(connection, "cofob_123"))
+        assert credentials is not None and credentials.uuid == USER
@@ -0,0 +1,63 @@
+import json
+from uuid import uuid4
+
+from app.cache import UserCache, UserProjection
+from app.changefeed import ChangefeedSink
+from app.database import get_engine_session
+from tests.utils import get_user
+
+
+def test_cache_is_used_only_when_fresh() -> None:
+    cache = UserCache()
+    user = get_user(uuid4())
+    uuid = user.uuid
+    with get_engine_session() as db:
+        db.add(user)
+        db.commit()
+        assert cache.get(db, uuid) == cache.load(db, uuid)
+        assert not cache.users
+
+        cache.mark_resolved()
+        cached = cache.get(db, uuid)
+        assert cached is not None and not cached.disabled
+        assert cache.users[uuid] == cached
+
+        # Changes made without feed event are not visible while cache is fresh
+        user = db.merge(user)
+        user.disabled = True
+        db.commit()
+        assert cache.get(db, uuid) == cached
+        cache.apply_change(uuid, cached._replace(disabled=True))
+        assert cache.get(db, uuid).disabled  # type: ignore
+
+        cache.reset()
+        assert cache.get(db, uuid).disabled  # type: ignore
+        assert not cache.users
+
+
+def test_changefeed_sink() -> None:
+    cache = UserCache()
+    sink = ChangefeedSink(cache)
+    uuid = uuid4()
+    cache.users[uuid] = UserProjection(uuid, "old", "old@bar.com", False, True)
+    row = {
+        "uuid": str(uuid),
+        "nickname": "new",
+        "email": "new@bar.com",
+        "disabled": True,
+        "verifed": True,
+        "password": "hash",
+        "created_at": 1,
+    }
+    lines = (
+        f'user\t["{uuid}"]\t{json.dumps({"after": row})}\n'
+        f'\\N\t\\N\t{json.dumps({"resolved": "1.0"})}\n'
+    )
+    # COPY chunks are not aligned to lines
+    sink.write(lines[:10].encode())
+    sink.write(lines[10:].encode())
+    assert cache.users[uuid] == UserProjection(uuid, "new", "new@bar.com", True, True)
+    assert cache.fresh
+
+    sink.write(f'user\t["{uuid}"]\t{json.dumps({"after": None})}\n')
+    assert uuid not in cache.users
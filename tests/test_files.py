@@ -0,0 +1,131 @@
+import tracemalloc
+from pathlib import Path
+from typing import AsyncIterator
+from uuid import uuid4
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import app
+from app.database import get_engine_session
+from app.exceptions import FileTooLargeException
+from app.ipfs import IPFSClient
+from app.models import Pin, UserToken
+from app.settings import get_settings
+from tests.utils import FakeCluster, get_user
+
+CHUNK = b"x" * 64 * 1024
+TEST_CID = "QmRf22bZar3WKmojipms22PkXH1MZGmvsqzQtuSvQE3uhm"
+
+
+async def chunks(count: int) -> AsyncIterator[bytes]:
+    for _ in range(count):
+        yield CHUNK
+
+
+@pytest.mark.asyncio
+async def test_add_stream_memory() -> None:
+    cluster = FakeCluster()
+    await cluster.start()
+    try:
+        async with IPFSClient(cluster.url) as ipfs:
+            # Warm up connection, so it isn't counted
+            await ipfs.add_bytes(b"test", "text/plain")
+            tracemalloc.start()
+            cid = await ipfs.add_stream(chunks(512), "text/plain", filename="big.txt")
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            assert cluster.added[-1] == {"name": "big.txt", "cid": cid, "size": 512 * len(CHUNK)}
+            # 32 MiB uploaded, only a few chunks are ever held in memory
+            assert peak < 4 * 1024 * 1024
+
+            with pytest.raises(FileTooLargeException):
+                await ipfs.add_stream(chunks(16), "text/plain", max_size=len(CHUNK) * 8)
+    finally:
+        await cluster.stop()
+
+
+@pytest.mark.asyncio
+async def test_add_directory(tmp_path: Path) -> None:
+    (tmp_path / "pack.mcmeta").write_bytes(b"test")
+    cluster = FakeCluster()
+    await cluster.start()
+    try:
+        async with IPFSClient(cluster.url) as ipfs:
+            added = await ipfs.add_directory(
+                {
+                    "textures/b c.png": chunks(2),
+                    "pack.mcmeta": str(tmp_path / "pack.mcmeta"),
+                    "textures/a.png": chunks(1),
+                },
+                name="pack",
+            )
+            with pytest.raises(ValueError):
+                await ipfs.add_directory({"../a.png": chunks(1)})
+            with pytest.raises(ValueError):
+                await ipfs.add_directory({"a": chunks(1), "a/b": chunks(1)})
+        # One request, directory precedes its files
+        names = [output["name"] for output in cluster.added]
+        assert names == ["pack.mcmeta", "textures", "textures/a.png", "textures/b c.png"]
+        assert added.entries == {output["name"]: output["cid"] for output in cluster.added}
+        assert added.entries["pack.mcmeta"] == TEST_CID
+        assert cluster.pins[added.root]["name"] == "pack"
+    finally:
+        await cluster.stop()
+
+
+def test_upload() -> None:
+    cluster = FakeCluster()
+    cluster.start_in_thread()
+    settings = get_settings()
+    ipfs_url, max_size = settings.ipfs_url, settings.upload_max_size
+    settings.ipfs_url, settings.upload_max_size = cluster.url, len(CHUNK) * 4
+    try:
+        user = get_user(uuid4())
+        uuid = user.uuid
+        with get_engine_session() as db:
+            db.add(user)
+            db.commit()
+        headers = {"Authorization": f"Bearer {UserToken(user=uuid).issue_access_token()}"}
+
+        with TestClient(app) as client:
+            assert client.post("/files/upload", data=CHUNK).status_code == 401
+            response = client.post(
+                "/files/upload?filename=a.txt",
+                data=CHUNK,
+                headers={**headers, "Content-Type": "text/plain"},
+            )
+            assert response.status_code == 200
+            assert response.json()["cid"] == cluster.added[-1]["cid"]
+            assert cluster.added[-1]["size"] == len(CHUNK)
+            cid = response.json()["cid"]
+            with get_engine_session() as db:
+                pin = db.get(Pin, (cid, uuid))
+                assert pin is not None and pin.size == len(CHUNK)
+
+            response = client.post("/files/upload", data=CHUNK * 5, headers=headers)
+            assert response.status_code == 413
+            # Body without length is checked while streaming
+            response = client.post("/files/upload", data=(CHUNK for _ in range(5)), headers=headers)
+            assert response.status_code == 413
+            assert len(cluster.added) == 1
+
+            # Quota counts already pinned files, and is checked while streaming
+            settings.upload_quota = len(CHUNK) * 3
+            data = (CHUNK for _ in range(3))
+            response = client.post("/files/upload", data=data, headers=headers)
+            assert response.status_code == 413
+            response = client.post("/files/upload", data=CHUNK * 2, headers=headers)
+            assert response.status_code == 200
+            response = client.post("/files/upload", data=b"x", headers=headers)
+            assert response.status_code == 413
+            assert response.json()["detail"] == "Upload quota exceeded"
+            settings.upload_quota = None
+
+            assert client.delete(f"/files/{cid}", headers=headers).status_code == 200
+            assert cluster.removed == [cid]
+            assert client.delete(f"/files/{cid}", headers=headers).status_code == 404
+    finally:
+        settings.ipfs_url, settings.upload_max_size = ipfs_url, max_size
+        settings.upload_quota = None
+        cluster.stop_thread()
@@ -0,0 +1,70 @@
+import json
+from pathlib import Path
+from uuid import uuid4
+
+from sqlmodel import col
+
+from app.database import get_engine, get_engine_session
+from app.importer import (
+    import_users,
+    insert_rows,
+    max_batch_size,
+    read_checkpoint,
+)
+from app.models.user import User
+from app.security import get_password_hash, verify_password
+from app.utils import int_time
+
+
+def test_import_users(tmp_path: Path) -> None:
+    prefix = uuid4().hex[:6]
+    password_hash = get_password_hash("hashed")
+    records = [
+        {"email": f"{prefix}1@bar.com", "nickname": f"{prefix}1", "password": "plain"},
+        {"email": f"{prefix}2@bar.com", "nickname": f"{prefix}2", "password_hash": password_hash},
+        {"email": "not an email", "nickname": f"{prefix}3", "password": "plain"},
+        {"email": f"{prefix}4@bar.com", "nickname": f"{prefix}1", "password_hash": password_hash},
+        {"email": f"{prefix}5@bar.com", "nickname": f"{prefix}5", "password_hash": password_hash},
+        {"email": f"{prefix}6@bar.com", "nickname": f"{prefix}6", "password_hash": "md5:abc"},
+    ]
+    path = tmp_path / "users.jsonl"
+    path.write_text("\n".join(json.dumps(record) for record in records))
+    checkpoint = str(tmp_path / "checkpoint")
+
+    stats = import_users(str(path), batch_size=2, workers=2, checkpoint=checkpoint)
+    assert (stats.inserted, stats.skipped, stats.invalid) == (3, 1, 2)
+    assert read_checkpoint(checkpoint) == 6
+
+    with get_engine_session() as db:
+        user = db.query(User).where(User.nickname == f"{prefix}1").one()
+        assert verify_password("plain", user.password)
+        assert user.verifed
+        user = db.query(User).where(User.nickname == f"{prefix}2").one()
+        assert user.password == password_hash
+
+    # Everything is already imported, nothing to resume
+    stats = import_users(str(path), batch_size=2, workers=2, checkpoint=checkpoint)
+    assert (stats.inserted, stats.skipped, stats.invalid) == (0, 0, 0)
+
+
+def test_max_batch_size() -> None:
+    engine = get_engine()
+    prefix = uuid4().hex[:6]
+    password_hash = get_password_hash("hashed")
+    # The largest batch fits into one statement
+    rows = [
+        {
+            "uuid": uuid4(),
+            "email": f"{prefix}{i}@bar.com",
+            "nickname": f"{prefix}{i}",
+            "password": password_hash,
+            "disabled": False,
+            "verifed": True,
+            "created_at": int_time(),
+        }
+        for i in range(max_batch_size(engine))
+    ]
+    assert insert_rows(engine, rows) == len(rows)
+    with get_engine_session() as db:
+        db.query(User).where(col(User.nickname).startswith(prefix)).delete(False)
+        db.commit()
@@ -0,0 +1,51 @@
+from uuid import uuid4
+
+from fastapi.testclient import TestClient
+
+from app import app
+from app.database import get_engine_session
+from app.models import UserToken
+from app.settings import get_settings
+from tests.utils import get_user
+
+
+def test_introspect_endpoint() -> None:
+    uuid = uuid4()
+    user = get_user(uuid)
+    nickname = user.nickname
+    usertoken = UserToken(user=uuid)
+    token_uuid = usertoken.uuid
+    access = usertoken.issue_access_token({"nickname": nickname})
+    refresh = usertoken.issue_refresh_token({})
+    with get_engine_session() as db:
+        db.add(user)
+        db.commit()
+        db.add(usertoken)
+        db.commit()
+    body = {"tokens": [access, "invalid", refresh]}
+
+    settings = get_settings()
+    keys = settings.introspection_keys
+    settings.introspection_keys = ["gateway"]
+    try:
+        with TestClient(app) as client:
+            assert client.post("/authorization/introspect", json=body).status_code == 401
+            headers = {"Authorization": "Bearer wrong"}
+            response = client.post("/authorization/introspect", json=body, headers=headers)
+            assert response.status_code == 401
+
+            headers = {"Authorization": "Bearer gateway"}
+            response = client.post("/authorization/introspect", json=body, headers=headers)
+            assert response.status_code == 200
+            results = response.json()["results"]
+    finally:
+        settings.introspection_keys = keys
+
+    assert results[0]["active"] and results[0]["token_type"] == "access_token"
+    assert results[0]["sub"] == str(uuid)
+    assert results[0]["jti"] == token_uuid.hex
+    assert results[0]["scope"] == "files:read files:write"
+    assert results[0]["username"] == nickname
+    assert results[1] == {"active": False, **{key: None for key in results[0] if key != "active"}}
+    assert results[2]["active"] and results[2]["token_type"] == "refresh_token"
+    assert results[2]["scope"] is None
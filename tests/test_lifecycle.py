@@ -0,0 +1,80 @@
+import asyncio
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.pool import QueuePool
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app import app
+from app.lifecycle import Drainer, DrainMiddleware, prefill_pool
+
+
+def test_prefill_pool(tmp_path) -> None:  # type: ignore
+    engine = create_engine(f"sqlite:///{tmp_path / 'db.sqlite3'}", poolclass=QueuePool, pool_size=3)
+    assert prefill_pool(engine) == 3
+    assert engine.pool.checkedin() == 3  # type: ignore[attr-defined]
+    engine.dispose()
+
+
+def test_ready() -> None:
+    with TestClient(app) as client:
+        deadline = time.monotonic() + 10
+        while (response := client.get("/ready")).status_code == 503:
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+        assert response.status_code == 200
+    # Draining on shutdown doesn't affect the next start
+    with TestClient(app) as client:
+        assert client.get("/").status_code == 200
+
+
+async def call(app: DrainMiddleware) -> list[Message]:
+    messages: list[Message] = []
+
+    async def receive() -> Message:
+        return {"type": "http.request", "body": b""}
+
+    async def send(message: Message) -> None:
+        messages.append(message)
+
+    await app({"type": "http", "path": "/"}, receive, send)
+    return messages
+
+
+def sleeping_app(delay: float) -> ASGIApp:
+    async def endpoint(scope: Scope, receive: Receive, send: Send) -> None:
+        await asyncio.sleep(delay)
+
+    return endpoint
+
+
+@pytest.mark.asyncio
+async def test_drain() -> None:
+    drainer = Drainer()
+    fast = DrainMiddleware(sleeping_app(0.1), drainer)
+    slow = DrainMiddleware(sleeping_app(10), drainer)
+
+    # In-flight request finishes before the deadline
+    request = asyncio.create_task(call(fast))
+    await asyncio.sleep(0.01)
+    assert len(drainer.requests) == 1
+    await drainer.drain(1)
+    assert request.done() and not request.cancelled()
+    assert drainer.draining and not drainer.ready
+
+    # New requests are rejected while draining
+    messages = await call(fast)
+    assert messages[0]["status"] == 503
+    assert (b"connection", b"close") in messages[0]["headers"]
+
+    # Slow request is cancelled at the deadline
+    drainer.reset()
+    request = asyncio.create_task(call(slow))
+    await asyncio.sleep(0.01)
+    started = time.monotonic()
+    await drainer.drain(0.1)
+    assert time.monotonic() - started < 1
+    assert request.cancelled()
+    assert not drainer.requests
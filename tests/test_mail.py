@@ -0,0 +1,92 @@
+import asyncio
+import json
+import os
+from pathlib import Path
+from uuid import uuid4
+
+import pytest
+from aiosmtpd.controller import Controller
+from fastapi.testclient import TestClient
+
+from app import app
+from app.database import get_engine_session
+from app.mail import Mail, MailQueue, SMTPConfig
+from app.models import User, UserToken
+from app.otp import OTP_PERIOD, generate_otp, verify_otp
+from tests.utils import get_free_port, get_user
+
+client = TestClient(app)
+
+
+def test_otp() -> None:
+    uuid = uuid4()
+    code = generate_otp(uuid, "foo@bar.com")
+    assert len(code) == 6
+    assert verify_otp(uuid, "foo@bar.com", code)
+    assert not verify_otp(uuid, "other@bar.com", code)
+    assert not verify_otp(uuid4(), "foo@bar.com", code)
+    expired = generate_otp(uuid, "foo@bar.com", window=0)
+    assert not verify_otp(uuid, "foo@bar.com", expired)
+    assert OTP_PERIOD > 0
+
+
+def test_verify_email() -> None:
+    user = get_user(uuid4())
+    uuid, email = user.uuid, user.email
+    with get_engine_session() as db:
+        db.add(user)
+        db.commit()
+    headers = {"Authorization": f"Bearer {UserToken(user=uuid).issue_access_token()}"}
+
+    response = client.post("/authorization/verify", json={"code": "000000"}, headers=headers)
+    assert response.status_code == 400
+    code = generate_otp(uuid, email)
+    response = client.post("/authorization/verify", json={"code": code}, headers=headers)
+    assert response.status_code == 200
+    with get_engine_session() as db:
+        assert db.get(User, uuid).verifed  # type: ignore
+
+
+@pytest.mark.asyncio
+async def test_mail_queue(tmp_path: Path) -> None:
+    class Handler:
+        def __init__(self) -> None:
+            self.received: list[str] = []
+            self.sessions: set[int] = set()
+
+        async def handle_DATA(self, server, session, envelope) -> str:  # type: ignore
+            self.received.extend(envelope.rcpt_tos)
+            self.sessions.add(id(session))
+            return "250 OK"
+
+    handler = Handler()
+    port = get_free_port()
+    controller = Controller(handler, hostname="127.0.0.1", port=port)
+    controller.start()
+    try:
+        config = SMTPConfig("127.0.0.1", port)
+
+        # Mail left in spool by a dead process is recovered on start
+        spool = tmp_path / "spool"
+        spool.mkdir()
+        orphan = Mail("orphan@bar.com", "Subject", "Body")
+        (spool / f"{orphan.id}.999999999.json").write_text(json.dumps(orphan.__dict__))
+
+        queue = MailQueue(config, str(spool), connections=1, batch_size=10)
+        await queue.start()
+        recipients = [f"{i}@bar.com" for i in range(20)]
+        for recipient in recipients:
+            await queue.send(Mail(recipient, "Subject", "Body"))
+        for _ in range(100):
+            # Sent mails are removed from spool after the server accepts them
+            if len(handler.received) == len(recipients) + 1 and not os.listdir(spool):
+                break
+            await asyncio.sleep(0.05)
+        await queue.stop()
+
+        assert sorted(handler.received) == sorted(recipients + [orphan.to])
+        # One sender task reuses one connection for all batches
+        assert len(handler.sessions) == 1
+        assert os.listdir(spool) == []
+    finally:
+        controller.stop()
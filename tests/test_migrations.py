@@ -0,0 +1,81 @@
+from io import StringIO
+from pathlib import Path
+from typing import Iterator
+from uuid import uuid4
+
+import pytest
+import sqlalchemy as sa
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from sqlalchemy.engine import Connection
+
+from migrations.online import PROGRESS_TABLE, add_column, backfill, create_index
+
+ROWS = 2500
+
+
+@pytest.fixture
+def connection(tmp_path: Path) -> Iterator[Connection]:
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'db.sqlite3'}")
+    with engine.connect() as connection:
+        connection.execute(sa.text("CREATE TABLE item (uuid CHAR(32) PRIMARY KEY, name TEXT)"))
+        connection.execute(
+            sa.text("INSERT INTO item (uuid, name) VALUES (:uuid, :name)"),
+            [{"uuid": uuid4().hex, "name": str(i)} for i in range(ROWS)],
+        )
+        context = MigrationContext.configure(connection)
+        with Operations.context(context):
+            yield connection
+    engine.dispose()
+
+
+def test_add_column(connection: Connection) -> None:
+    add_column("item", sa.Column("flag", sa.Boolean(), nullable=False), False, duty_cycle=1)
+    assert connection.execute(sa.text("SELECT count(*) FROM item WHERE flag = 0")).scalar() == ROWS
+    column = next(c for c in sa.inspect(connection).get_columns("item") if c["name"] == "flag")
+    assert not column["nullable"] and column["default"] is None
+    # Progress of finished backfill is removed
+    assert connection.execute(sa.text(f"SELECT count(*) FROM {PROGRESS_TABLE}")).scalar() == 0
+
+
+def test_backfill_resumes(connection: Connection) -> None:
+    connection.execute(sa.text("ALTER TABLE item ADD COLUMN score INTEGER"))
+    keys = connection.execute(sa.text("SELECT uuid FROM item ORDER BY uuid")).scalars().all()
+    # Interrupted run updated the first 1000 rows
+    connection.execute(sa.text("UPDATE item SET score = 1 WHERE uuid <= :key"), {"key": keys[999]})
+    connection.execute(
+        sa.text(f"CREATE TABLE {PROGRESS_TABLE} (name TEXT PRIMARY KEY, last_key TEXT, rows INT)")
+    )
+    connection.execute(
+        sa.text(f"INSERT INTO {PROGRESS_TABLE} VALUES ('item.score', :key, 1000)"),
+        {"key": keys[999]},
+    )
+
+    rows = backfill("item", {"score": 2}, "score IS NULL", batch_size=300, duty_cycle=1)
+    assert rows == ROWS
+    scores = connection.execute(sa.text("SELECT score, count(*) FROM item GROUP BY score"))
+    assert dict(scores.all()) == {1: 1000, 2: ROWS - 1000}
+
+
+def test_create_index(connection: Connection) -> None:
+    create_index("ix_item_name", "item", ["name"])
+    # Repeated run skips existing index
+    create_index("ix_item_name", "item", ["name"])
+    assert [index["name"] for index in sa.inspect(connection).get_indexes("item")] == [
+        "ix_item_name"
+    ]
+
+
+def test_add_column_postgresql_not_null() -> None:
+    buffer = StringIO()
+    context = MigrationContext.configure(
+        dialect_name="postgresql", opts={"as_sql": True, "output_buffer": buffer}
+    )
+    with Operations.context(context):
+        add_column("item", sa.Column("flag", sa.Boolean(), nullable=False), False)
+    sql = buffer.getvalue()
+    # Table is scanned by VALIDATE, SET NOT NULL uses the validated constraint
+    steps = ["NOT VALID", "VALIDATE CONSTRAINT", "SET NOT NULL", "DROP CONSTRAINT"]
+    positions = [sql.index(step) for step in steps]
+    assert positions == sorted(positions)
+    assert "DROP DEFAULT" in sql
@@ -0,0 +1,99 @@
+from uuid import uuid4
+
+import pytest
+
+from app.database import get_engine, get_engine_session
+from app.ipfs import IPFSClient
+from app.models import Pin, PinStatus, UploadReservation
+from app.pins import (
+    ReconcileStats,
+    parse_time,
+    reconcile,
+    release_space,
+    reserve_space,
+    used_space,
+)
+from app.utils import int_time
+from tests.utils import FakeCluster, get_user
+
+RUN = uuid4().hex[:16]
+
+
+def cid(name: str) -> str:
+    # Unique per run, so pins left by previous runs don't interfere
+    return ("Qm" + RUN + name).ljust(46, "x")
+
+
+def test_parse_time() -> None:
+    assert parse_time("1970-01-01T00:01:40.123456789Z") == 100
+    assert parse_time("0001-01-01T00:00:00Z") is not None
+    assert parse_time("garbage") is None
+    assert parse_time(None) is None
+
+
+def test_reserve_space() -> None:
+    user = get_user(uuid4())
+    owner = user.uuid
+    with get_engine_session() as db:
+        db.add(user)
+        db.commit()
+        db.add(Pin(cid=cid("quota"), owner=owner, size=30))
+        # Left by a dead process
+        db.add(UploadReservation(owner=owner, size=50, expires_at=int_time() - 1))
+        db.commit()
+
+        first = reserve_space(db, owner, 50, quota=100)
+        assert first is not None and first.size == 50
+        # Concurrent upload only gets what is left by the first one
+        second = reserve_space(db, owner, 50, quota=100)
+        assert second is not None and second.size == 20
+        assert reserve_space(db, owner, 1, quota=100) is None
+        assert used_space(db, owner) == 100
+
+        release_space(db, first)
+        release_space(db, second)
+        assert used_space(db, owner) == 30
+        assert db.query(UploadReservation).filter_by(owner=owner).count() == 0
+
+
+@pytest.mark.asyncio
+async def test_reconcile() -> None:
+    user = get_user(uuid4())
+    owner = user.uuid
+    old = int_time() - 7200
+    with get_engine_session() as db:
+        db.add(user)
+        db.commit()
+        db.add(Pin(cid=cid("pinned"), owner=owner, created_at=old))
+        db.add(Pin(cid=cid("failed"), owner=owner, created_at=old))
+        db.add(Pin(cid=cid("lost"), owner=owner, name="lost.txt", created_at=old))
+        # Just uploaded, may be not listed yet
+        db.add(Pin(cid=cid("fresh"), owner=owner))
+        db.commit()
+
+    cluster = FakeCluster()
+    cluster.set_pin(cid("pinned"), created="2020-01-01T00:00:00.123456789Z")
+    cluster.set_pin(cid("failed"), status="pin_error", created="2020-01-01T00:00:00Z")
+    cluster.set_pin(cid("orphan"), created="2020-01-01T00:00:00Z")
+    cluster.set_pin(cid("new"))
+    await cluster.start()
+    try:
+        async with IPFSClient(cluster.url) as ipfs:
+            stats = await reconcile(ipfs, get_engine(), batch_size=2)
+    finally:
+        await cluster.stop()
+
+    # Pins left in database by other tests are repinned too
+    assert stats.repinned >= 1
+    stats.repinned = 0
+    assert stats == ReconcileStats(checked=4, updated=2, recovered=1, removed=1)
+    assert cluster.recovered == [cid("failed")]
+    assert cluster.removed == [cid("orphan")]
+    assert cid("lost") in cluster.pinned
+    assert cid("fresh") not in cluster.pinned
+    assert cluster.pins[cid("lost")]["name"] == "lost.txt"
+    with get_engine_session() as db:
+        assert db.get(Pin, (cid("pinned"), owner)).status == PinStatus.pinned  # type: ignore
+        assert db.get(Pin, (cid("failed"), owner)).status == PinStatus.error  # type: ignore
+        assert db.get(Pin, (cid("lost"), owner)).status == PinStatus.missing  # type: ignore
+        assert db.get(Pin, (cid("fresh"), owner)).status == PinStatus.queued  # type: ignore
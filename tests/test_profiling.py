@@ -0,0 +1,80 @@
+import asyncio
+from pathlib import Path
+from time import perf_counter
+from types import FrameType, SimpleNamespace
+from typing import cast
+from uuid import uuid4
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import app
+from app.database import get_engine_session
+from app.models import UserToken
+from app.profiling import Sampler, frame_name
+from app.settings import get_settings
+from tests.utils import get_user
+
+
+def busy(seconds: float) -> None:
+    started = perf_counter()
+    while perf_counter() - started < seconds:
+        pass
+
+
+def test_frame_name_without_qualname() -> None:
+    # Code objects have no `co_qualname` before Python 3.11
+    code = SimpleNamespace(co_name="busy")
+    frame = cast(FrameType, SimpleNamespace(f_code=code, f_globals={"__name__": "tests"}))
+    assert frame_name(frame) == "tests:busy"
+
+
+@pytest.mark.asyncio
+async def test_sampler(tmp_path: Path) -> None:
+    sampler = Sampler(str(tmp_path), interval=0.001, flush_interval=3600)
+    sampler.start()
+    try:
+        task = asyncio.current_task()
+        assert task is not None
+        stacks = sampler.watch(task)  # type: ignore[arg-type]
+        busy(0.2)
+        assert sampler.finish(task, "endpoint") is stacks  # type: ignore[arg-type]
+        assert sum(stacks.values()) > 10
+        stack, _ = stacks.most_common(1)[0]
+        assert stack.endswith("test_profiling:busy")
+        # Samples are not attributed after finish
+        busy(0.05)
+        assert sum(stacks.values()) == sum(sampler.aggregated.values())
+    finally:
+        sampler.stop()
+    (profile,) = tmp_path.glob("continuous-*.folded")
+    lines = profile.read_text().splitlines()
+    assert lines and all(line.startswith("endpoint;") for line in lines)
+
+
+def test_profile_header(tmp_path: Path) -> None:
+    user = get_user(uuid4())
+    uuid = user.uuid
+    with get_engine_session() as db:
+        db.add(user)
+        db.commit()
+    headers = {"Authorization": f"Bearer {UserToken(user=uuid).issue_access_token()}"}
+    settings = get_settings()
+    admins, directory = settings.admins, app.state.sampler.directory
+    app.state.sampler.directory = tmp_path
+    try:
+        with TestClient(app) as client:
+            response = client.get("/", headers={**headers, "X-Profile": "1"})
+            assert "x-profile-id" not in response.headers
+            assert client.get("/debug/profiles/" + "0" * 32, headers=headers).status_code == 403
+
+            settings.admins = [uuid]
+            response = client.get("/", headers={**headers, "X-Profile": "1"})
+            profile_id = response.headers["x-profile-id"]
+            assert (tmp_path / f"{profile_id}.folded").exists()
+            response = client.get(f"/debug/profiles/{profile_id}", headers=headers)
+            assert response.status_code == 200
+            response = client.get("/debug/profiles/" + "0" * 32, headers=headers)
+            assert response.status_code == 404
+    finally:
+        settings.admins, app.state.sampler.directory = admins, directory
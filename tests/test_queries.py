@@ -0,0 +1,38 @@
+from uuid import uuid4
+
+from app import queries
+from app.database import get_engine, get_engine_session
+from app.models import UserToken
+from tests.utils import get_user
+
+
+def test_queries() -> None:
+    user = get_user(uuid4())
+    uuid, nickname, email = user.uuid, user.nickname, user.email
+    usertoken = UserToken(user=uuid)
+    token_uuid = usertoken.uuid
+    with get_engine_session() as db:
+        db.add(user)
+        db.commit()
+        db.add(usertoken)
+        db.commit()
+
+    with get_engine().begin() as connection:
+        credentials = queries.load_credentials(connection, nickname)
+        assert credentials is not None and credentials.uuid == uuid
+        assert queries.load_credentials(connection, "missing") is None
+        assert queries.load_uuid_by_nickname(connection, nickname) == uuid
+        assert queries.email_taken(connection, email)
+        assert not queries.email_taken(connection, "missing@bar.com")
+
+        table = UserToken.__table__  # type: ignore[attr-defined]
+        assert queries.token_exists(connection, table, token_uuid)
+        assert queries.token_exists(connection, table, token_uuid.hex)
+        assert not queries.token_exists(connection, table, uuid4())
+
+        projection = queries.load_user(connection, uuid)
+        assert projection is not None and projection.nickname == nickname
+        assert not projection.verifed
+        queries.mark_verified(connection, uuid)
+        assert queries.load_user(connection, uuid).verifed  # type: ignore[union-attr]
+        assert queries.load_user(connection, uuid4()) is None
@@ -0,0 +1,132 @@
+from threading import Event
+from typing import AsyncIterator
+from uuid import UUID, uuid4
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+
+from app import app
+from app.database import get_engine, get_engine_session
+from app.models import RevocationKind, User, UserToken
+from app.revocations import (
+    REVOCATION,
+    RevocationEvent,
+    RevocationFeed,
+    revoke_token,
+    revoke_user,
+)
+from app.settings import get_settings
+from tests.utils import get_user
+
+
+def create_user() -> tuple[UUID, UUID, str]:
+    user = get_user(uuid4())
+    uuid = user.uuid
+    usertoken = UserToken(user=uuid)
+    token_uuid = usertoken.uuid
+    refresh = usertoken.issue_refresh_token({})
+    with get_engine_session() as db:
+        db.add(user)
+        db.commit()
+        db.add(usertoken)
+        db.commit()
+    return uuid, token_uuid, refresh
+
+
+async def next_event(events: AsyncIterator[RevocationEvent | None]) -> RevocationEvent:
+    for _ in range(100):
+        event = await events.__anext__()
+        if event is not None:
+            return event
+    raise AssertionError("No event")
+
+
+@pytest.mark.asyncio
+async def test_feed() -> None:
+    uuid, token_uuid, _ = create_user()
+    feed = RevocationFeed(get_engine(), 15 * 60, poll_interval=0.05)
+    events = feed.subscribe(None, heartbeat=0.05)
+    # Heartbeat comes once the subscriber is registered
+    assert await events.__anext__() is None
+
+    with get_engine().begin() as connection:
+        assert revoke_token(connection, token_uuid, uuid)
+        assert not revoke_token(connection, token_uuid, uuid)
+    event = await next_event(events)
+    assert event.kind == RevocationKind.token and event.jti == token_uuid
+    assert f"id: {event.seq}\nevent: token\n" in event.sse()
+
+    with get_engine().begin() as connection:
+        revoke_user(connection, uuid, disable=True)
+    disabled = await next_event(events)
+    assert disabled.kind == RevocationKind.user_disabled and disabled.watermark
+    await events.aclose()
+
+    # Resumed subscriber gets events after its cursor first
+    resumed = feed.subscribe(event.seq, heartbeat=0.05)
+    assert (await next_event(resumed)).seq == disabled.seq
+    await feed.stop()
+    with pytest.raises(StopAsyncIteration):
+        while True:
+            await resumed.__anext__()
+    assert feed.task is None and not feed.subscribers
+
+
+@pytest.mark.asyncio
+async def test_feed_no_gap_after_replay(monkeypatch: pytest.MonkeyPatch) -> None:
+    uuid, token_uuid, _ = create_user()
+    feed = RevocationFeed(get_engine(), 15 * 60, poll_interval=0.05)
+    load, position = feed._load, feed._position
+    replayed = Event()
+
+    def load_then_revoke(after: int | None, since: int | None = None) -> list[RevocationEvent]:
+        events = load(after, since)
+        if since is None:
+            # Committed after replay read its events
+            with get_engine().begin() as connection:
+                revoke_token(connection, token_uuid, uuid)
+            replayed.set()
+        return events
+
+    def late_position() -> tuple[int, dict[int, int]]:
+        # Poller position taken after the commit must not hide the event
+        replayed.wait(0.2)
+        return position()
+
+    monkeypatch.setattr(feed, "_load", load_then_revoke)
+    monkeypatch.setattr(feed, "_position", late_position)
+    with get_engine().begin() as connection:
+        seq = connection.execute(select(func.max(REVOCATION.c.seq))).scalar() or 0
+    events = feed.subscribe(seq, heartbeat=0.05)
+    event = await next_event(events)
+    assert event.jti == token_uuid
+    await events.aclose()
+    await feed.stop()
+
+
+def test_logout_and_disable() -> None:
+    uuid, token_uuid, refresh = create_user()
+    admin = uuid4()
+    admin_token = UserToken(user=admin).issue_access_token()
+    settings = get_settings()
+    admins = settings.admins
+    settings.admins = [admin]
+    client = TestClient(app)
+    try:
+        response = client.post("/authorization/logout", json={"refresh_token": refresh})
+        assert response.status_code == 200
+        response = client.post("/authorization/logout", json={"refresh_token": refresh})
+        assert response.status_code != 200
+
+        headers = {"Authorization": f"Bearer {admin_token}"}
+        assert client.post(f"/users/{uuid}/disable").status_code == 401
+        assert client.post(f"/users/{uuid}/disable", headers=headers).json() == 0
+        assert client.post(f"/users/{uuid4()}/revoke", headers=headers).status_code == 404
+    finally:
+        settings.admins = admins
+    with get_engine_session() as db:
+        user = db.get(User, uuid)
+        assert user is not None and user.disabled
+    # Feed requires service key
+    assert client.get("/authorization/revocations").status_code == 401
@@ -0,0 +1,61 @@
+from uuid import uuid4
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import app, scopes
+from app.models import UserToken
+from app.models.token import TokenTypes
+from app.scopes import Scope, ScopeMask, pack, token_scopes, unpack
+
+
+def test_pack_unpack() -> None:
+    assert unpack(pack([])) == frozenset()
+    assert unpack(pack([Scope.files_write])) == {Scope.files_write}
+    assert unpack(pack(Scope)) == set(Scope)
+    # Unknown bits are ignored
+    assert unpack(pack([Scope.files_read]) | 1 << 40) == {Scope.files_read}
+
+
+def test_token_scopes() -> None:
+    token = UserToken(user=uuid4()).issue_access_token({})
+    claims = UserToken.parse(token)
+    assert claims["scv"] == scopes.CURRENT_VERSION
+    assert token_scopes(claims) == scopes.USER_SCOPES
+    assert ScopeMask([Scope.files_read, Scope.files_write]).check(claims)
+    # Tokens issued before scopes were added
+    legacy = {"sub": uuid4().hex, "typ": TokenTypes.AccessToken.value}
+    assert token_scopes(legacy) == scopes.LEGACY_SCOPES
+    assert ScopeMask([Scope.files_write]).check(legacy)
+    # Unknown layout version grants nothing
+    assert not ScopeMask([Scope.files_read]).check({"scp": 1, "scv": 999})
+    assert ScopeMask([]).check({"scp": 0, "scv": 1})
+
+
+def test_layout_versions(monkeypatch: pytest.MonkeyPatch) -> None:
+    old = {"scp": pack([Scope.files_write], 1), "scv": 1}
+    # New layout with different bit order
+    layouts = {**scopes.LAYOUTS, 2: (Scope.files_write, Scope.files_read)}
+    monkeypatch.setattr(scopes, "LAYOUTS", layouts)
+    monkeypatch.setattr(scopes, "CURRENT_VERSION", 2)
+    new = {"scp": pack([Scope.files_write], 2), "scv": 2}
+    assert old["scp"] != new["scp"]
+
+    write, read = ScopeMask([Scope.files_write]), ScopeMask([Scope.files_read])
+    assert write.check(old) and write.check(new)
+    assert not read.check(old) and not read.check(new)
+    assert token_scopes(old) == token_scopes(new) == {Scope.files_write}
+
+
+def test_require_scopes(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr("app.models.token.user_scopes", lambda user: frozenset({Scope.files_read}))
+    token = UserToken(user=uuid4()).issue_access_token({})
+    headers = {"Authorization": f"Bearer {token}"}
+    with TestClient(app) as client:
+        response = client.post("/files/upload", data=b"test", headers=headers)
+        assert response.status_code == 403
+        response = client.delete(f"/files/{'a' * 46}", headers=headers)
+        assert response.status_code == 403
+        # Scope is present, fails later as the job doesn't exist or queue is disabled
+        response = client.get(f"/files/jobs/{uuid4().hex}", headers=headers)
+        assert response.status_code in (404, 503)
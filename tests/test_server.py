@@ -0,0 +1,39 @@
+import signal
+import subprocess
+import sys
+import time
+
+import requests
+
+from tests.utils import get_free_port
+
+
+def wait_ready(url: str, timeout: float = 20) -> requests.Response:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return requests.get(url, timeout=1)
+        except requests.ConnectionError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def test_serve_recycle_reload_and_stop() -> None:
+    port = get_free_port()
+    url = f"http://127.0.0.1:{port}/"
+    process = subprocess.Popen(
+        [sys.executable, "-m", "app", "serve", "--port", str(port), "--workers", "2"]
+        + ["--max-requests", "2"],
+    )
+    try:
+        assert wait_ready(url).json() == "Hello world!"
+        # Workers are recycled after max requests and replaced by supervisor
+        for _ in range(10):
+            assert wait_ready(url).status_code == 200
+        process.send_signal(signal.SIGHUP)
+        for _ in range(5):
+            assert wait_ready(url).status_code == 200
+    finally:
+        process.send_signal(signal.SIGTERM)
+        assert process.wait(timeout=30) == 0
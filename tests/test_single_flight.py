@@ -0,0 +1,105 @@
+import asyncio
+from uuid import uuid4
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import app
+from app.database import get_engine_session
+from app.models import UserToken
+from app.routers.auth import get_uuid_by_nickname, nickname_lookups
+from app.settings import get_settings
+from app.utils import SingleFlight
+from tests.utils import get_user
+
+
+@pytest.mark.asyncio
+async def test_coalescing() -> None:
+    flight: SingleFlight[str, int] = SingleFlight()
+    started = 0
+
+    async def query() -> int:
+        nonlocal started
+        started += 1
+        value = started
+        await asyncio.sleep(0.05)
+        return value
+
+    results = await asyncio.gather(
+        *(flight.do("a", query) for _ in range(10)), flight.do("b", query)
+    )
+    assert results == [1] * 10 + [2]
+    assert (flight.calls, flight.coalesced) == (2, 9)
+    assert flight.flights == {}
+    # Results are not cached
+    assert await flight.do("a", query) == 3
+
+
+@pytest.mark.asyncio
+async def test_errors_and_cancellation() -> None:
+    flight: SingleFlight[str, int] = SingleFlight()
+
+    async def failing() -> int:
+        await asyncio.sleep(0.05)
+        raise ValueError("boom")
+
+    results = await asyncio.gather(
+        *(flight.do("a", failing) for _ in range(3)), return_exceptions=True
+    )
+    assert all(isinstance(result, ValueError) for result in results)
+
+    finished = asyncio.Event()
+
+    async def slow() -> int:
+        try:
+            await asyncio.sleep(0.1)
+            return 42
+        finally:
+            finished.set()
+
+    first = asyncio.create_task(flight.do("a", slow))
+    second = asyncio.create_task(flight.do("a", slow))
+    await asyncio.sleep(0.01)
+    first.cancel()
+    # Other caller still gets the result
+    assert await second == 42
+    assert first.cancelled()
+
+    finished.clear()
+    only = asyncio.create_task(flight.do("a", slow))
+    await asyncio.sleep(0.01)
+    only.cancel()
+    await asyncio.sleep(0.01)
+    # Nobody waits anymore, shared call is cancelled and new callers start a new one
+    assert finished.is_set() and flight.flights == {}
+    assert await flight.do("a", slow) == 42
+
+
+@pytest.mark.asyncio
+async def test_nickname_lookup() -> None:
+    user = get_user(uuid4())
+    uuid, nickname = user.uuid, user.nickname
+    with get_engine_session() as db:
+        db.add(user)
+        db.commit()
+    coalesced = nickname_lookups.coalesced
+    results = await asyncio.gather(*(get_uuid_by_nickname(nickname) for _ in range(5)))
+    assert results == [uuid] * 5
+    assert nickname_lookups.coalesced - coalesced == 4
+
+
+def test_stats_endpoint() -> None:
+    admin = uuid4()
+    headers = {"Authorization": f"Bearer {UserToken(user=admin).issue_access_token()}"}
+    settings = get_settings()
+    admins = settings.admins
+    settings.admins = [admin]
+    try:
+        response = TestClient(app).get("/debug/single-flight", headers=headers)
+    finally:
+        settings.admins = admins
+    assert response.status_code == 200
+    assert response.json()["nickname"] == {
+        "calls": nickname_lookups.calls,
+        "coalesced": nickname_lookups.coalesced,
+    }
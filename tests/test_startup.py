@@ -0,0 +1,33 @@
+import subprocess
+import sys
+
+HEAVY_MODULES = ["passlib", "jose", "aiohttp"]
+
+
+def import_times(module: str) -> dict[str, int]:
+    """Import module in a fresh interpreter and return cumulative import time of each module."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_import_package_is_cheap() -> None:
+    times = import_times("app")
+    assert "fastapi" not in times
+    assert "sqlalchemy" not in times
+
+
+def test_import_main_defers_heavy_modules() -> None:
+    times = import_times("app.main")
+    for module in HEAVY_MODULES:
+        assert module not in times
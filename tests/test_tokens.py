@@ -1,8 +1,12 @@
 from time import time
 from uuid import uuid4
 
+import pytest
+
 from app.database import get_engine_session
+from app.exceptions import JWTValidationError
 from app.models import TokenTypes, User, UserToken
+from app.models.token import COMPACT_HEADER, decode, decode_batch, encode
 from tests.utils import get_user
 
 
@@ -48,3 +52,62 @@ def test_issue_access_token() -> None:
         UserToken.verify(parsed, TokenTypes.AccessToken, db)
         token_from_str = UserToken.from_str(token, TokenTypes.AccessToken, db)
     assert token_from_str.user == uuid
+
+
+def test_decode_batch() -> None:
+    usertoken = UserToken(user=uuid4())
+    valid = [usertoken.issue_access_token({}), usertoken.issue_refresh_token({})]
+    expired = encode({"sub": "a", "iat": 1, "exp": 2})
+    header, payload, signature = valid[0].split(".")
+    forged = f"{header}.{payload}.{signature[:-4]}AAAA"
+    none_alg = "eyJhbGciOiJub25lIn0." + payload + "."
+    invalid = [expired, forged, none_alg, "", "a.b.c", encode({"sub": "a", "exp": 2**40})]
+    results = decode_batch(valid + invalid)
+    assert results[:2] == [decode(token) for token in valid]
+    assert results[2:] == [None] * len(invalid)
+
+
+def test_introspect() -> None:
+    active, disabled = get_user(uuid4()), get_user(uuid4())
+    disabled.disabled = True
+    active_token, disabled_token, revoked_token = (
+        UserToken(user=active.uuid),
+        UserToken(user=disabled.uuid),
+        UserToken(user=active.uuid),
+    )
+    tokens = [
+        active_token.issue_refresh_token({}),
+        active_token.issue_access_token({}),
+        disabled_token.issue_refresh_token({}),
+        disabled_token.issue_access_token({}),
+        revoked_token.issue_refresh_token({}),
+        encode({"sub": active.uuid.hex, "iat": 1, "exp": 2**40, "typ": 2}),
+    ]
+    with get_engine_session() as db:
+        db.add_all([active, disabled])
+        db.commit()
+        db.add_all([active_token, disabled_token])
+        db.commit()
+        results = UserToken.introspect(tokens, db)
+    assert [result is not None for result in results] == [True, True, False, False, False, False]
+
+
+def test_compact_access_token() -> None:
+    uuid = uuid4()
+    usertoken = UserToken(user=uuid)
+    profile: dict[str, str | int | float] = {"nickname": "nick", "email": "nick@bar.com"}
+    full = usertoken.issue_access_token({**profile})
+    token = usertoken.issue_access_token({**profile}, compact=True)
+    assert len(token) < len(full)
+    assert token.startswith(COMPACT_HEADER + ".")
+    parsed = UserToken.parse(token)
+    assert {key: value for key, value in UserToken.parse(full).items() if key != "class"} == parsed
+    assert decode(token) == decode_batch([token])[0] == parsed
+    assert UserToken.from_str_access_token(token).user == uuid
+    assert UserToken.from_str_access_token(token).uuid == usertoken.uuid
+
+    # Compact profile is marked by `t` claim
+    invalid = encode({"sub": "a", "iat": 1, "exp": 2**40, "t": 1, "i": "not a uuid"})
+    with pytest.raises(JWTValidationError):
+        UserToken.parse(invalid)
+    assert decode_batch([invalid]) == [None]
@@ -0,0 +1,96 @@
+import json
+from pathlib import Path
+from uuid import uuid4
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import app
+from app.database import get_engine_session
+from app.ipfs import IPFSClient
+from app.security import get_password_hash
+from app.settings import get_settings
+from app.tracing import BatchExporter, FileSink, Span, parse_traceparent, tracer
+from tests.utils import FakeCluster, get_user
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+
+
+def read_spans(path: Path) -> list[dict[str, str]]:
+    spans = []
+    for line in path.read_text().splitlines():
+        for resource in json.loads(line)["resourceSpans"]:
+            for scope in resource["scopeSpans"]:
+                spans.extend(scope["spans"])
+    return spans
+
+
+def test_parse_traceparent() -> None:
+    assert parse_traceparent(f"00-{TRACE_ID}-{PARENT_ID}-01") == (TRACE_ID, PARENT_ID, True)
+    assert parse_traceparent(f"00-{TRACE_ID}-{PARENT_ID}-00") == (TRACE_ID, PARENT_ID, False)
+    assert parse_traceparent(f"00-{'0' * 32}-{PARENT_ID}-01") is None
+    assert parse_traceparent("garbage") is None
+    assert parse_traceparent(None) is None
+
+
+def test_exporter_never_blocks() -> None:
+    batches: list[bytes] = []
+    exporter = BatchExporter(batches.append, max_queue=2, batch_size=2)
+    for _ in range(5):
+        exporter.export(Span("test", TRACE_ID, None))
+    assert exporter.dropped == 3
+    exporter.start()
+    exporter.stop()
+    assert exporter.exported == 2 and len(batches) == 1
+
+
+@pytest.mark.asyncio
+async def test_spans(tmp_path: Path) -> None:
+    path = tmp_path / "spans.jsonl"
+    cluster = FakeCluster()
+    await cluster.start()
+    tracer.start(BatchExporter(FileSink(str(path))))
+    try:
+        async with IPFSClient(cluster.url) as ipfs:
+            with tracer.span("job") as job:
+                get_password_hash("password")
+                await ipfs.status("QmRf22bZar3WKmojipms22PkXH1MZGmvsqzQtuSvQE3uhm")
+            # Not in a trace
+            await ipfs.status("QmRf22bZar3WKmojipms22PkXH1MZGmvsqzQtuSvQE3uhm")
+    finally:
+        tracer.stop()
+        await cluster.stop()
+    assert job is not None
+    spans = {span["name"]: span for span in read_spans(path)}
+    assert set(spans) == {"job", "password.hash", "HTTP GET"}
+    assert spans["password.hash"]["parentSpanId"] == job.span_id
+    assert spans["HTTP GET"]["parentSpanId"] == job.span_id
+    assert spans["HTTP GET"]["traceId"] == job.trace_id
+
+
+def test_request_trace(tmp_path: Path) -> None:
+    path = tmp_path / "spans.jsonl"
+    user = get_user(uuid4())
+    nickname = user.nickname
+    with get_engine_session() as db:
+        db.add(user)
+        db.commit()
+    settings = get_settings()
+    settings.trace_export = str(path)
+    try:
+        with TestClient(app) as client:
+            response = client.get(
+                f"/authorization/login/get_uuid?nickname={nickname}",
+                headers={"traceparent": f"00-{TRACE_ID}-{PARENT_ID}-01"},
+            )
+            assert response.status_code == 200
+            assert parse_traceparent(response.headers["traceparent"])[0] == TRACE_ID  # type: ignore
+    finally:
+        settings.trace_export = None
+    spans = read_spans(path)
+    (server,) = [span for span in spans if span["name"] == "GET /authorization/login/get_uuid"]
+    assert server["traceId"] == TRACE_ID and server["parentSpanId"] == PARENT_ID
+    assert any(
+        span["name"] == "SELECT" and span["parentSpanId"] == server["spanId"] for span in spans
+    )
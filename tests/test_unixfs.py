@@ -0,0 +1,156 @@
+import hashlib
+import os
+import random
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from time import perf_counter
+from typing import Iterator
+
+import pytest
+
+from app.exceptions import IPFSException
+from app.ipfs import IPFSClient
+from app.ipfs.car import dag_root, file_car, iter_car
+from app.ipfs.unixfs import (
+    CHUNK_SIZE,
+    FileImporter,
+    bytes_cid,
+    cid_to_str,
+    file_cid,
+    fixed_size_chunks,
+    import_chunks,
+    rabin_chunks,
+)
+from tests.utils import FakeCluster
+
+DATA = random.Random(0).randbytes(3 * CHUNK_SIZE + 1000)
+
+
+def split(data: bytes, size: int) -> Iterator[bytes]:
+    for start in range(0, len(data), size):
+        yield data[start : start + size]
+
+
+def read_varint(data: bytes, offset: int) -> tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if byte < 0x80:
+            return value, offset
+
+
+def test_known_cids() -> None:
+    # Same as `ipfs add` and `tests/test_ipfs.py`
+    assert bytes_cid(b"test") == "QmRf22bZar3WKmojipms22PkXH1MZGmvsqzQtuSvQE3uhm"
+    assert file_cid("dummy.txt") == "QmRJaHfsTiD5JfhGju8EUKATgKYPn4jgexTipVLCTKEg6j"
+    assert bytes_cid(b"") == "QmbFMke1KXqnYyBBWxB74N4c5SBnJMVAiMNRcGu6x1AwQH"
+    assert bytes_cid(b"hello world\n") == "QmT78zSuBmuS4z925WZfrqQ1qHaJ56DQaTfyMUF7F8ff5o"
+    # CIDv1 uses raw leaves
+    assert bytes_cid(b"hello world", 1) == (
+        "bafkreifzjut3te2nhyekklss27nh3k72ysco7y32koao5eei66wof36n5e"
+    )
+
+
+def test_balanced_layout() -> None:
+    def count_blocks(leaves: int) -> int:
+        blocks = []
+        importer = FileImporter(max_links=3, on_block=lambda cid, data: blocks.append(cid))
+        for leaf in range(leaves):
+            importer.add(bytes([leaf]))
+        importer.finish()
+        assert blocks[-1] == importer.root
+        return len(blocks)
+
+    assert count_blocks(1) == 1
+    assert count_blocks(3) == 3 + 1
+    assert count_blocks(4) == 4 + 2 + 1
+    # 3 full nodes and a node with one leaf under a full subtree
+    assert count_blocks(10) == 10 + 4 + 2 + 1
+
+
+def test_chunkers() -> None:
+    chunks = list(fixed_size_chunks(split(DATA, 1000)))
+    assert [len(chunk) for chunk in chunks] == [CHUNK_SIZE] * 3 + [1000]
+    assert b"".join(chunks) == DATA
+
+    options = {"average": 1024, "minimum": 256, "maximum": 2048}
+    chunks = list(rabin_chunks([DATA], **options))  # type: ignore
+    assert b"".join(chunks) == DATA
+    assert all(256 <= len(chunk) <= 2048 for chunk in chunks[:-1])
+    # Boundaries don't depend on how input is split
+    assert list(rabin_chunks(split(DATA, 777), **options)) == chunks  # type: ignore
+    # Inserted byte changes only nearby chunks
+    shifted = list(rabin_chunks([b"x" + DATA], **options))  # type: ignore
+    assert len(set(shifted) & set(chunks)) >= len(chunks) - 3
+
+
+def test_parallel_hashing() -> None:
+    serial = import_chunks(fixed_size_chunks([DATA]))
+    with ThreadPoolExecutor(4) as executor:
+        assert import_chunks(fixed_size_chunks([DATA]), executor=executor) == serial
+    assert import_chunks(fixed_size_chunks([DATA]), 1) != serial
+
+
+def test_car(tmp_path: Path) -> None:
+    path = tmp_path / "file"
+    path.write_bytes(DATA)
+    root, parts = file_car(str(path))
+    assert root == file_cid(str(path))
+    car = b"".join(parts)
+
+    length, offset = read_varint(car, 0)
+    header = car[offset : offset + length]
+    offset += length
+    blocks = 0
+    while offset < len(car):
+        length, offset = read_varint(car, offset)
+        section = car[offset : offset + length]
+        offset += length
+        # CIDv0 is a sha2-256 multihash of block
+        cid, data = section[:34], section[34:]
+        assert cid[2:] == hashlib.sha256(data).digest()
+        blocks += 1
+    assert blocks == 4 + 1
+    assert cid_to_str(header[header.index(b"\xd8\x2a") + 5 :][:34]) == root
+
+    chunks = list(rabin_chunks([DATA]))
+    car_root = dag_root(chunks, 1)
+    assert b"".join(iter_car(car_root, chunks, 1)).count(car_root) == 2
+
+
+@pytest.mark.asyncio
+async def test_verify_and_car_upload(tmp_path: Path) -> None:
+    path = tmp_path / "file"
+    path.write_bytes(DATA)
+    cluster = FakeCluster()
+    await cluster.start()
+    try:
+        async with IPFSClient(cluster.url) as ipfs:
+            cid = await ipfs.add_file(str(path), "application/octet-stream", verify=True)
+            assert cid == file_cid(str(path))
+            root, car = file_car(str(path), rabin_chunks)
+            assert await ipfs.add_car(car, root) == root
+            with pytest.raises(IPFSException):
+                await ipfs.add_car(file_car(str(path))[1], root)
+    finally:
+        await cluster.stop()
+
+
+def test_throughput(capsys: pytest.CaptureFixture[str]) -> None:
+    data = os.urandom(32 * 1024 * 1024)
+    results = {}
+    for name, run in [
+        ("fixed", lambda: import_chunks(fixed_size_chunks([data]))),
+        ("fixed, 4 threads", lambda: import_chunks(fixed_size_chunks([data]), executor=pool)),
+        ("rabin", lambda: import_chunks(rabin_chunks([data[: 1024 * 1024]]))),
+    ]:
+        with ThreadPoolExecutor(4) as pool:
+            size = 1 if name == "rabin" else 32
+            started = perf_counter()
+            run()
+            results[name] = size / (perf_counter() - started)
+    with capsys.disabled():
+        print("\n" + ", ".join(f"{name}: {speed:.1f} MB/s" for name, speed in results.items()))
@@ -0,0 +1,171 @@
+import asyncio
+import os
+import sqlite3
+import time
+from pathlib import Path
+from typing import AsyncIterator
+from uuid import uuid4
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import app
+from app.database import get_engine, get_engine_session
+from app.ipfs import IPFSClient
+from app.ipfs.unixfs import bytes_cid
+from app.models import Pin, PinStatus, UserToken
+from app.settings import get_settings
+from app.uploads import Job, JobStatus, UploadQueue
+from app.utils import int_time
+from tests.utils import FakeCluster, get_user
+
+
+async def body(data: bytes) -> AsyncIterator[bytes]:
+    yield data
+
+
+async def wait_for(queue: UploadQueue, job_id: str, status: JobStatus) -> None:
+    for _ in range(100):
+        job = await queue.get(job_id)
+        if job is not None and job.status == status:
+            return
+        await asyncio.sleep(0.05)
+    raise AssertionError(f"Job {job_id} is {job}")
+
+
+@pytest.mark.asyncio
+async def test_queue(tmp_path: Path) -> None:
+    cluster = FakeCluster()
+    await cluster.start()
+    owner = uuid4()
+    try:
+        async with IPFSClient(cluster.url) as ipfs:
+            queue = UploadQueue(
+                ipfs, get_engine(), str(tmp_path), workers=2, max_attempts=2, retry_delay=0
+            )
+            await queue.start()
+            job = await queue.enqueue(body(b"test"), "text/plain", owner, filename="a.txt")
+            assert job.cid == bytes_cid(b"test")
+            await wait_for(queue, job.id, JobStatus.done)
+            assert cluster.added[-1]["cid"] == job.cid
+            assert not (tmp_path / job.id).exists()
+
+            cluster.fail = True
+            job = await queue.enqueue(body(b"failing"), "text/plain", owner)
+            await wait_for(queue, job.id, JobStatus.failed)
+            failed = await queue.get(job.id)
+            assert failed is not None and failed.attempts == 2 and failed.error
+            cluster.fail = False
+            await queue.stop()
+    finally:
+        await cluster.stop()
+
+
+@pytest.mark.asyncio
+async def test_crash_recovery(tmp_path: Path) -> None:
+    cluster = FakeCluster()
+    await cluster.start()
+    try:
+        async with IPFSClient(cluster.url) as ipfs:
+            queue = UploadQueue(ipfs, get_engine(), str(tmp_path), workers=0)
+            await queue.start()
+            job = await queue.enqueue(body(b"crash"), "text/plain", uuid4())
+            await queue.stop()
+            # Job was claimed by a process which died, and a restarted process got its PID
+            queue._execute(
+                "UPDATE job SET status = ?, pid = ?, claimed_by = ?, lease_until = ? WHERE id = ?",
+                JobStatus.uploading,
+                os.getpid(),
+                uuid4().hex,
+                int_time() - 1,
+                job.id,
+            )
+            stale = tmp_path / f"{uuid4().hex}.part"
+            stale.write_bytes(b"partial")
+            os.utime(stale, (time.time() - 120, time.time() - 120))
+            # Body still being received by another process
+            (tmp_path / f"{uuid4().hex}.part").write_bytes(b"partial")
+            # Process died between moving the body into place and inserting its job
+            orphan = tmp_path / uuid4().hex
+            orphan.write_bytes(b"orphan")
+            os.utime(orphan, (time.time() - 120, time.time() - 120))
+
+            queue = UploadQueue(ipfs, get_engine(), str(tmp_path))
+            await queue.start()
+            await wait_for(queue, job.id, JobStatus.done)
+            assert cluster.added[-1]["cid"] == job.cid
+            assert len(list(tmp_path.glob("*.part"))) == 1 and not stale.exists()
+            assert not orphan.exists() and not (tmp_path / job.id).exists()
+            await queue.stop()
+    finally:
+        await cluster.stop()
+
+
+@pytest.mark.asyncio
+async def test_worker_survives_errors(tmp_path: Path) -> None:
+    cluster = FakeCluster()
+    await cluster.start()
+    try:
+        async with IPFSClient(cluster.url) as ipfs:
+            queue = UploadQueue(ipfs, get_engine(), str(tmp_path), workers=1, poll_interval=0.05)
+            claim = queue._claim
+            failures = iter([sqlite3.OperationalError("database is locked")])
+
+            def flaky_claim() -> Job | None:
+                for error in failures:
+                    raise error
+                return claim()
+
+            queue._claim = flaky_claim  # type: ignore[method-assign]
+            await queue.start()
+            job = await queue.enqueue(body(b"survives"), "text/plain", uuid4())
+            await wait_for(queue, job.id, JobStatus.done)
+            await queue.stop()
+    finally:
+        await cluster.stop()
+
+
+def test_background_upload(tmp_path: Path) -> None:
+    cluster = FakeCluster()
+    cluster.start_in_thread()
+    settings = get_settings()
+    ipfs_url, spool = settings.ipfs_url, settings.upload_spool
+    settings.ipfs_url, settings.upload_spool = cluster.url, str(tmp_path)
+    try:
+        user, other = get_user(uuid4()), get_user(uuid4())
+        uuid, other_uuid = user.uuid, other.uuid
+        with get_engine_session() as db:
+            db.add(user)
+            db.add(other)
+            db.commit()
+        headers = {"Authorization": f"Bearer {UserToken(user=uuid).issue_access_token()}"}
+        data = os.urandom(1024)
+
+        with TestClient(app) as client:
+            response = client.post("/files/upload?background=true", data=data, headers=headers)
+            assert response.status_code == 202
+            job = response.json()["job"]
+            assert response.json()["cid"] == bytes_cid(data)
+            with get_engine_session() as db:
+                pin = db.get(Pin, (bytes_cid(data), uuid))
+                assert pin is not None and pin.size == len(data)
+
+            for _ in range(100):
+                response = client.get(f"/files/jobs/{job}", headers=headers)
+                assert response.status_code == 200
+                if response.json()["status"] == "done":
+                    break
+                time.sleep(0.05)
+            assert response.json()["status"] == "done"
+            assert cluster.added[-1]["cid"] == bytes_cid(data)
+            with get_engine_session() as db:
+                pin = db.get(Pin, (bytes_cid(data), uuid))
+                assert pin is not None and pin.status == PinStatus.pinning
+
+            other_headers = {
+                "Authorization": f"Bearer {UserToken(user=other_uuid).issue_access_token()}"
+            }
+            assert client.get(f"/files/jobs/{job}", headers=other_headers).status_code == 404
+    finally:
+        settings.ipfs_url, settings.upload_spool = ipfs_url, spool
+        cluster.stop_thread()
@@ -0,0 +1,55 @@
+import json
+from uuid import uuid4
+
+from fastapi.testclient import TestClient
+
+from app import app
+from app.database import get_engine, get_engine_session
+from app.exporter import iter_users
+from app.models import UserToken
+from app.settings import get_settings
+from tests.utils import get_user
+
+client = TestClient(app)
+
+
+def test_iter_users_keyset_pages() -> None:
+    users = [get_user(uuid4()) for _ in range(5)]
+    created_at = 1_000_000 + uuid4().int % 1_000_000
+    for user in users:
+        user.created_at = created_at
+        user.verifed = True
+    uuids = sorted(user.uuid for user in users)
+    with get_engine_session() as db:
+        db.add_all(users)
+        db.commit()
+    after = (created_at - 1, uuid4())
+    rows = [
+        row
+        for row in iter_users(get_engine(), verifed=True, after=after, page_size=2)
+        if row.created_at == created_at
+    ]
+    assert [row.uuid for row in rows] == uuids
+    assert "password" not in rows[0]._fields
+
+
+def test_export_users_requires_admin() -> None:
+    admin = get_user(uuid4())
+    admin_uuid = admin.uuid
+    token = UserToken(user=admin.uuid).issue_access_token()
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.get("/users/export", headers=headers)
+    assert response.status_code == 403
+
+    get_settings().admins.append(admin.uuid)
+    try:
+        with get_engine_session() as db:
+            db.add(admin)
+            db.commit()
+        response = client.get("/users/export", params={"format": "ndjson"}, headers=headers)
+        assert response.status_code == 200
+        exported = [json.loads(line) for line in response.text.splitlines()]
+        assert str(admin_uuid) in [user["uuid"] for user in exported]
+        assert all("password" not in user for user in exported)
+    finally:
+        get_settings().admins.remove(admin_uuid)
@@ -1,8 +1,180 @@
+import asyncio
+import json
+import socket
+from datetime import datetime, timezone
+from threading import Thread
+from typing import Any
+from urllib.parse import unquote
 from uuid import UUID, uuid4
 
+from aiohttp import BodyPartReader, web
+
+from app.ipfs.unixfs import CHUNK_SIZE, FileImporter, bytes_cid, cid_to_str
 from app.models.user import User
 
 
 def get_user(uuid: UUID = uuid4()) -> User:
     user = User(email=uuid.hex + "@bar.com", nickname=uuid.hex[:6], uuid=uuid, password=uuid.hex)
     return user
+
+
+def get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port: int = sock.getsockname()[1]
+        return port
+
+
+class FakeCluster:
+    """Minimal IPFS cluster API, reads uploads chunk by chunk without storing them."""
+
+    def __init__(self) -> None:
+        self.port = get_free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.added: list[dict[str, Any]] = []
+        self.removed: list[str] = []
+        self.pinned: list[str] = []
+        self.recovered: list[str] = []
+        self.pins: dict[str, dict[str, Any]] = {}
+        self.runner: web.AppRunner | None = None
+        # Injected latency and failures
+        self.delay = 0.0
+        self.fail = False
+        self.requests = 0
+        self.loop: asyncio.AbstractEventLoop | None = None
+
+    async def add(self, request: web.Request) -> web.StreamResponse:
+        """Compute real CIDs with default parameters, for CAR return root from header.
+
+        With `wrap-with-directory` every part is reported in streamed output, then
+        the wrapping directory with CID of the part names.
+        """
+        reader = await request.multipart()
+        result: dict[str, Any] = {}
+        outputs: list[dict[str, Any]] = []
+        while (part := await reader.next()) is not None:
+            assert isinstance(part, BodyPartReader)
+            importer = FileImporter()
+            buffer = bytearray()
+            head = b""
+            size = 0
+            while chunk := await part.read_chunk():
+                head = (head + chunk)[:128]
+                buffer += chunk
+                size += len(chunk)
+                while len(buffer) >= CHUNK_SIZE:
+                    importer.add(bytes(buffer[:CHUNK_SIZE]))
+                    del buffer[:CHUNK_SIZE]
+            if buffer:
+                importer.add(bytes(buffer))
+            cid = importer.finish()
+            if request.query.get("format") == "car":
+                # Header is {"roots": [CID(root)], ...}, CID is tag 42 with bytes
+                start = head.index(b"\xd8\x2a\x58") + 5
+                end = start + head[start - 2] - 1
+                cid = cid_to_str(head[start:end])
+            result = {"name": unquote(part.filename or ""), "cid": cid, "size": size}
+            self.added.append(result)
+            outputs.append(result)
+        if request.query.get("wrap-with-directory") != "true":
+            self.set_pin(result["cid"], request.query.get("name", ""))
+            return web.json_response(result)
+        names = json.dumps([output["name"] for output in outputs]).encode()
+        outputs.append({"name": "", "cid": bytes_cid(names), "size": 0})
+        self.set_pin(outputs[-1]["cid"], request.query.get("name", ""))
+        response = web.StreamResponse(headers={"Content-Type": "application/json"})
+        await response.prepare(request)
+        for output in outputs:
+            line = json.dumps(output).encode() + b"\n"
+            await response.write(line[:10])
+            await response.write(line[10:])
+        await response.write_eof()
+        return response
+
+    def set_pin(self, cid: str, name: str = "", status: str = "pinned", created: str = "") -> None:
+        created = created or datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+        self.pins[cid] = {
+            "cid": cid,
+            "name": name,
+            "created": created,
+            "peer_map": {"peer": {"status": status, "timestamp": created}},
+        }
+
+    async def list_pins(self, request: web.Request) -> web.StreamResponse:
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+        for pin in list(self.pins.values()):
+            line = json.dumps(pin).encode() + b"\n"
+            # Split lines across chunks, as a real network would
+            await response.write(line[:10])
+            await response.write(line[10:])
+        await response.write_eof()
+        return response
+
+    async def pin(self, request: web.Request) -> web.Response:
+        cid = request.match_info["cid"]
+        self.pinned.append(cid)
+        self.set_pin(cid, request.query.get("name", ""))
+        return web.json_response(self.pins[cid])
+
+    async def recover(self, request: web.Request) -> web.Response:
+        cid = request.match_info["cid"]
+        self.recovered.append(cid)
+        self.set_pin(cid, self.pins[cid]["name"])
+        return web.json_response(self.pins[cid])
+
+    async def remove(self, request: web.Request) -> web.Response:
+        cid = request.match_info["cid"]
+        self.removed.append(cid)
+        self.pins.pop(cid, None)
+        return web.json_response({"cid": cid})
+
+    async def status(self, request: web.Request) -> web.Response:
+        cid = request.match_info["cid"]
+        if cid not in self.pins:
+            return web.json_response({"cid": cid, "peer_map": {}})
+        return web.json_response(self.pins[cid])
+
+    async def peer_id(self, request: web.Request) -> web.Response:
+        return web.json_response({"id": f"peer-{self.port}"})
+
+    @web.middleware
+    async def inject(self, request: web.Request, handler: Any) -> web.StreamResponse:
+        # Health checks are not affected, use a closed port for a dead peer
+        if request.path == "/id":
+            response: web.StreamResponse = await handler(request)
+            return response
+        self.requests += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            return web.json_response({"message": "injected failure"}, status=500)
+        response = await handler(request)
+        return response
+
+    async def start(self) -> None:
+        app = web.Application(middlewares=[self.inject])
+        app.router.add_get("/id", self.peer_id)
+        app.router.add_post("/add", self.add)
+        app.router.add_delete("/pins/ipfs/{cid}", self.remove)
+        app.router.add_get("/pins", self.list_pins)
+        app.router.add_post("/pins/ipfs/{cid}", self.pin)
+        app.router.add_post("/pins/{cid}/recover", self.recover)
+        app.router.add_get("/pins/{cid}", self.status)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, "127.0.0.1", self.port).start()
+
+    async def stop(self) -> None:
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+    def start_in_thread(self) -> None:
+        """Run in a separate event loop, for use with synchronous `TestClient`."""
+        self.loop = asyncio.new_event_loop()
+        Thread(target=self.loop.run_forever, daemon=True).start()
+        asyncio.run_coroutine_threadsafe(self.start(), self.loop).result()
+
+    def stop_thread(self) -> None:
+        assert self.loop is not None
+        asyncio.run_coroutine_threadsafe(self.stop(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)